@@ -0,0 +1,81 @@
+from typing import Any, Dict
+
+import orjson
+import ormsgpack
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langgraph.checkpoint.redis.jsonplus_redis import JsonPlusRedisSerializer
+
+MESSAGE_TYPES = {"human": HumanMessage, "ai": AIMessage, "system": SystemMessage}
+# Marks a compact message inside checkpoint JSON; it replaces the "type" key
+MESSAGE_MARKER = "__msg__"
+
+
+def message_to_dict(message: BaseMessage) -> Dict[str, Any]:
+    """Compact form of a chat message: only the fields this app sets"""
+    entry = {"type": message.type, "content": message.content, "id": message.id}
+    timestamp = getattr(message, "timestamp", None)
+    if timestamp is not None:
+        entry["timestamp"] = timestamp
+    if message.response_metadata:
+        entry["response_metadata"] = message.response_metadata
+    if message.additional_kwargs:
+        entry["additional_kwargs"] = message.additional_kwargs
+    if message.name:
+        entry["name"] = message.name
+    return entry
+
+
+def message_from_dict(entry: Dict[str, Any]) -> BaseMessage:
+    entry = dict(entry)
+    return MESSAGE_TYPES[entry.pop("type")](**entry)
+
+
+def pack_message(message: BaseMessage) -> bytes:
+    """Message log entry: msgpack of the compact form"""
+    return ormsgpack.packb(message_to_dict(message), default=str)
+
+
+def unpack_entry(raw: bytes) -> Dict[str, Any]:
+    """Compact form of a log entry, msgpack or (written before msgpack) JSON"""
+    # A JSON entry is an object, so it starts with "{"; a msgpack map never does (0x80-0x8f, 0xde, 0xdf)
+    if raw[:1] == b"{":
+        return orjson.loads(raw)
+    return ormsgpack.unpackb(raw)
+
+
+def unpack_message(raw: bytes) -> BaseMessage:
+    return message_from_dict(unpack_entry(raw))
+
+
+class CompactSerializer(JsonPlusRedisSerializer):
+    """Checkpoint serializer that stores chat messages in their compact form.
+
+    The Redis saver keeps checkpoints and writes as RedisJSON documents, so
+    the output must stay JSON. The stock serializer cannot orjson-encode a
+    BaseMessage and falls back to LangChain's constructor format, which is
+    slower, larger and drops attributes such as `timestamp`. Plain human,
+    AI and system messages are written compactly instead; anything else
+    (tool calls, Send, ...) still takes the stock path, and checkpoints
+    written in the constructor format still load.
+    """
+
+    @staticmethod
+    def _compact(obj: Any) -> Any:
+        if type(obj) in (HumanMessage, AIMessage, SystemMessage) and not getattr(obj, "tool_calls", None):
+            entry = message_to_dict(obj)
+            entry[MESSAGE_MARKER] = entry.pop("type")
+            return entry
+        raise TypeError
+
+    def dumps(self, obj: Any) -> bytes:
+        try:
+            return orjson.dumps(obj, default=self._compact)
+        except TypeError:
+            return super().dumps(obj)
+
+    def _revive_if_needed(self, obj: Any) -> Any:
+        if isinstance(obj, dict) and MESSAGE_MARKER in obj:
+            entry = dict(obj)
+            entry["type"] = entry.pop(MESSAGE_MARKER)
+            return message_from_dict(entry)
+        return super()._revive_if_needed(obj)
@@ -0,0 +1,388 @@
+import asyncio
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import orjson
+import redis.asyncio as aioredis
+
+from backend.thread_lock import RedisLock, try_lock
+
+logger = logging.getLogger(__name__)
+
+# Redis list of queued job ids (LPUSH / BLMOVE) and one JSON document per job
+QUEUE_KEY = "ingest:queue"
+# Jobs taken by the consumer and not finished yet; requeued when another process takes over the lease
+PROCESSING_KEY = "ingest:processing"
+JOB_KEY = "ingest:job:{job_id}"
+JOB_TTL_SECONDS = 7 * 24 * 3600
+# Held by the one process that runs jobs: the manifest and the BM25 / local index files have a single writer
+CONSUMER_KEY = "ingest:consumer"
+CONSUMER_TTL_MS = 15000
+# Published by the consumer after each job; the other workers then reload the BM25 index and manifest
+INDEXED_CHANNEL = "ingest:indexed"
+
+FINISHED = ("done", "failed")
+
+
+@dataclass
+class IngestJob:
+    job_id: str
+    paths: List[str]
+    payload: Dict[str, Any] = field(default_factory=dict)
+    status: str = "queued"  # queued -> running -> (retrying ->) done | failed
+    attempts: int = 0
+    progress: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    created_at: float = field(default_factory=lambda: datetime.now().timestamp())
+    updated_at: float = field(default_factory=lambda: datetime.now().timestamp())
+    version: int = 0  # bumped on every save; event streams emit on change
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+
+class MemoryJobBackend:
+    """In-process queue and job table, for running without Redis"""
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.jobs: Dict[str, IngestJob] = {}
+        self.changed = asyncio.Condition()
+
+    async def push(self, job_id: str) -> None:
+        await self.queue.put(job_id)
+
+    async def pop(self, timeout: float) -> Optional[str]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def ack(self, job_id: str) -> None:
+        """Nothing to do: jobs of a process that dies are gone with it"""
+
+    async def save(self, job: IngestJob) -> None:
+        self.jobs[job.job_id] = job
+        async with self.changed:
+            self.changed.notify_all()
+
+    async def load(self, job_id: str) -> Optional[IngestJob]:
+        return self.jobs.get(job_id)
+
+    async def wait(self, job_id: str, version: int, timeout: float) -> None:
+        async with self.changed:
+            try:
+                await asyncio.wait_for(
+                    self.changed.wait_for(lambda: self.jobs[job_id].version != version), timeout
+                )
+            except asyncio.TimeoutError:
+                pass
+
+
+class RedisJobBackend:
+    """Redis list as the queue and a key per job, so any API worker can report on any job"""
+
+    def __init__(self, redis_client: aioredis.Redis, poll_interval: float = 0.25):
+        self.redis = redis_client
+        self.poll_interval = poll_interval
+
+    async def push(self, job_id: str) -> None:
+        await self.redis.lpush(QUEUE_KEY, job_id)
+
+    async def pop(self, timeout: float) -> Optional[str]:
+        """Next job id, moved to the processing list until `ack`, so a consumer that dies does not lose it"""
+        job_id = await self.redis.blmove(QUEUE_KEY, PROCESSING_KEY, max(1, int(timeout)), "RIGHT", "LEFT")
+        return job_id.decode() if isinstance(job_id, bytes) else job_id
+
+    async def ack(self, job_id: str) -> None:
+        await self.redis.lrem(PROCESSING_KEY, 1, job_id)
+
+    async def recover(self) -> int:
+        """Requeue, first in line, the jobs a previous consumer took and never finished"""
+        count = 0
+        while await self.redis.lmove(PROCESSING_KEY, QUEUE_KEY, "LEFT", "RIGHT") is not None:
+            count += 1
+        return count
+
+    async def notify_indexed(self) -> None:
+        await self.redis.publish(INDEXED_CHANNEL, os.getpid())
+
+    async def indexed(self) -> AsyncIterator[None]:
+        """Yield once subscribed, then on every notification from the consumer"""
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(INDEXED_CHANNEL)
+        try:
+            yield  # anything saved before the subscription took effect
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=CONSUMER_TTL_MS / 1000)
+                if message is not None:
+                    yield
+        finally:
+            await pubsub.aclose()
+
+    async def save(self, job: IngestJob) -> None:
+        key = JOB_KEY.format(job_id=job.job_id)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.set(key, orjson.dumps(asdict(job)))
+        pipe.expire(key, JOB_TTL_SECONDS)
+        await pipe.execute()
+
+    async def load(self, job_id: str) -> Optional[IngestJob]:
+        data = await self.redis.get(JOB_KEY.format(job_id=job_id))
+        return IngestJob(**orjson.loads(data)) if data else None
+
+    async def wait(self, job_id: str, version: int, timeout: float) -> None:
+        # Progress is written at most every progress_interval_ms, so polling is cheap
+        await asyncio.sleep(min(timeout, self.poll_interval))
+
+
+class IngestQueue:
+    """Background ingestion jobs with ids, retries and progress.
+
+    Jobs are queued in Redis (or in process when Redis is unavailable) and run
+    by `workers` asyncio tasks; each job's `pipeline.ingest` call runs on a
+    dedicated thread pool, so parsing and embedding never block the event
+    loop. The pipeline bounds how many files are parsed at once across jobs,
+    and a file named by two jobs is never ingested by both at the same time.
+    A failed job is retried up to `max_attempts` times with exponential
+    backoff; files that failed to parse are retried on their own.
+
+    With the Redis queue and several API workers, jobs are only run by the
+    worker holding the consumer lease: the pipeline keeps the manifest and
+    BM25 index in memory and rewrites their files, so two writers would
+    lose each other's updates. The others submit jobs and report on them,
+    and reload the BM25 index when the consumer announces a finished job
+    (off the query path). A job stays on a
+    processing list until it is done, failed or queued for retry; a process
+    that takes over the lease requeues whatever is left there, so jobs of a
+    consumer that died are run again rather than left "running".
+    """
+
+    def __init__(
+        self,
+        pipeline,
+        backend,
+        workers: int = 2,
+        max_attempts: int = 3,
+        retry_backoff_seconds: float = 2.0,
+        progress_interval_ms: float = 250,
+    ):
+        self.pipeline = pipeline
+        self.backend = backend
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.progress_interval_ms = progress_interval_ms
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self._file_locks: Dict[str, asyncio.Lock] = {}
+        self._save_locks: Dict[str, asyncio.Lock] = {}  # keeps each job's writes in order
+        self._tasks = set()
+        self._lease: Optional[RedisLock] = None
+
+    @classmethod
+    async def from_config(cls, config: dict, pipeline, redis_client: Optional[aioredis.Redis] = None) -> "IngestQueue":
+        settings = config.get("ingest", {})
+        backend_name = settings.get("backend", "auto")
+        backend = MemoryJobBackend()
+        if backend_name != "memory" and redis_client is not None:
+            try:
+                await redis_client.ping()
+                backend = RedisJobBackend(redis_client)
+                if config.get("rag", {}).get("vector_store") == "local":
+                    logger.warning(
+                        "rag.vector_store is \"local\": with several workers, only the one running "
+                        "ingestion jobs sees new documents; use \"qdrant\""
+                    )
+            except Exception as e:
+                if backend_name == "redis":
+                    raise
+                logger.warning("Redis unavailable (%s); using the in-process ingestion queue", str(e))
+        return cls(
+            pipeline,
+            backend,
+            workers=settings.get("workers", 2),
+            max_attempts=settings.get("max_attempts", 3),
+            retry_backoff_seconds=settings.get("retry_backoff_seconds", 2.0),
+            progress_interval_ms=settings.get("progress_interval_ms", 250),
+        )
+
+    # ---------- producer side ----------
+    async def submit(self, paths: List[str], payload: Optional[Dict[str, Any]] = None) -> IngestJob:
+        job = IngestJob(job_id=uuid.uuid4().hex, paths=list(paths), payload=payload or {})
+        await self.backend.save(job)
+        await self.backend.push(job.job_id)
+        return job
+
+    async def get(self, job_id: str) -> Optional[IngestJob]:
+        return await self.backend.load(job_id)
+
+    async def events(self, job_id: str, heartbeat: float = 15.0) -> AsyncIterator[IngestJob]:
+        """Yield the job whenever it changes, until it is done or failed"""
+        version = -1
+        while True:
+            job = await self.backend.load(job_id)
+            if job is None:
+                return
+            if job.version != version:
+                version = job.version
+                yield job
+            if job.finished:
+                return
+            await self.backend.wait(job_id, version, heartbeat)
+
+    # ---------- worker side ----------
+    def start(self) -> None:
+        coroutines = [self._worker() for _ in range(self.workers)]
+        if isinstance(self.backend, RedisJobBackend):
+            coroutines += [self._hold_lease(), self._follow_index()]
+        for index, coroutine in enumerate(coroutines):
+            task = asyncio.create_task(coroutine, name=f"ingest-worker-{index}")
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def stop(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._lease is not None:
+            await self._lease.release()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def consuming(self) -> bool:
+        """Whether this process runs jobs (always, with the in-process queue)"""
+        if not isinstance(self.backend, RedisJobBackend):
+            return True
+        return self._lease is not None and not self._lease.lost
+
+    async def _hold_lease(self) -> None:
+        """Take the consumer lease whenever it is free (its holder stopped or died)"""
+        while True:
+            if not self.consuming:
+                try:
+                    lease = await try_lock(self.backend.redis, CONSUMER_KEY, CONSUMER_TTL_MS)
+                    if lease is not None:
+                        # The previous consumer may have indexed documents since this process loaded them
+                        await asyncio.to_thread(self.pipeline.reload)
+                        recovered = await self.backend.recover()
+                        if recovered:
+                            logger.warning("Requeued %d ingestion job(s) left unfinished by the previous consumer", recovered)
+                        self._lease = lease
+                        logger.info("This process now runs ingestion jobs (pid %d)", os.getpid())
+                except Exception as e:
+                    logger.error("Error taking the ingest consumer lease: %s", str(e))
+            await asyncio.sleep(CONSUMER_TTL_MS / 3000)
+
+    async def _follow_index(self) -> None:
+        """Reload what the consumer indexed whenever it announces a job, while this process is not the consumer"""
+        while True:
+            try:
+                async for _ in self.backend.indexed():
+                    if not self.consuming:
+                        await asyncio.to_thread(self.pipeline.reload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Error following the ingest consumer: %s", str(e))
+                await asyncio.sleep(1)
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                if not self.consuming:
+                    await asyncio.sleep(1)
+                    continue
+                job_id = await self.backend.pop(timeout=5)
+                if job_id is None:
+                    continue
+                job = await self.backend.load(job_id)
+                if job is not None and not job.finished:
+                    await self._run(job)
+                if job is None or job.status != "retrying":
+                    await self.backend.ack(job_id)  # a retrying job is acked once it is queued again
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Ingestion worker error: %s", str(e))
+                await asyncio.sleep(1)
+
+    async def _save(self, job: IngestJob, **changes) -> None:
+        async with self._save_locks.setdefault(job.job_id, asyncio.Lock()):
+            for name, value in changes.items():
+                setattr(job, name, value)
+            job.updated_at = datetime.now().timestamp()
+            job.version += 1
+            await self.backend.save(job)
+
+    async def _save_progress(self, job: IngestJob, stats: Dict[str, Any]) -> None:
+        if job.status == "running":
+            await self._save(job, progress=stats)
+
+    def _progress_callback(self, job: IngestJob):
+        """Thread-safe callback for `pipeline.ingest`, throttled to progress_interval_ms"""
+        loop = asyncio.get_running_loop()
+        last_sent = [0.0]
+
+        def report(stats: Dict[str, Any]) -> None:
+            now = loop.time()
+            if now - last_sent[0] < self.progress_interval_ms / 1000 and "seconds" not in stats:
+                return
+            last_sent[0] = now
+            loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self._save_progress(job, stats)))
+
+        return report
+
+    async def _run(self, job: IngestJob) -> None:
+        # Same file in two jobs: the second waits (locks taken in sorted order)
+        locks = [self._file_locks.setdefault(os.path.normpath(p), asyncio.Lock()) for p in sorted(set(job.paths))]
+        for lock in locks:
+            await lock.acquire()
+        stats = None
+        try:
+            await self._save(job, status="running", attempts=job.attempts + 1, error=None)
+            loop = asyncio.get_running_loop()
+            stats = await loop.run_in_executor(
+                self._executor, self.pipeline.ingest, job.paths, job.payload, self._progress_callback(job)
+            )
+            if stats["failed"]:
+                raise RuntimeError(f"Failed to parse {len(stats['failed'])} file(s): {', '.join(stats['failed'])}")
+            await self._save(job, status="done", progress=stats)
+            logger.info("Ingestion job %s finished: %s", job.job_id, stats)
+
+        except Exception as e:
+            if job.attempts < self.max_attempts:
+                delay = self.retry_backoff_seconds * 2 ** (job.attempts - 1)
+                if stats is not None:
+                    job.paths = stats["failed"]  # everything else is already indexed
+                await self._save(job, status="retrying", error=str(e))
+                logger.warning("Ingestion job %s failed (attempt %d), retrying in %.1fs: %s",
+                               job.job_id, job.attempts, delay, str(e))
+                self._schedule_retry(job.job_id, delay)
+            else:
+                await self._save(job, status="failed", error=str(e))
+                logger.error("Ingestion job %s failed: %s", job.job_id, str(e))
+        finally:
+            for lock in locks:
+                lock.release()
+            self._save_locks.pop(job.job_id, None)
+            if isinstance(self.backend, RedisJobBackend):
+                try:
+                    await self.backend.notify_indexed()
+                except Exception as e:
+                    logger.error("Error announcing ingestion job %s: %s", job.job_id, str(e))
+
+    def _schedule_retry(self, job_id: str, delay: float) -> None:
+        async def requeue():
+            await asyncio.sleep(delay)
+            await self.backend.push(job_id)
+            await self.backend.ack(job_id)
+
+        task = asyncio.create_task(requeue())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
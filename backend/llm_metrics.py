@@ -0,0 +1,84 @@
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from backend.rag.embeddings import Histogram, LATENCY_MS_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+TURN_MS_BUCKETS = LATENCY_MS_BUCKETS + (5000, 10000, 30000, 60000)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+
+class LLMMetrics:
+    """Per-turn prompt-eval vs. generation timings, read from Ollama's response metadata.
+
+    Ollama reports `prompt_eval_count` as the prompt tokens it actually had
+    to evaluate; tokens served from the runner's prefix cache are not
+    counted, so a warm thread shows a small count next to a large prompt.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.model_loads = 0  # turns that paid for loading the model (keep_alive expired or options changed)
+        self.prompt_eval_ms = Histogram(TURN_MS_BUCKETS)
+        self.eval_ms = Histogram(TURN_MS_BUCKETS)
+        self.prompt_eval_tokens = Histogram(TOKEN_BUCKETS)
+        self.eval_tokens = Histogram(TOKEN_BUCKETS)
+        self.prompt_tokens_estimate = 0
+        self.prompt_tokens_evaluated = 0
+
+    def observe(
+        self, response_metadata: Optional[Dict[str, Any]], prompt_tokens_estimate: int = 0, thread_id: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Record one turn; returns its timings, or None when the response carries no Ollama metadata"""
+        metadata = response_metadata or {}
+        if "prompt_eval_duration" not in metadata and "eval_duration" not in metadata:
+            return None
+
+        timings = {
+            "prompt_eval_ms": round((metadata.get("prompt_eval_duration") or 0) / 1e6, 1),
+            "eval_ms": round((metadata.get("eval_duration") or 0) / 1e6, 1),
+            "load_ms": round((metadata.get("load_duration") or 0) / 1e6, 1),
+            "total_ms": round((metadata.get("total_duration") or 0) / 1e6, 1),
+            "prompt_eval_tokens": metadata.get("prompt_eval_count") or 0,
+            "eval_tokens": metadata.get("eval_count") or 0,
+            "prompt_tokens_estimate": prompt_tokens_estimate,
+        }
+        with self._lock:
+            self.turns += 1
+            if timings["load_ms"] >= 100:
+                self.model_loads += 1
+            self.prompt_eval_ms.observe(timings["prompt_eval_ms"])
+            self.eval_ms.observe(timings["eval_ms"])
+            self.prompt_eval_tokens.observe(timings["prompt_eval_tokens"])
+            self.eval_tokens.observe(timings["eval_tokens"])
+            self.prompt_tokens_estimate += prompt_tokens_estimate
+            self.prompt_tokens_evaluated += timings["prompt_eval_tokens"]
+
+        logger.info(
+            "LLM turn%s: prompt_eval %d tokens in %.0fms (of ~%d prompt tokens), eval %d tokens in %.0fms, load %.0fms",
+            f" for thread {thread_id}" if thread_id else "",
+            timings["prompt_eval_tokens"], timings["prompt_eval_ms"], prompt_tokens_estimate,
+            timings["eval_tokens"], timings["eval_ms"], timings["load_ms"],
+        )
+        return timings
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            reused = 0.0
+            if self.prompt_tokens_estimate:
+                # Approximate: the estimate uses chars_per_token, not the model's tokenizer
+                reused = max(0.0, 1 - self.prompt_tokens_evaluated / self.prompt_tokens_estimate)
+            return {
+                "turns": self.turns,
+                "model_loads": self.model_loads,
+                "prompt_tokens_estimate": self.prompt_tokens_estimate,
+                "prompt_tokens_evaluated": self.prompt_tokens_evaluated,
+                "prefix_reuse_ratio": round(reused, 3),
+                "prompt_eval_ms": self.prompt_eval_ms.snapshot(),
+                "eval_ms": self.eval_ms.snapshot(),
+                "prompt_eval_tokens": self.prompt_eval_tokens.snapshot(),
+                "eval_tokens": self.eval_tokens.snapshot(),
+            }
@@ -0,0 +1,309 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+
+import httpx
+import xxhash
+from langchain_core.messages import BaseMessage, BaseMessageChunk, message_chunk_to_message
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import ensure_config
+
+logger = logging.getLogger(__name__)
+
+
+class NoEndpointAvailable(RuntimeError):
+    """Every endpoint was ejected or at its concurrency cap for acquire_timeout_seconds"""
+
+
+class Endpoint:
+    """One Ollama instance serving the pool's model"""
+
+    def __init__(self, url: str, llm: Runnable, max_concurrency: int = 4):
+        self.url = url.rstrip("/")
+        self.llm = llm
+        self.max_concurrency = max_concurrency
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.cooldown = 0.0
+        self.last_error: Optional[str] = None
+
+    def ejected(self, now: float) -> bool:
+        return self.ejected_until > now
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": not self.ejected(now),
+            "outstanding": self.outstanding,
+            "max_concurrency": self.max_concurrency,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejections": self.ejections,
+            "ejected_for_seconds": round(max(0.0, self.ejected_until - now), 1),
+            "last_error": self.last_error,
+        }
+
+
+class LLMPool(Runnable[Any, BaseMessage]):
+    """Chat model facade over several Ollama endpoints serving the same model.
+
+    Each request goes to the endpoint with the fewest outstanding requests,
+    never above its `max_concurrency`; requests wait in line when every
+    endpoint is full. A thread's turns prefer the endpoint its thread id
+    hashes to (rendezvous hashing), which keeps its prompt prefix cached
+    there, and spill over only when that endpoint is full or ejected.
+
+    An endpoint that fails `eject_after_failures` times in a row, or fails a
+    `/api/tags` health check, is ejected for a cooldown that doubles on every
+    repeated ejection. Failures before the first token fail over to another
+    endpoint; once tokens have reached the caller the error is raised.
+    """
+
+    def __init__(
+        self,
+        endpoints: Sequence[Endpoint],
+        model_name: Optional[str] = None,
+        eject_after_failures: int = 2,
+        cooldown_seconds: float = 5.0,
+        max_cooldown_seconds: float = 60.0,
+        health_interval_seconds: float = 5.0,
+        health_timeout_seconds: float = 2.0,
+        acquire_timeout_seconds: float = 30.0,
+    ):
+        if not endpoints:
+            raise ValueError("LLMPool needs at least one endpoint")
+        self.endpoints = list(endpoints)
+        self.model_name = model_name
+        self.eject_after_failures = eject_after_failures
+        self.cooldown_seconds = cooldown_seconds
+        self.max_cooldown_seconds = max_cooldown_seconds
+        self.health_interval_seconds = health_interval_seconds
+        self.health_timeout_seconds = health_timeout_seconds
+        self.acquire_timeout_seconds = acquire_timeout_seconds
+        self.failovers = 0
+        self._cond = threading.Condition()  # guards endpoint counters; sync callers wait on it
+        self._released: Optional[asyncio.Condition] = None  # async callers wait on this one
+        self._health_task: Optional[asyncio.Task] = None
+
+    # ========== ENDPOINT SELECTION ==========
+    @staticmethod
+    def _affinity_key(config: RunnableConfig) -> Optional[str]:
+        thread_id = (config.get("configurable") or {}).get("thread_id")
+        return str(thread_id) if thread_id is not None else None
+
+    def _pick(self, key: Optional[str], exclude: List[Endpoint], now: float) -> Optional[Endpoint]:
+        live = [e for e in self.endpoints if e not in exclude and not e.ejected(now)]
+        if key is not None and live:
+            preferred = max(live, key=lambda e: xxhash.xxh64_intdigest(f"{key}\0{e.url}".encode()))
+            if preferred.outstanding < preferred.max_concurrency:
+                return preferred
+        free = [e for e in live if e.outstanding < e.max_concurrency]
+        return min(free, key=lambda e: e.outstanding / e.max_concurrency) if free else None
+
+    def _try_acquire(self, key: Optional[str], exclude: List[Endpoint]) -> Optional[Endpoint]:
+        with self._cond:
+            endpoint = self._pick(key, exclude, time.monotonic())
+            if endpoint is not None:
+                endpoint.outstanding += 1
+                endpoint.requests += 1
+            return endpoint
+
+    def _release(self, endpoint: Endpoint) -> None:
+        with self._cond:
+            endpoint.outstanding -= 1
+            self._cond.notify_all()
+
+    def _acquire(self, key: Optional[str], exclude: List[Endpoint]) -> Endpoint:
+        deadline = time.monotonic() + self.acquire_timeout_seconds
+        with self._cond:
+            while True:
+                endpoint = self._try_acquire(key, exclude)
+                if endpoint is not None:
+                    return endpoint
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise NoEndpointAvailable(f"No LLM endpoint available after {self.acquire_timeout_seconds}s")
+                # Also wakes up periodically: ejections expire without a notify
+                self._cond.wait(min(remaining, 1.0))
+
+    async def _aacquire(self, key: Optional[str], exclude: List[Endpoint]) -> Endpoint:
+        if self._released is None:
+            self._released = asyncio.Condition()
+        deadline = time.monotonic() + self.acquire_timeout_seconds
+        async with self._released:
+            while True:
+                endpoint = self._try_acquire(key, exclude)
+                if endpoint is not None:
+                    return endpoint
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise NoEndpointAvailable(f"No LLM endpoint available after {self.acquire_timeout_seconds}s")
+                try:
+                    await asyncio.wait_for(self._released.wait(), min(remaining, 1.0))
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _arelease(self, endpoint: Endpoint) -> None:
+        self._release(endpoint)
+        if self._released is not None:
+            async with self._released:
+                self._released.notify_all()
+
+    # ========== HEALTH ==========
+    def _eject(self, endpoint: Endpoint, reason: str) -> None:
+        """Caller holds self._cond"""
+        endpoint.cooldown = min(
+            self.max_cooldown_seconds, endpoint.cooldown * 2 if endpoint.cooldown else self.cooldown_seconds
+        )
+        endpoint.ejected_until = time.monotonic() + endpoint.cooldown
+        endpoint.ejections += 1
+        logger.warning("Ejected LLM endpoint %s for %.0fs: %s", endpoint.url, endpoint.cooldown, reason)
+
+    def _succeeded(self, endpoint: Endpoint) -> None:
+        with self._cond:
+            endpoint.consecutive_failures = 0
+            endpoint.cooldown = 0.0
+
+    def _failed(self, endpoint: Endpoint, error: Exception) -> None:
+        with self._cond:
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            endpoint.last_error = str(error)[:200]
+            if endpoint.consecutive_failures >= self.eject_after_failures and not endpoint.ejected(time.monotonic()):
+                self._eject(endpoint, endpoint.last_error)
+
+    def _serves_model(self, payload: Dict[str, Any]) -> bool:
+        if not self.model_name:
+            return True
+        wanted = self.model_name if ":" in self.model_name else f"{self.model_name}:latest"
+        return any(m.get("name") == wanted or m.get("model") == wanted for m in payload.get("models", []))
+
+    async def _probe(self, client: httpx.AsyncClient, endpoint: Endpoint) -> None:
+        now = time.monotonic()
+        if endpoint.ejected(now):
+            return  # still cooling down; probed again once the cooldown is over
+        try:
+            response = await client.get(f"{endpoint.url}/api/tags", timeout=self.health_timeout_seconds)
+            response.raise_for_status()
+            healthy = self._serves_model(response.json())
+            reason = f"model {self.model_name} not available"
+        except Exception as e:
+            healthy, reason = False, f"health check failed: {e}"
+
+        with self._cond:
+            if healthy:
+                if endpoint.cooldown:
+                    logger.info("LLM endpoint %s is healthy again", endpoint.url)
+                endpoint.consecutive_failures = 0
+                endpoint.cooldown = 0.0
+                self._cond.notify_all()
+            else:
+                endpoint.last_error = reason
+                self._eject(endpoint, reason)
+
+    async def check_health(self) -> None:
+        """Probe every endpoint that is not cooling down"""
+        async with httpx.AsyncClient() as client:
+            await asyncio.gather(*(self._probe(client, e) for e in self.endpoints))
+        if self._released is not None:
+            async with self._released:
+                self._released.notify_all()
+
+    async def _health_loop(self) -> None:
+        while True:
+            try:
+                await self.check_health()
+            except Exception as e:
+                logger.error("LLM pool health check error: %s", str(e))
+            await asyncio.sleep(self.health_interval_seconds)
+
+    async def start(self) -> None:
+        if self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def stop(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+    def metrics(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._cond:
+            return {
+                "failovers": self.failovers,
+                "endpoints": [e.snapshot(now) for e in self.endpoints],
+            }
+
+    # ========== RUNNABLE ==========
+    def _failover(self, endpoint: Endpoint, error: Exception, tried: List[Endpoint]) -> None:
+        self._failed(endpoint, error)
+        tried.append(endpoint)
+        if len(tried) >= len(self.endpoints):
+            raise error
+        with self._cond:
+            self.failovers += 1
+        logger.warning("LLM endpoint %s failed before the first token, failing over: %s", endpoint.url, str(error))
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[BaseMessageChunk]:
+        config = ensure_config(config)
+        key, tried = self._affinity_key(config), []
+        while True:
+            endpoint = self._acquire(key, tried)
+            started = False
+            try:
+                for chunk in endpoint.llm.stream(input, config, **kwargs):
+                    started = True
+                    yield chunk
+                self._succeeded(endpoint)
+                return
+            except Exception as e:
+                if started:
+                    self._failed(endpoint, e)
+                    raise
+                self._failover(endpoint, e, tried)
+            finally:
+                self._release(endpoint)
+
+    async def astream(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> AsyncIterator[BaseMessageChunk]:
+        config = ensure_config(config)
+        key, tried = self._affinity_key(config), []
+        while True:
+            endpoint = await self._aacquire(key, tried)
+            started = False
+            try:
+                async for chunk in endpoint.llm.astream(input, config, **kwargs):
+                    started = True
+                    yield chunk
+                self._succeeded(endpoint)
+                return
+            except Exception as e:
+                if started:
+                    self._failed(endpoint, e)
+                    raise
+                self._failover(endpoint, e, tried)
+            finally:
+                await self._arelease(endpoint)
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> BaseMessage:
+        final = None
+        for chunk in self.stream(input, config, **kwargs):
+            final = chunk if final is None else final + chunk
+        return message_chunk_to_message(final)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> BaseMessage:
+        final = None
+        async for chunk in self.astream(input, config, **kwargs):
+            final = chunk if final is None else final + chunk
+        return message_chunk_to_message(final)
@@ -0,0 +1,252 @@
+import argparse
+import asyncio
+import logging
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import orjson
+import redis.asyncio as aioredis
+from langchain_core.messages import BaseMessage, SystemMessage
+from redis.exceptions import WatchError
+
+from backend.codec import pack_message, unpack_entry, unpack_message
+
+logger = logging.getLogger(__name__)
+
+# Per-thread list of messages, one msgpack entry each (JSON in older logs), in conversation order
+LOG_KEY = "thread_log:{thread_id}"
+# Per-thread hash of message id -> position in the log, for range reads by id
+INDEX_KEY = "thread_log_index:{thread_id}"
+# Per-thread metadata hash (title, timestamps, summary, documents, ...), one JSON value per field
+META_KEY = "thread_meta:{thread_id}"
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class MessageLog:
+    """Append-only conversation history, stored apart from the LangGraph checkpoint.
+
+    A turn RPUSHes its new messages (O(1) in the length of the thread) and
+    HSETs only the metadata fields it changed, in one transaction. The
+    checkpoint keeps the current turn plus `log_length`, a pointer into the
+    log, so checkpoint writes no longer grow with the conversation.
+
+    Every message has an id, and a hash maps ids to log positions, so a
+    page of messages before or after a given one is a single LRANGE.
+    Entries are never rewritten, which makes (length, last id) a valid
+    version for the whole log.
+    """
+
+    def __init__(self, redis_client: aioredis.Redis):
+        self.redis = redis_client
+
+    @staticmethod
+    def _log_key(thread_id: str) -> str:
+        return LOG_KEY.format(thread_id=thread_id)
+
+    @staticmethod
+    def _meta_key(thread_id: str) -> str:
+        return META_KEY.format(thread_id=thread_id)
+
+    @staticmethod
+    def _index_key(thread_id: str) -> str:
+        return INDEX_KEY.format(thread_id=thread_id)
+
+    async def append(
+        self, thread_id: str, messages: Iterable[BaseMessage], metadata: Optional[Dict[str, Any]] = None
+    ) -> int:
+        """Append messages and update metadata fields atomically; returns the new log length"""
+        messages = list(messages)
+        for message in messages:
+            if message.id is None:
+                message.id = str(uuid.uuid4())
+        entries = [pack_message(m) for m in messages]
+        log_key = self._log_key(thread_id)
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    # The positions of the new ids depend on the length: retry if another append slips in
+                    await pipe.watch(log_key)
+                    start = await pipe.llen(log_key)
+                    pipe.multi()
+                    if entries:
+                        pipe.rpush(log_key, *entries)
+                        pipe.hset(self._index_key(thread_id), mapping={
+                            m.id: start + offset for offset, m in enumerate(messages)
+                        })
+                    if metadata:
+                        pipe.hset(self._meta_key(thread_id), mapping={k: orjson.dumps(v) for k, v in metadata.items()})
+                    await pipe.execute()
+                    return start + len(entries)
+                except WatchError:
+                    continue
+
+    async def read(self, thread_id: str, start: int = 0, end: Optional[int] = None) -> List[BaseMessage]:
+        """Messages [start, end) of a thread"""
+        if end is not None and end <= start:
+            return []
+        raw = await self.redis.lrange(self._log_key(thread_id), start, -1 if end is None else end - 1)
+        return [unpack_message(entry) for entry in raw]
+
+    async def position(self, thread_id: str, message_id: str) -> int:
+        """Log position of a message; raises KeyError for an unknown id"""
+        position = await self.redis.hget(self._index_key(thread_id), message_id)
+        if position is None and await self.reindex(thread_id):
+            position = await self.redis.hget(self._index_key(thread_id), message_id)
+        if position is None:
+            raise KeyError(message_id)
+        return int(position)
+
+    async def reindex(self, thread_id: str) -> bool:
+        """Rebuild the id index of a log written before it existed; False when it was complete"""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hlen(self._index_key(thread_id))
+        pipe.llen(self._log_key(thread_id))
+        indexed, length = await pipe.execute()
+        if indexed >= length:
+            return False
+        ids = {}
+        for position, message in enumerate(await self.read(thread_id)):
+            if message.id is not None:
+                ids[message.id] = position
+        if ids:
+            await self.redis.hset(self._index_key(thread_id), mapping=ids)
+        return True
+
+    async def page(
+        self, thread_id: str, after: Optional[str] = None, before: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE
+    ) -> Tuple[List[BaseMessage], bool, int]:
+        """Up to `limit` messages right after `after`, right before `before`, or the latest ones.
+
+        Returns (messages, has_more, length): has_more tells whether messages
+        remain beyond the page in the direction read (newer for `after`,
+        older otherwise).
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        length = await self.length(thread_id)
+        if after is not None:
+            start = await self.position(thread_id, after) + 1
+            end = min(start + limit, length)
+            return await self.read(thread_id, start, end), end < length, length
+        end = await self.position(thread_id, before) if before is not None else length
+        start = max(0, end - limit)
+        return await self.read(thread_id, start, end), start > 0, length
+
+    async def etag(self, thread_id: str) -> str:
+        """Version of the log: entries are only ever appended, so its length and last id identify it"""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.llen(self._log_key(thread_id))
+        pipe.lindex(self._log_key(thread_id), -1)
+        length, last = await pipe.execute()
+        last_id = unpack_entry(last).get("id") if last else ""
+        return f'"{length}-{last_id}"'
+
+    async def entries(self, thread_id: str) -> List[Dict[str, Any]]:
+        """The whole log as plain dicts (for archiving)"""
+        return [unpack_entry(raw) for raw in await self.redis.lrange(self._log_key(thread_id), 0, -1)]
+
+    async def length(self, thread_id: str) -> int:
+        return await self.redis.llen(self._log_key(thread_id))
+
+    async def get_metadata(self, thread_id: str) -> Dict[str, Any]:
+        fields = await self.redis.hgetall(self._meta_key(thread_id))
+        return {_decode(k): orjson.loads(v) for k, v in fields.items()}
+
+    async def update_metadata(self, thread_id: str, fields: Dict[str, Any]) -> None:
+        """Set some metadata fields; the others (e.g. a summary written concurrently) are left alone"""
+        if fields:
+            await self.redis.hset(self._meta_key(thread_id), mapping={k: orjson.dumps(v) for k, v in fields.items()})
+
+    async def replace(self, thread_id: str, messages: List[BaseMessage], metadata: Dict[str, Any]) -> int:
+        """Overwrite a thread's log and metadata (migration)"""
+        for message in messages:
+            if message.id is None:
+                message.id = str(uuid.uuid4())
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.delete(self._log_key(thread_id), self._meta_key(thread_id), self._index_key(thread_id))
+        if messages:
+            pipe.rpush(self._log_key(thread_id), *[pack_message(m) for m in messages])
+            pipe.hset(self._index_key(thread_id), mapping={m.id: position for position, m in enumerate(messages)})
+        if metadata:
+            pipe.hset(self._meta_key(thread_id), mapping={k: orjson.dumps(v) for k, v in metadata.items()})
+        await pipe.execute()
+        return len(messages)
+
+    async def delete(self, thread_id: str) -> None:
+        await self.redis.delete(self._log_key(thread_id), self._meta_key(thread_id), self._index_key(thread_id))
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+async def migrate(redis_uri: str, dry_run: bool = False) -> int:
+    """Move history and metadata out of existing checkpoints into message logs"""
+    from langchain_core.messages import RemoveMessage
+    from langgraph.checkpoint.redis.aio import AsyncRedisSaver
+    from langgraph.graph import START, StateGraph
+    from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+    from backend.workflow_pipeline import ChatState
+
+    client = aioredis.Redis.from_url(redis_uri)
+    log = MessageLog(client)
+    count = 0
+
+    async with AsyncRedisSaver.from_conn_string(redis_uri) as checkpointer:
+        await checkpointer.asetup()
+        # Same state schema and node name as the chat graph: the pointer update is an ordinary chat_node write
+        workflow = StateGraph(ChatState)
+        workflow.add_node("chat_node", lambda state: {})
+        workflow.add_edge(START, "chat_node")
+        graph = workflow.compile(checkpointer=checkpointer)
+
+        seen_threads = set()
+        async for key in client.scan_iter("checkpoint:*:__empty__:*"):
+            thread_id = _decode(key).split(':')[1]
+            if thread_id in seen_threads:
+                continue
+            seen_threads.add(thread_id)
+
+            config = {'configurable': {'thread_id': thread_id, 'checkpoint_ns': ''}}
+            checkpoint_tuple = await checkpointer.aget_tuple(config)
+            if checkpoint_tuple is None:
+                continue
+            values = checkpoint_tuple.checkpoint.get('channel_values', {})
+            messages = [m for m in values.get('messages') or [] if not isinstance(m, SystemMessage)]
+            metadata = values.get('metadata') or {}
+            if not messages:
+                continue  # already pointer-only
+            if await log.length(thread_id) or await client.exists(log._meta_key(thread_id)):
+                logger.warning("Thread %s already has a message log, skipping", thread_id)
+                continue
+
+            if not dry_run:
+                length = await log.replace(thread_id, messages, metadata)
+                await graph.aupdate_state(
+                    config={'configurable': {'thread_id': thread_id}},
+                    values={'messages': [RemoveMessage(id=REMOVE_ALL_MESSAGES)], 'log_length': length},
+                    as_node="chat_node"
+                )
+            logger.info("Migrated thread %s (%d messages)", thread_id, len(messages))
+            count += 1
+
+    await client.aclose()
+    return count
+
+
+if __name__ == "__main__":
+    # python -m backend.message_log --migrate
+    parser = argparse.ArgumentParser(description="Message log maintenance")
+    parser.add_argument("--migrate", action="store_true", help="move history out of existing checkpoints")
+    parser.add_argument("--dry-run", action="store_true", help="only report the threads that would be migrated")
+    parser.add_argument("--redis-uri", default="redis://localhost:6379")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.migrate:
+        print(f"Migrated {asyncio.run(migrate(args.redis_uri, args.dry_run))} threads")
+    else:
+        parser.print_help()
@@ -1,9 +1,10 @@
 import os
 from dotenv import load_dotenv
-from typing import Literal, Optional
+from typing import Literal, Optional, Union
 from pydantic import BaseModel, Field, PrivateAttr
 from backend.config_loader import load_config # yaml loader
 from langchain_ollama import ChatOllama
+from backend.llm_pool import Endpoint, LLMPool
 
 load_dotenv()
 
@@ -26,7 +27,7 @@ class ModelLoader(BaseModel): # BaseModel helps with data validation, settings m
     ] = "ollama-llama3" # default is ollama-llama3
 
     config: ConfigLoader = Field(default_factory=ConfigLoader, exclude=True)
-    _llm: Optional[ChatOllama] = PrivateAttr(default=None)
+    _llm: Optional[Union[ChatOllama, LLMPool]] = PrivateAttr(default=None)
 
     class Config:
         arbitrary_types_allowed = True
@@ -46,9 +47,30 @@ class ModelLoader(BaseModel): # BaseModel helps with data validation, settings m
         model_name = self.config["llm"][self.model_key]["model_name"]
 
 
-        if provider == "ollama":
+        if provider == "ollama" and self.config["llm"][self.model_key].get("endpoints"):
+            return self.load_pool()
+
+        elif provider == "ollama":
             print(f"Using Ollama model: {model_name}")
-            return ChatOllama(model=model_name, streaming = self.streaming)
+            return ChatOllama(model=model_name, streaming = self.streaming, **self._ollama_options())
 
         else:
-            raise ValueError(f"Unsupported provider: {provider}")
\ No newline at end of file
+            raise ValueError(f"Unsupported provider: {provider}")
+
+    def _ollama_options(self) -> dict:
+        """keep_alive / num_ctx from config; both must stay constant or Ollama reloads the model and drops its cache"""
+        settings = self.config["llm"][self.model_key]
+        return {key: settings[key] for key in ("keep_alive", "num_ctx") if settings.get(key) is not None}
+
+    def load_pool(self) -> LLMPool:
+        """One ChatOllama per configured endpoint behind a load-balancing LLMPool"""
+        settings = self.config["llm"][self.model_key]
+        endpoints = []
+        for entry in settings["endpoints"]:
+            entry = entry if isinstance(entry, dict) else {"url": entry}
+            llm = ChatOllama(
+                model=settings["model_name"], streaming=self.streaming, base_url=entry["url"], **self._ollama_options()
+            )
+            endpoints.append(Endpoint(entry["url"], llm, entry.get("max_concurrency", 4)))
+        print(f"Using Ollama model: {settings['model_name']} on {len(endpoints)} endpoints")
+        return LLMPool(endpoints, model_name=settings["model_name"], **settings.get("pool", {}))
@@ -1,4 +1,16 @@
 SYSTEM_PROMPT = """
 You are a helpful QA assistant. Answer questions clearly and politely.
 If you don’t know the answer, say so honestly.
-"""
\ No newline at end of file
+"""
+
+SUMMARY_PROMPT = """
+You maintain a running summary of a conversation between a user and an assistant.
+Update the existing summary with the new messages below. Keep names, numbers,
+decisions and open questions; drop small talk. Reply with the summary only.
+
+Existing summary:
+{summary}
+
+New messages:
+{messages}
+"""
@@ -0,0 +1,233 @@
+import heapq
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+import orjson
+
+# Keeps identifiers such as "GPT-4", "bge-base-en-v1.5" or "RAG_v2" as one token
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+(?:[-.][a-z0-9_]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    # Also index the parts of compound identifiers so "gpt" matches "gpt-4"
+    parts = [p for t in tokens if "-" in t or "." in t for p in re.split(r"[-.]", t) if p]
+    return tokens + parts
+
+
+class BM25Index:
+    """Lexical inverted index with Okapi BM25 scoring.
+
+    Documents are added and removed by id, so the index is maintained
+    incrementally alongside the dense vectors. Payload fields in
+    `filter_fields` are indexed too, so filtered searches only score matching
+    documents.
+
+    Persisted under `directory` as a snapshot (bm25.json) plus a log of the
+    changes saved since (bm25.{generation}.log, one JSON line per save); the
+    snapshot is rewritten once the log outgrows it. refresh() applies what
+    another process (the ingest consumer) saved, replaying only the new log
+    lines; it is called on ingest notifications, never by search().
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        filter_fields: Iterable[str] = ("source", "page"),
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        self.path = os.path.join(directory, "bm25.json")
+        self.filter_fields = tuple(filter_fields)
+        self.k1 = k1
+        self.b = b
+
+        self._lock = threading.RLock()
+        self._mtime = None  # of the snapshot as last loaded or saved
+        self._load()
+
+    def _log_path(self, generation: int) -> str:
+        return os.path.join(os.path.dirname(self.path), f"bm25.{generation}.log")
+
+    def _load(self) -> None:
+        self.doc_terms: Dict[str, Dict[str, int]] = {}
+        self.doc_len: Dict[str, int] = {}
+        self.payloads: Dict[str, Dict[str, Any]] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.field_postings: Dict[str, Dict[Any, set]] = {f: {} for f in self.filter_fields}
+        self.total_len = 0
+        self.generation = 0
+        self._log_offset = 0  # bytes of the current log already applied
+        self._pending: List[list] = []  # changes not saved yet, in order
+        if os.path.exists(self.path):
+            self._mtime = os.stat(self.path).st_mtime_ns
+            with open(self.path, "rb") as f:
+                data = orjson.loads(f.read())
+            self.generation = data.get("generation", 0)
+            for doc_id, terms in data["doc_terms"].items():
+                self._index(doc_id, terms, data["payloads"][doc_id])
+            self._replay_log()
+
+    def _replay_log(self) -> None:
+        """Apply the complete lines appended to the current log since the last read"""
+        try:
+            with open(self._log_path(self.generation), "rb") as f:
+                f.seek(self._log_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n") + 1  # a line being written is picked up next time
+        for line in data[:end].splitlines():
+            self._apply(orjson.loads(line))
+        self._log_offset += end
+
+    def _apply(self, changes: List[list]) -> None:
+        for change in changes:
+            if change[0] == "remove":
+                self._unindex(change[1])
+            else:
+                _, doc_id, terms, payload = change
+                self._unindex(doc_id)
+                self._index(doc_id, terms, payload)
+
+    def refresh(self) -> None:
+        """Catch up with what another process saved since this one loaded or saved the index"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if mtime != self._mtime:
+                self._load()  # the snapshot was rewritten
+            else:
+                self._replay_log()
+
+    def __len__(self) -> int:
+        return len(self.doc_terms)
+
+    # ---------- writes ----------
+    def _field_values(self, payload: Dict[str, Any], field: str) -> list:
+        values = payload.get(field)
+        return values if isinstance(values, list) else [values]
+
+    def _index(self, doc_id: str, terms: Dict[str, int], payload: Dict[str, Any]) -> None:
+        self.doc_terms[doc_id] = terms
+        self.doc_len[doc_id] = sum(terms.values())
+        self.payloads[doc_id] = payload
+        self.total_len += self.doc_len[doc_id]
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        for field in self.filter_fields:
+            for value in self._field_values(payload, field):
+                if value is not None:
+                    self.field_postings[field].setdefault(value, set()).add(doc_id)
+
+    def _unindex(self, doc_id: str) -> None:
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self.total_len -= self.doc_len.pop(doc_id)
+        payload = self.payloads.pop(doc_id)
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self.postings[term]
+        for field in self.filter_fields:
+            for value in self._field_values(payload, field):
+                self.field_postings[field].get(value, set()).discard(doc_id)
+
+    def add(self, ids: List[str], texts: List[str], payloads: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            for doc_id, text, payload in zip(ids, texts, payloads):
+                terms = dict(Counter(tokenize(text)))
+                self._unindex(doc_id)
+                self._index(doc_id, terms, payload)
+                self._pending.append(["add", doc_id, terms, payload])
+
+    def remove(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            for doc_id in ids:
+                if doc_id in self.doc_terms:
+                    self._unindex(doc_id)
+                    self._pending.append(["remove", doc_id])
+
+    def save(self) -> None:
+        """Append the unsaved changes to the log, or rewrite the snapshot once the log outgrows it"""
+        with self._lock:
+            if not self._pending and os.path.exists(self.path):
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            line = orjson.dumps(self._pending) + b"\n"
+            self._pending = []
+            try:
+                snapshot_size = os.stat(self.path).st_size
+            except FileNotFoundError:
+                snapshot_size = None
+            if snapshot_size is not None and self._log_offset + len(line) <= snapshot_size:
+                with open(self._log_path(self.generation), "ab") as f:
+                    f.write(line)
+                self._log_offset += len(line)
+                return
+
+            # New generation: readers that see the new snapshot start from its own, empty log
+            previous = self.generation
+            self.generation += 1
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(orjson.dumps(
+                    {"generation": self.generation, "doc_terms": self.doc_terms, "payloads": self.payloads}
+                ))
+            os.replace(tmp_path, self.path)
+            self._mtime = os.stat(self.path).st_mtime_ns
+            self._log_offset = 0
+            try:
+                os.remove(self._log_path(previous))
+            except FileNotFoundError:
+                pass
+
+    # ---------- reads ----------
+    def _allowed(self, filters: Optional[Dict[str, Any]]) -> Optional[set]:
+        if not filters:
+            return None
+        allowed = None
+        for field, value in filters.items():
+            if field not in self.field_postings:
+                raise ValueError(f"Field '{field}' is not indexed; add it to filter_fields")
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            matched = set().union(*(self.field_postings[field].get(v, set()) for v in values))
+            allowed = matched if allowed is None else allowed & matched
+        return allowed
+
+    def search(self, query: str, top_k: int = 10, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            if not self.doc_terms:
+                return []
+            allowed = self._allowed(filters)
+            if allowed is not None and not allowed:
+                return []
+
+            n_docs = len(self.doc_terms)
+            avg_len = self.total_len / n_docs
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                # Walk the shorter of the posting list and the filter set
+                if allowed is not None and len(allowed) < len(posting):
+                    items = ((d, posting[d]) for d in allowed if d in posting)
+                else:
+                    items = ((d, tf) for d, tf in posting.items() if allowed is None or d in allowed)
+                for doc_id, tf in items:
+                    norm = tf + self.k1 * (1 - self.b + self.b * self.doc_len[doc_id] / avg_len)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+            best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            return [{**self.payloads[doc_id], "id": doc_id, "score": score} for doc_id, score in best]
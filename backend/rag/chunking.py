@@ -0,0 +1,190 @@
+import re
+from bisect import bisect_left
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Tuple
+
+Span = Tuple[int, int]
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+WORD = re.compile(r"\S+")
+UNWANTED_CHARS = re.compile(r"[^\w\s.,;:!?'-]")
+WHITESPACE = re.compile(r"\s+")
+
+
+def clean_text(text: str) -> str:
+    if not text:
+        return ""
+    text = UNWANTED_CHARS.sub(" ", text)
+    return WHITESPACE.sub(" ", text).strip()
+
+
+# ========== TOKEN OFFSETS ==========
+class TokenCounter:
+    """Character spans of model tokens, from the embedding model's fast tokenizer.
+
+    Each element is tokenized once; chunk boundaries and budgets are then
+    computed from these offsets by bisection, never by re-tokenizing pieces.
+    Without a tokenizer, whitespace-separated words stand in for tokens.
+    """
+
+    def __init__(self, tokenizer=None):
+        backend = getattr(tokenizer, "backend_tokenizer", None)
+        if backend is not None:
+            # Rust tokenizer directly: no special tokens, no max-length warnings
+            self._offsets = lambda text: backend.encode(text, add_special_tokens=False).offsets
+        elif tokenizer is not None:
+            self._offsets = lambda text: tokenizer(
+                text, add_special_tokens=False, return_offsets_mapping=True
+            )["offset_mapping"]
+        else:
+            self._offsets = lambda text: [m.span() for m in WORD.finditer(text)]
+
+    @classmethod
+    def for_embedder(cls, embedder) -> "TokenCounter":
+        """Use the tokenizer of an EmbeddingService's SentenceTransformer"""
+        return cls(getattr(embedder.model, "tokenizer", None))
+
+    def offsets(self, text: str) -> List[Span]:
+        return self._offsets(text)
+
+
+# ========== CHUNKERS ==========
+class _Piece:
+    """Tokens [first, last) of one element: a view over its text, sliced only when a chunk is emitted"""
+
+    __slots__ = ("text", "offsets", "first", "last")
+
+    def __init__(self, text: str, offsets: List[Span], first: int, last: int):
+        self.text, self.offsets, self.first, self.last = text, offsets, first, last
+
+    @property
+    def tokens(self) -> int:
+        return self.last - self.first
+
+
+def _join(pieces: Iterable[_Piece]) -> str:
+    """Chunk text: the consecutive pieces of each element become one slice"""
+    parts: List[str] = []
+    current, last = None, 0
+    for piece in pieces:
+        if current is not None and piece.text is current.text:
+            last = piece.last
+            continue
+        if current is not None:
+            parts.append(current.text[current.offsets[current.first][0]:current.offsets[last - 1][1]])
+        current, last = piece, piece.last
+    if current is not None:
+        parts.append(current.text[current.offsets[current.first][0]:current.offsets[last - 1][1]])
+    return clean_text(" ".join(parts))
+
+
+def sentence_pieces(text: str, offsets: List[Span], max_tokens: int) -> Iterator[_Piece]:
+    """One piece per sentence; sentences over budget are split on token boundaries"""
+    starts = [start for start, _ in offsets]
+    first = 0
+    for match in SENTENCE_END.finditer(text):
+        last = bisect_left(starts, match.end(), lo=first)
+        yield from _split(text, offsets, first, last, max_tokens)
+        first = last
+    yield from _split(text, offsets, first, len(offsets), max_tokens)
+
+
+def _split(text: str, offsets: List[Span], first: int, last: int, max_tokens: int) -> Iterator[_Piece]:
+    for window in range(first, last, max_tokens):
+        yield _Piece(text, offsets, window, min(window + max_tokens, last))
+
+
+def _keep(text: str, min_chars: int) -> bool:
+    return len(text) >= min_chars and any(c.isalpha() for c in text)
+
+
+def chunk_elements(
+    elements: Iterable[Dict[str, Any]],
+    counter: TokenCounter,
+    method: str = "sentence",
+    max_tokens: int = 128,
+    overlap_tokens: int = 32,
+    min_chars: int = 25,
+) -> Iterator[Dict[str, Any]]:
+    """Lazily turn a stream of partition elements into chunks of at most `max_tokens` model tokens.
+
+    "sentence" packs whole sentences; "sliding" emits token windows that
+    overlap by `overlap_tokens`. Consecutive elements of the same page and
+    section are packed together; chunks never cross a page or section, and
+    each carries that page/section plus its first element's category. Only
+    the pieces of the chunk being built are held, so memory does not grow
+    with document length.
+    """
+    if method not in ("sentence", "sliding"):
+        raise ValueError(f"Unknown chunking method: {method}")
+    step = max(1, max_tokens - overlap_tokens)
+    window: Deque[_Piece] = deque()
+    state = {"tokens": 0, "fresh": 0, "group": None, "category": None}  # fresh: tokens not yet emitted
+
+    def emit() -> Iterator[Dict[str, Any]]:
+        text = _join(window)
+        state["fresh"] = 0
+        if _keep(text, min_chars):
+            page, section = state["group"]
+            yield {
+                "text": text,
+                "page": page if page is not None else "unknown",
+                "section": section or "unknown",
+                "category": state["category"],
+                "token_count": state["tokens"],
+            }
+
+    def start(category) -> None:
+        window.clear()
+        state["tokens"] = 0
+        state["category"] = category
+
+    for element in elements:
+        text = element.get("text") or ""
+        category = element.get("category")
+        group = (element.get("page"), element.get("section"))
+        if group != state["group"]:
+            if state["fresh"]:
+                yield from emit()
+            start(category)
+            state["group"] = group
+
+        offsets = counter.offsets(text)
+        if method == "sentence":
+            for piece in sentence_pieces(text, offsets, max_tokens):
+                if window and state["tokens"] + piece.tokens > max_tokens:
+                    yield from emit()
+                    start(category)
+                window.append(piece)
+                state["tokens"] += piece.tokens
+                state["fresh"] += piece.tokens
+        else:
+            first = 0
+            while first < len(offsets):
+                if not window:
+                    state["category"] = category
+                last = min(len(offsets), first + max_tokens - state["tokens"])
+                window.append(_Piece(text, offsets, first, last))
+                state["tokens"] += last - first
+                state["fresh"] += last - first
+                first = last
+                if state["tokens"] == max_tokens:
+                    yield from emit()
+                    _advance(window, step)
+                    state["tokens"] -= step
+                    state["category"] = category
+
+    if state["fresh"]:
+        yield from emit()
+
+
+def _advance(window: Deque[_Piece], count: int) -> None:
+    """Drop the first `count` tokens of a sliding window"""
+    while count:
+        head = window[0]
+        if head.tokens <= count:
+            count -= head.tokens
+            window.popleft()
+        else:
+            window[0] = _Piece(head.text, head.offsets, head.first + count, head.last)
+            count = 0
@@ -0,0 +1,246 @@
+import asyncio
+import bisect
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import xxhash
+
+from backend.config_loader import load_config
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+LATENCY_MS_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus style)"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def snapshot(self) -> Dict:
+        cumulative, running = {}, 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            running += count
+            cumulative[str(bound)] = running
+        return {"buckets": cumulative, "count": self.count, "sum": round(self.total, 3)}
+
+
+class EmbeddingCache:
+    """On-disk embedding cache keyed by a hash of (model, text)"""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                found.update((key, np.frombuffer(blob, dtype=np.float32)) for key, blob in rows)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, vector.astype(np.float32).tobytes()) for key, vector in items.items()]
+            )
+
+
+class EmbeddingService:
+    """One warm SentenceTransformer per process, with batching and caching.
+
+    `embed_documents` is the bulk path used by ingestion. `aembed_query` is the
+    request path: concurrent calls arriving within `batch_window_ms` are
+    encoded together in one forward pass, off the event loop. Both paths read
+    and fill the on-disk cache, so repeated texts are never re-encoded.
+
+    The model encodes one batch at a time. Ingestion encodes in batches of
+    `max_batch_size` and yields the model to waiting queries between them,
+    so a query waits for at most one ingestion batch, not a whole job.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        cache_path: Optional[str] = None,
+        batch_window_ms: float = 5.0,
+        max_batch_size: int = 32,
+    ):
+        self.model_name = model_name
+        self.batch_window_ms = batch_window_ms
+        self.max_batch_size = max_batch_size
+        self.cache = EmbeddingCache(cache_path) if cache_path else None
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.latency_ms = Histogram(LATENCY_MS_BUCKETS)
+        self.query_latency_ms = Histogram(LATENCY_MS_BUCKETS)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._encode_cond = threading.Condition()
+        self._encoding = False
+        self._queries_waiting = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    logger.info("Loading embedding model %s", self.model_name)
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def warm(self) -> None:
+        """Load the model and run one encode so the first request is not slow"""
+        self.model.encode(["warm up"], normalize_embeddings=True)
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def _key(self, text: str) -> str:
+        return xxhash.xxh3_128_hexdigest(f"{self.model_name}\0{text}".encode())
+
+    @contextmanager
+    def _encoder(self, interactive: bool) -> Iterator[None]:
+        """Hold the model for one encode; queries go ahead of ingestion batches waiting for it"""
+        with self._encode_cond:
+            self._queries_waiting += interactive
+            try:
+                while self._encoding or (not interactive and self._queries_waiting):
+                    self._encode_cond.wait()
+                self._encoding = True
+            finally:
+                self._queries_waiting -= interactive
+        try:
+            yield
+        finally:
+            with self._encode_cond:
+                self._encoding = False
+                self._encode_cond.notify_all()
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        """Normalized float32 embeddings, one row per text"""
+        return self._embed(texts, interactive=False)
+
+    def _embed(self, texts: List[str], interactive: bool) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        keys = [self._key(t) for t in texts]
+        cached = self.cache.get_many(list(set(keys))) if self.cache else {}
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        self.cache_hits += len(texts) - len(missing)
+        self.cache_misses += len(missing)
+
+        if missing:
+            started = time.perf_counter()
+            pending = list(missing.values())
+            vectors = []
+            for start in range(0, len(pending), self.max_batch_size):
+                with self._encoder(interactive):
+                    vectors.append(self.model.encode(
+                        pending[start:start + self.max_batch_size],
+                        batch_size=self.max_batch_size, normalize_embeddings=True
+                    ).astype(np.float32))
+            self.latency_ms.observe((time.perf_counter() - started) * 1000)
+            self.batch_sizes.observe(len(missing))
+            computed = dict(zip(missing.keys(), np.concatenate(vectors)))
+            if self.cache:
+                self.cache.put_many(computed)
+            cached.update(computed)
+
+        return np.stack([cached[key] for key in keys])
+
+    async def aembed_query(self, text: str) -> np.ndarray:
+        """Embed one query; concurrent callers share a micro-batch"""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._worker.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._batch_worker())
+        started = time.perf_counter()
+        future = loop.create_future()
+        await self._queue.put((text, future))
+        vector = await future
+        self.query_latency_ms.observe((time.perf_counter() - started) * 1000)
+        return vector
+
+    async def _batch_worker(self) -> None:
+        window = self.batch_window_ms / 1000
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + window
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            texts = [text for text, _ in batch]
+            try:
+                vectors = await asyncio.to_thread(self._embed, texts, True)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
+    def metrics(self) -> Dict:
+        return {
+            "model": self.model_name,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "batch_size": self.batch_sizes.snapshot(),
+            "encode_latency_ms": self.latency_ms.snapshot(),
+            "query_latency_ms": self.query_latency_ms.snapshot(),
+        }
+
+
+_services: Dict[str, EmbeddingService] = {}
+_services_lock = threading.Lock()
+
+
+def get_embedding_service(model_name: Optional[str] = None, config: Optional[dict] = None) -> EmbeddingService:
+    """Process-wide EmbeddingService for `model_name` (defaults to rag.embedding_model)"""
+    config = config if config is not None else load_config()
+    model_name = model_name or config["rag"]["embedding_model"]
+    with _services_lock:
+        if model_name not in _services:
+            _services[model_name] = EmbeddingService(model_name, **config.get("embeddings", {}))
+        return _services[model_name]
@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+import xxhash
+
+DEFAULT_MANIFEST_DIR = "data/index"
+
+
+def file_hash(filepath: str, block_size: int = 1 << 20) -> str:
+    """Content hash of a file, read in blocks"""
+    hasher = xxhash.xxh3_128()
+    with open(filepath, "rb") as f:
+        while block := f.read(block_size):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def chunk_hash(text: str) -> str:
+    return xxhash.xxh3_64_hexdigest(text.encode())
+
+
+def point_id(source: str, chunk_digest: str) -> str:
+    """Deterministic vector id, so re-upserting the same chunk is idempotent"""
+    return str(uuid.UUID(bytes=xxhash.xxh3_128_digest(f"{source}\0{chunk_digest}".encode())))
+
+
+def _normalized(settings: Optional[Dict]) -> Dict:
+    """As the settings read back from the manifest file (tuples become lists)"""
+    return json.loads(json.dumps(settings or {}, sort_keys=True))
+
+
+class DocumentManifest:
+    """Records what has been indexed: a content hash per file and per chunk.
+
+    Layout: {source: {"file_hash": str, "chunks": {chunk_hash: point_id},
+                      "pages": [{"page", "strategy", "ms", "elements"}],
+                      "chunker": {chunking settings}, "payload": {ingest payload}}}
+    Safe to share between concurrent ingestion jobs.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.documents: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self) -> None:
+        """Read the manifest again, e.g. when this process takes over ingestion from another one"""
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                documents = json.load(f)
+            with self._lock:
+                self.documents = documents
+
+    @classmethod
+    def for_collection(cls, collection: str, directory: str = DEFAULT_MANIFEST_DIR) -> "DocumentManifest":
+        return cls(os.path.join(directory, f"{collection}.manifest.json"))
+
+    def get(self, source: str) -> Optional[Dict]:
+        return self.documents.get(source)
+
+    def is_unchanged(
+        self, source: str, digest: str, chunker: Optional[Dict] = None, payload: Optional[Dict] = None
+    ) -> bool:
+        """Same file content, chunked with the same settings and indexed with the same payload"""
+        entry = self.documents.get(source)
+        return entry is not None and entry["file_hash"] == digest and self.same_settings(source, chunker, payload)
+
+    def same_settings(self, source: str, chunker: Optional[Dict] = None, payload: Optional[Dict] = None) -> bool:
+        """Whether the stored chunks of `source` were made with `chunker` and carry `payload`"""
+        entry = self.documents.get(source) or {}
+        return entry.get("chunker") == _normalized(chunker) and entry.get("payload") == _normalized(payload)
+
+    def update(
+        self,
+        source: str,
+        digest: str,
+        chunks: Dict[str, str],
+        pages: Optional[List[Dict]] = None,
+        chunker: Optional[Dict] = None,
+        payload: Optional[Dict] = None,
+    ) -> None:
+        """Record an indexed document, with the parse strategy and timing of each page"""
+        with self._lock:
+            self.documents[source] = {
+                "file_hash": digest, "chunks": chunks, "pages": pages or [],
+                "chunker": _normalized(chunker), "payload": _normalized(payload),
+            }
+
+    def remove(self, source: str) -> List[str]:
+        """Forget a document and return the point ids that must be deleted"""
+        with self._lock:
+            entry = self.documents.pop(source, None)
+        return list(entry["chunks"].values()) if entry else []
+
+    def sources_under(self, paths: Iterable[str]) -> List[str]:
+        """Indexed sources that live under any of `paths` (files or directories)"""
+        roots = [os.path.normpath(p) for p in paths]
+        with self._lock:
+            sources = list(self.documents)
+        return [
+            source for source in sources
+            if any(os.path.normpath(source) == root or os.path.normpath(source).startswith(root + os.sep) for root in roots)
+        ]
+
+    def save(self) -> None:
+        """Write atomically so an interrupted run never leaves a torn manifest"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.documents, f)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,152 @@
+import logging
+import os
+import re
+import tempfile
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "adaptive": True,
+    "min_text_chars": 50,  # less extractable text than this: treat the page as scanned
+    "table_line_ratio": 0.3,  # share of lines with 3+ numeric cells that marks a page as tabular
+    "languages": ["eng"],
+    "page_batch": 8,  # PDF pages parsed per partition_file call, so a document is chunked as it is parsed
+}
+
+NUMERIC_TOKEN = re.compile(r"^[(\-+$€£]?\d[\d,.:%/\-)]*$")
+
+
+def _element_dicts(elements, page: Optional[int] = None) -> List[Dict[str, Any]]:
+    return [
+        {
+            "text": el.text,
+            "page": page if page is not None else getattr(el.metadata, "page_number", None),
+            "category": el.category,
+            "section": getattr(el.metadata, "section", None),
+        }
+        for el in elements
+        if el.text and el.text.strip()
+    ]
+
+
+def table_line_ratio(text: str) -> float:
+    """Share of non-empty lines that look like table rows (3+ numeric cells)"""
+    lines = [line for line in text.splitlines() if line.strip()]
+    if not lines:
+        return 0.0
+    tabular = sum(1 for line in lines if sum(1 for t in line.split() if NUMERIC_TOKEN.match(t)) >= 3)
+    return tabular / len(lines)
+
+
+def _has_images(page) -> bool:
+    try:
+        return len(page.images) > 0
+    except Exception:
+        return False
+
+
+def choose_strategy(text: str, has_images: bool, settings: Dict[str, Any]) -> Optional[str]:
+    """unstructured strategy for one page: "fast", "hi_res", "ocr_only", or None for a blank page"""
+    if len(text.strip()) < settings["min_text_chars"]:
+        return "ocr_only" if has_images else None
+    if table_line_ratio(text) >= settings["table_line_ratio"]:
+        return "hi_res"
+    return "fast"
+
+
+def _partition_page(reader, index: int, strategy: str, settings: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Run a layout/OCR strategy on a single page, written out as a one-page PDF"""
+    from pypdf import PdfWriter
+    from unstructured.partition.pdf import partition_pdf
+
+    writer = PdfWriter()
+    writer.add_page(reader.pages[index])
+    fd, tmp_path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            writer.write(f)
+        elements = partition_pdf(
+            filename=tmp_path,
+            strategy=strategy,
+            infer_table_structure=strategy == "hi_res",
+            languages=settings["languages"],
+        )
+        return _element_dicts(elements, page=index + 1)
+    finally:
+        os.remove(tmp_path)
+
+
+def partition_pdf_adaptive(filepath: str, settings: Dict[str, Any], first_page: int = 0) -> Dict[str, Any]:
+    """Probe `page_batch` pages from `first_page` with pypdf; only scanned or table-heavy pages pay for layout/OCR models"""
+    from pypdf import PdfReader
+    from unstructured.partition.text import partition_text
+
+    reader = PdfReader(filepath)
+    last_page = min(len(reader.pages), first_page + max(1, settings["page_batch"]))
+    elements, pages = [], []
+    for index in range(first_page, last_page):
+        page = reader.pages[index]
+        started = time.perf_counter()
+        text = page.extract_text() or ""
+        strategy = choose_strategy(text, _has_images(page), settings)
+        if strategy == "fast":
+            # The text layer we just probed is the extraction
+            page_elements = _element_dicts(partition_text(text=text), page=index + 1)
+        elif strategy is not None:
+            page_elements = _partition_page(reader, index, strategy, settings)
+        else:
+            page_elements = []
+        elements.extend(page_elements)
+        pages.append({
+            "page": index + 1,
+            "strategy": strategy or "empty",
+            "ms": round((time.perf_counter() - started) * 1000, 1),
+            "elements": len(page_elements),
+        })
+    next_page = last_page if last_page < len(reader.pages) else None
+    return {"elements": elements, "pages": pages, "next_page": next_page}
+
+
+def partition_file(filepath: str, settings: Optional[Dict[str, Any]] = None, first_page: int = 0) -> Dict[str, Any]:
+    """Parse one batch of a document's pages (runs in a worker process).
+
+    Returns {"elements": [...], "pages": [{"page", "strategy", "ms", "elements"}],
+    "next_page": first page of the next batch, or None once the document is done}.
+    PDFs are partitioned page by page, `page_batch` pages per call, when
+    `adaptive` is on; other formats, and PDFs pypdf cannot read, go through
+    unstructured's default `partition` in one call.
+    """
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    if settings["adaptive"] and filepath.lower().endswith(".pdf"):
+        try:
+            return partition_pdf_adaptive(filepath, settings, first_page)
+        except Exception as e:
+            if first_page:
+                raise  # earlier pages are already chunked: the whole document cannot start over
+            logger.warning("Adaptive parsing failed for %s, using default partition: %s", filepath, str(e))
+
+    from unstructured.partition.auto import partition
+
+    started = time.perf_counter()
+    elements = _element_dicts(partition(filename=filepath, languages=settings["languages"]))
+    return {
+        "elements": elements,
+        "pages": [{
+            "page": None,
+            "strategy": "auto",
+            "ms": round((time.perf_counter() - started) * 1000, 1),
+            "elements": len(elements),
+        }],
+        "next_page": None,
+    }
+
+
+def partition_batches(filepath: str, settings: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """partition_file over a whole document in this process, one batch of pages at a time"""
+    first_page = 0
+    while first_page is not None:
+        parsed = partition_file(filepath, settings, first_page)
+        first_page = parsed["next_page"]
+        yield parsed
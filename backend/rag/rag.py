@@ -0,0 +1,489 @@
+import argparse
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from backend.config_loader import load_config
+from backend.rag.embeddings import get_embedding_service
+from backend.rag.manifest import DocumentManifest, chunk_hash, file_hash, point_id
+from backend.rag.partition import partition_file
+from backend.rag.chunking import TokenCounter, chunk_elements
+from backend.rag.bm25 import BM25Index
+from backend.rag.retriever import HybridRetriever, RetrievalResult
+from backend.rag.rerank import Reranker
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt", ".md", ".html")
+
+
+# ========== TEXT PROCESSING ==========
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+# ========== DOCUMENT PROCESSING ==========
+def discover_files(paths: Iterable[str]) -> List[str]:
+    """Expand directories into the supported documents they contain"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(
+                    os.path.join(root, name) for name in sorted(names)
+                    if name.lower().endswith(SUPPORTED_EXTENSIONS)
+                )
+        elif path.lower().endswith(SUPPORTED_EXTENSIONS):
+            files.append(path)
+    return files
+
+
+# ========== VECTOR STORE ==========
+class QdrantVectorStore:
+    """Thin wrapper over the Qdrant collection that holds the chunks.
+
+    Every field in `filter_fields` gets a keyword payload index, so filtered
+    searches are resolved by the index rather than by scanning payloads.
+    `tenant_field` is marked as the tenant key, letting Qdrant co-locate the
+    vectors of each thread.
+    """
+
+    def __init__(
+        self,
+        collection: str,
+        vector_size: int,
+        host: str = "localhost",
+        port: int = 6333,
+        filter_fields: Iterable[str] = ("source", "page"),
+        tenant_field: Optional[str] = "thread_id",
+    ):
+        from qdrant_client import QdrantClient
+
+        self.client = QdrantClient(host=host, port=port)
+        self.collection = collection
+        self.vector_size = vector_size
+        self.filter_fields = tuple(filter_fields)
+        self.tenant_field = tenant_field
+        self._ready = False
+
+    def ensure_collection(self) -> None:
+        """Create the collection and its payload indexes if missing (never drops existing data)"""
+        from qdrant_client import models
+
+        if self._ready:
+            return
+        if not self.client.collection_exists(self.collection):
+            self.client.create_collection(
+                collection_name=self.collection,
+                vectors_config=models.VectorParams(size=self.vector_size, distance=models.Distance.COSINE)
+            )
+        existing = self.client.get_collection(self.collection).payload_schema
+        for field in self.filter_fields:
+            if field not in existing:
+                self.client.create_payload_index(
+                    collection_name=self.collection,
+                    field_name=field,
+                    field_schema=models.KeywordIndexParams(
+                        type=models.KeywordIndexType.KEYWORD, is_tenant=field == self.tenant_field
+                    ),
+                )
+        self._ready = True
+
+    def upsert(self, ids: List[str], vectors, payloads: List[Dict[str, Any]]) -> None:
+        from qdrant_client import models
+
+        self.client.upsert(
+            collection_name=self.collection,
+            points=models.Batch(ids=ids, vectors=[list(map(float, v)) for v in vectors], payloads=payloads),
+            wait=False
+        )
+
+    def delete(self, ids: List[str]) -> None:
+        from qdrant_client import models
+
+        if ids:
+            self.client.delete(self.collection, points_selector=models.PointIdsList(points=ids))
+
+    def flush(self) -> None:
+        """Qdrant persists on its own"""
+
+    @staticmethod
+    def _filter(filters: Optional[Dict[str, Any]]):
+        from qdrant_client import models
+
+        if not filters:
+            return None
+        conditions = []
+        for field, value in filters.items():
+            match = (
+                models.MatchAny(any=list(value)) if isinstance(value, (list, tuple, set))
+                else models.MatchValue(value=value)
+            )
+            conditions.append(models.FieldCondition(key=field, match=match))
+        return models.Filter(must=conditions)
+
+    def search(self, vector, top_k: int = 3, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        hits = self.client.query_points(
+            collection_name=self.collection, query=list(map(float, vector)), limit=top_k,
+            query_filter=self._filter(filters), with_payload=True
+        ).points
+        return [{**hit.payload, "id": str(hit.id), "score": hit.score} for hit in hits]
+
+
+def get_vector_store(settings: Dict[str, Any], collection: str, vector_size: int):
+    """Qdrant (default) or the embedded LocalVectorIndex, per `rag.vector_store`"""
+    if settings.get("vector_store", "qdrant") == "local":
+        from backend.rag.vector_index import LocalVectorIndex
+        return LocalVectorIndex(
+            os.path.join(settings.get("index_dir", "data/index"), collection),
+            vector_size,
+            filter_fields=settings.get("filter_fields", ("source", "page")),
+            compact_ratio=settings.get("compact_ratio", 0.25),
+        )
+    return QdrantVectorStore(
+        collection=collection,
+        vector_size=vector_size,
+        host=settings.get("qdrant_host", "localhost"),
+        port=settings.get("qdrant_port", 6333),
+        filter_fields=settings.get("filter_fields", ("source", "page")),
+    )
+
+
+# ========== INGESTION PIPELINE ==========
+class IngestionPipeline:
+    """Parse -> chunk -> embed -> upsert, streaming end to end.
+
+    Documents are partitioned in a process pool, a batch of pages at a time,
+    with a bounded number of batches in flight; chunks flow through generators
+    and are embedded and upserted in fixed-size batches, so memory stays flat
+    regardless of corpus and document size.
+
+    A manifest of file and chunk hashes makes re-ingestion incremental: unchanged
+    files are not parsed, unchanged chunks are not re-embedded, and vectors of
+    chunks or files that disappeared are deleted. A file is re-chunked and all
+    of its chunks re-embedded when the chunking settings or the ingest payload
+    differ from the ones it was indexed with.
+
+    `ingest` may be called from several threads at once (one per ingestion
+    job): they share one parse pool, and at most `max_files_in_flight` batches
+    of pages are being parsed across all calls, while `retriever` keeps
+    serving searches.
+    """
+
+    def __init__(self, config: Optional[dict] = None):
+        config = config if config is not None else load_config()
+        self.settings = config["rag"]
+        self.method = self.settings.get("chunk_method", "sentence")
+        self.embed_batch_size = self.settings.get("embed_batch_size", 64)
+        self.max_workers = self.settings.get("parse_workers") or os.cpu_count() or 1
+        self.max_files_in_flight = self.settings.get("max_files_in_flight") or self.max_workers * 2
+        self.partition_settings = self.settings.get("partition", {})
+        self.embedder = get_embedding_service(self.settings["embedding_model"], config)
+        self.store = get_vector_store(
+            self.settings,
+            collection=f"{self.settings.get('collection_prefix', 'rag_data')}_{self.method}",
+            vector_size=self.embedder.dimension,
+        )
+        self.manifest = DocumentManifest.for_collection(
+            self.store.collection, self.settings.get("index_dir", "data/index")
+        )
+        # BM25 index maintained alongside the dense vectors for hybrid retrieval
+        self.lexical = None
+        if self.settings.get("hybrid", True):
+            self.lexical = BM25Index(
+                os.path.join(self.settings.get("index_dir", "data/index"), self.store.collection),
+                filter_fields=self.settings.get("filter_fields", ("source", "page")),
+            )
+        retrieval = config.get("retrieval", {})
+        self.top_k = retrieval.get("top_k", 3)
+        self.retriever = HybridRetriever(
+            self.embedder, self.store, self.lexical,
+            reranker=Reranker.from_config(config),
+            dense_k=retrieval.get("dense_k", 20),
+            lexical_k=retrieval.get("lexical_k", 20),
+            rrf_k=retrieval.get("rrf_k", 60),
+        )
+        self._token_counter: Optional[TokenCounter] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._parse_slots = threading.BoundedSemaphore(self.max_files_in_flight)
+
+    @property
+    def token_counter(self) -> TokenCounter:
+        """Token offsets from the embedding model's own tokenizer, so chunk budgets match what it sees"""
+        if self._token_counter is None:
+            self._token_counter = TokenCounter.for_embedder(self.embedder)
+        return self._token_counter
+
+    def _parse_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._pool
+
+    def reload(self) -> None:
+        """Re-read the manifest and BM25 index that another process may have written since they were loaded"""
+        self.manifest.reload()
+        if self.lexical is not None:
+            self.lexical.refresh()
+
+    def close(self) -> None:
+        """Shut down the parse worker processes"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+    def parsed_documents(self, files: List[str], failed: Optional[List[str]] = None) -> Iterator[tuple]:
+        """Yield (filepath, batches) as workers finish the first pages of each file; files that fail to parse go to `failed`.
+
+        `batches` yields partition_file's results (elements plus the strategy
+        and timing of each page), one batch of pages at a time: the next batch
+        is parsed while the caller chunks the current one. It raises if a later
+        batch fails, and must be consumed before the next file is taken.
+        """
+        pool = self._parse_pool()
+        pending = {}
+
+        def parse(filepath: str, first_page: int = 0):
+            # Shared with concurrent ingest calls: blocks while max_files_in_flight batches are parsing
+            self._parse_slots.acquire()
+            future = pool.submit(partition_file, filepath, self.partition_settings, first_page)
+            future.add_done_callback(lambda _: self._parse_slots.release())
+            return future
+
+        def batches(filepath: str, parsed: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+            while True:
+                following = parse(filepath, parsed["next_page"]) if parsed["next_page"] is not None else None
+                yield parsed
+                if following is None:
+                    return
+                parsed = following.result()
+
+        file_iter = iter(files)
+        for filepath in islice(file_iter, self.max_workers * 2):
+            pending[parse(filepath)] = filepath
+        while pending:
+            done_futures, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done_futures:
+                filepath = pending.pop(future)
+                for next_path in islice(file_iter, 1):
+                    pending[parse(next_path)] = next_path
+                try:
+                    parsed = future.result()
+                except Exception as e:
+                    logger.error("Failed to parse %s: %s", filepath, str(e))
+                    if failed is not None:
+                        failed.append(filepath)
+                    continue
+                yield filepath, batches(filepath, parsed)
+
+    @property
+    def chunker(self) -> Dict[str, Any]:
+        """Settings that shape the chunks; recorded in the manifest so a change re-chunks every document"""
+        return {
+            "method": self.method,
+            "max_tokens": self.settings.get("chunk_max_tokens", 128),
+            "overlap_tokens": self.settings.get("chunk_overlap_tokens", 32),
+            "min_chars": self.settings.get("min_chunk", 25),
+            # Token budgets are counted with the embedding model's tokenizer
+            "embedding_model": self.settings["embedding_model"],
+        }
+
+    def chunks(
+        self, filepath: str, elements: Iterable[Dict[str, Any]], payload: Optional[Dict[str, Any]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Stream chunk records of one document with their payload metadata"""
+        processed_at = datetime.now(timezone.utc).isoformat()
+        chunker = self.chunker
+        chunks = chunk_elements(
+            elements,
+            self.token_counter,
+            method=chunker["method"],
+            max_tokens=chunker["max_tokens"],
+            overlap_tokens=chunker["overlap_tokens"],
+            min_chars=chunker["min_chars"],
+        )
+        for chunk_index, chunk in enumerate(chunks):
+            yield {
+                **chunk,
+                "source": filepath,
+                "method": self.method,
+                "chunk_index": chunk_index,
+                "processed_at": processed_at,
+                **(payload or {}),
+            }
+
+    def changed_chunks(
+        self,
+        files: List[str],
+        stats: Dict[str, Any],
+        payload: Optional[Dict[str, Any]] = None,
+        progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+        finished: Optional[List[tuple]] = None,
+    ) -> Iterator[tuple]:
+        """Yield (point_id, record) for chunks not yet indexed; stale vectors are deleted as we go.
+
+        Once all of a file's chunks have been yielded, its manifest entry is
+        appended to `finished` (or recorded right away without it): the caller
+        records it only after those chunks are written.
+        """
+        chunker = self.chunker
+        digests = {}
+        to_parse = []
+        for filepath in files:
+            digests[filepath] = file_hash(filepath)
+            if self.manifest.is_unchanged(filepath, digests[filepath], chunker, payload):
+                stats["files_unchanged"] += 1
+            else:
+                to_parse.append(filepath)
+
+        for filepath, batches in self.parsed_documents(to_parse, stats["failed"]):
+            pages, errors = [], []
+
+            def elements() -> Iterator[Dict[str, Any]]:
+                # Pages are chunked as their batch arrives; only one batch's elements are held
+                try:
+                    for parsed in batches:
+                        for page in parsed["pages"]:
+                            stats["pages_parsed"] += 1
+                            stats["pages_by_strategy"][page["strategy"]] = stats["pages_by_strategy"].get(page["strategy"], 0) + 1
+                            stats["parse_ms_by_strategy"][page["strategy"]] = round(
+                                stats["parse_ms_by_strategy"].get(page["strategy"], 0.0) + page["ms"], 1
+                            )
+                        pages.extend(parsed["pages"])
+                        if progress is not None:
+                            progress(dict(stats))
+                        yield from parsed["elements"]
+                except Exception as e:
+                    errors.append(e)
+
+            previous = (self.manifest.get(filepath) or {}).get("chunks", {})
+            # Chunks stored with other settings or another payload are all rewritten, not just new text
+            reusable = previous if self.manifest.same_settings(filepath, chunker, payload) else {}
+            current = {}
+            for record in self.chunks(filepath, elements(), payload):
+                digest = chunk_hash(record["text"])
+                if digest in current:
+                    continue  # identical text within one document is stored once
+                current[digest] = point_id(filepath, digest)
+                if digest in reusable:
+                    stats["chunks_unchanged"] += 1
+                    continue
+                yield current[digest], record
+            if errors:
+                # A later batch of pages failed: the file stays unrecorded, so a retry parses it again
+                logger.error("Failed to parse %s: %s", filepath, str(errors[0]))
+                stats["failed"].append(filepath)
+                continue
+
+            removed = [pid for digest, pid in previous.items() if digest not in current]
+            self._delete(removed)
+            stats["chunks_deleted"] += len(removed)
+            entry = (filepath, digests[filepath], current, pages, chunker, payload)
+            if finished is not None:
+                finished.append(entry)
+            else:
+                self.manifest.update(*entry)
+                stats["files_indexed"] += 1
+
+    def _delete(self, ids: List[str]) -> None:
+        self.store.delete(ids)
+        if self.lexical is not None:
+            self.lexical.remove(ids)
+
+    def ingest(
+        self,
+        paths: Iterable[str],
+        payload: Optional[Dict[str, Any]] = None,
+        progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """Index `paths`; `payload` fields (e.g. {"thread_id": ...}) are added to every chunk.
+
+        `progress` is called (from this thread) with a snapshot of the stats
+        after each parsed document and each written batch. Files that failed
+        to parse are listed in stats["failed"].
+        """
+        started = time.perf_counter()
+        paths = list(paths)
+        files = discover_files(paths)
+        self.store.ensure_collection()
+        stats: Dict[str, Any] = dict.fromkeys(
+            ("files_indexed", "files_unchanged", "files_removed", "pages_parsed", "chunks_embedded",
+             "chunks_unchanged", "chunks_deleted", "vectors_written"), 0
+        )
+        stats["files_total"] = len(files)
+        stats["pages_by_strategy"] = {}
+        stats["parse_ms_by_strategy"] = {}
+        stats["failed"] = []
+
+        # Documents that were indexed from these paths but no longer exist
+        for source in set(self.manifest.sources_under(paths)) - set(files):
+            removed = self.manifest.remove(source)
+            self._delete(removed)
+            stats["files_removed"] += 1
+            stats["chunks_deleted"] += len(removed)
+
+        # A file is only marked as indexed once all of its chunks are written: if embedding or
+        # upserting fails, a retry of the job must not skip it as unchanged
+        finished: List[tuple] = []
+
+        def record_finished() -> None:
+            # Every chunk of a finished file was yielded before the batch being written was complete
+            for entry in finished:
+                self.manifest.update(*entry)
+                stats["files_indexed"] += 1
+            finished.clear()
+
+        for batch in batched(self.changed_chunks(files, stats, payload, progress, finished), self.embed_batch_size):
+            ids, records = zip(*batch)
+            vectors = self.embedder.embed_documents([r["text"] for r in records])
+            stats["chunks_embedded"] += len(batch)
+            self.store.upsert(list(ids), vectors, list(records))
+            if self.lexical is not None:
+                self.lexical.add(list(ids), [r["text"] for r in records], list(records))
+            stats["vectors_written"] += len(batch)
+            record_finished()
+            if progress is not None:
+                progress(dict(stats))
+        record_finished()
+
+        self.store.flush()
+        if self.lexical is not None:
+            self.lexical.save()
+        self.manifest.save()
+        stats["seconds"] = round(time.perf_counter() - started, 2)
+        logger.info("Ingestion finished: %s", stats)
+        if progress is not None:
+            progress(dict(stats))
+        return stats
+
+    def retrieve(self, query: str, top_k: Optional[int] = None, filters: Optional[Dict[str, Any]] = None) -> RetrievalResult:
+        """Hits plus per-stage timings (embed, search, fuse, dedupe, rerank)"""
+        result = self.retriever.retrieve(query, top_k or self.top_k, filters)
+        logger.info("Retrieval timings: %s", result.timings)
+        return result
+
+    def search(self, query: str, top_k: Optional[int] = None, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        return self.retrieve(query, top_k, filters).hits
+
+
+if __name__ == "__main__":
+    # python -m backend.rag.rag data/files
+    parser = argparse.ArgumentParser(description="Ingest documents into the RAG vector store")
+    parser.add_argument("paths", nargs="+", help="files or directories to ingest")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    pipeline = IngestionPipeline()
+    try:
+        print(pipeline.ingest(args.paths))
+    finally:
+        pipeline.close()
@@ -0,0 +1,128 @@
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def shingles(text: str, size: int = 3) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def dedupe(candidates: List[Dict[str, Any]], threshold: float = 0.8) -> List[Dict[str, Any]]:
+    """Drop candidates whose word shingles are mostly contained in a better-ranked one.
+
+    Overlapping sliding-window chunks share most of their text; containment
+    (|A & B| / min(|A|, |B|)) catches them even when lengths differ.
+    """
+    kept, kept_shingles = [], []
+    for hit in candidates:
+        current = shingles(hit.get("text", ""))
+        duplicate = any(
+            len(current & other) / max(1, min(len(current), len(other))) >= threshold
+            for other in kept_shingles
+        )
+        if not duplicate:
+            kept.append(hit)
+            kept_shingles.append(current)
+    return kept
+
+
+class Reranker:
+    """Small CPU cross-encoder that re-scores retrieval candidates under a latency budget.
+
+    Candidates are scored in batches; once the next batch would not fit in
+    `budget_ms`, the rest keep their retrieval order behind the scored ones.
+    The budget covers waiting for the model, which scores one batch at a
+    time across concurrent queries: a query that cannot get it in time keeps
+    retrieval order.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+        candidates: int = 50,
+        batch_size: int = 16,
+        budget_ms: float = 150.0,
+        dedup_threshold: float = 0.8,
+        enabled: bool = True,
+    ):
+        self.model_name = model_name
+        self.candidates = candidates
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self.dedup_threshold = dedup_threshold
+        self.enabled = enabled
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._lock = threading.Lock()  # one predict at a time
+        self._batch_seconds = 0.0  # moving average of one batch's predict time, to check the budget before a batch
+
+    @classmethod
+    def from_config(cls, config: dict) -> Optional["Reranker"]:
+        settings = config.get("rerank", {})
+        if not settings.get("enabled", False):
+            return None
+        return cls(**settings)
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    logger.info("Loading re-ranking model %s", self.model_name)
+                    self._model = CrossEncoder(self.model_name, device="cpu")
+        return self._model
+
+    def warm(self) -> None:
+        """Load the model and time one batch: the budget does not cover the cold load, and needs a batch estimate"""
+        model = self.model
+        with self._lock:
+            started = time.perf_counter()
+            model.predict([("warm up", "warm up")] * self.batch_size, batch_size=self.batch_size)
+            self._batch_seconds = time.perf_counter() - started
+
+    def rerank(self, query: str, candidates: List[Dict[str, Any]], top_n: int) -> Tuple[List[Dict[str, Any]], Dict[str, float]]:
+        """Return the best `top_n` candidates and per-stage timings in ms"""
+        started = time.perf_counter()
+        unique = dedupe(candidates, self.dedup_threshold)
+        dedupe_ms = (time.perf_counter() - started) * 1000
+
+        rerank_started = time.perf_counter()
+        deadline = rerank_started + self.budget_ms / 1000
+        scored: List[Tuple[float, Dict[str, Any]]] = []
+        position = 0
+        model = self.model
+        while position < len(unique):
+            remaining = deadline - time.perf_counter()
+            if remaining < self._batch_seconds or not self._lock.acquire(timeout=max(0.0, remaining)):
+                break
+            try:
+                if time.perf_counter() + self._batch_seconds > deadline:
+                    break  # the wait for the model used up the budget
+                batch = unique[position:position + self.batch_size]
+                batch_started = time.perf_counter()
+                scores = model.predict([(query, hit.get("text", "")) for hit in batch], batch_size=self.batch_size)
+                elapsed = time.perf_counter() - batch_started
+            finally:
+                self._lock.release()
+            self._batch_seconds = elapsed if not self._batch_seconds else 0.8 * self._batch_seconds + 0.2 * elapsed
+            scored.extend((float(score), hit) for score, hit in zip(scores, batch))
+            position += len(batch)
+
+        scored.sort(key=lambda item: item[0], reverse=True)
+        ranked = [{**hit, "rerank_score": score} for score, hit in scored] + unique[position:]
+        timings = {
+            "dedupe_ms": round(dedupe_ms, 2),
+            "rerank_ms": round((time.perf_counter() - rerank_started) * 1000, 2),
+            "candidates": len(candidates),
+            "unique": len(unique),
+            "scored": position,
+        }
+        return ranked[:top_n], timings
@@ -0,0 +1,128 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from backend.rag.bm25 import BM25Index
+from backend.rag.rerank import Reranker
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], k: int = 60) -> List[Dict[str, Any]]:
+    """Merge ranked lists: score(d) = sum over lists of 1 / (k + rank of d)"""
+    fused: Dict[str, Dict[str, Any]] = {}
+    for list_index, results in enumerate(result_lists):
+        for rank, hit in enumerate(results, start=1):
+            entry = fused.setdefault(hit["id"], {**hit, "score": 0.0, "ranks": {}})
+            entry["score"] += 1.0 / (k + rank)
+            entry["ranks"][list_index] = rank
+    return sorted(fused.values(), key=lambda hit: hit["score"], reverse=True)
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+@dataclass
+class RetrievalResult:
+    hits: List[Dict[str, Any]]
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+class HybridRetriever:
+    """Dense + BM25 retrieval merged with reciprocal-rank fusion, optionally re-ranked.
+
+    Exact identifiers, names and acronyms that embeddings blur are caught by
+    the lexical side, so a small `top_k` is enough and prompts stay short.
+    With a `reranker`, `reranker.candidates` fused hits are over-fetched,
+    deduplicated and re-scored before the best `top_k` are returned.
+    """
+
+    def __init__(
+        self,
+        embedder,
+        store,
+        lexical: Optional[BM25Index] = None,
+        reranker: Optional[Reranker] = None,
+        dense_k: int = 20,
+        lexical_k: int = 20,
+        rrf_k: int = 60,
+    ):
+        self.embedder = embedder
+        self.store = store
+        self.lexical = lexical
+        self.reranker = reranker
+        self.dense_k = dense_k
+        self.lexical_k = lexical_k
+        self.rrf_k = rrf_k
+
+    def _fetch_sizes(self, top_k: int) -> tuple:
+        """How many candidates to fuse, and to ask each side for"""
+        pool = max(top_k, self.reranker.candidates) if self.reranker else top_k
+        return pool, max(self.dense_k, pool), max(self.lexical_k, pool)
+
+    def _fuse(self, dense: List[Dict[str, Any]], lexical: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+        if self.lexical is None:
+            return dense[:limit]
+        fused = reciprocal_rank_fusion([dense, lexical], self.rrf_k)[:limit]
+        for hit in fused:
+            ranks = hit.pop("ranks")
+            hit["dense_rank"], hit["lexical_rank"] = ranks.get(0), ranks.get(1)
+        return fused
+
+    def _finish(self, query: str, fused: List[Dict[str, Any]], top_k: int, timings: Dict[str, float]) -> RetrievalResult:
+        if self.reranker is None:
+            return RetrievalResult(fused[:top_k], timings)
+        hits, rerank_timings = self.reranker.rerank(query, fused, top_k)
+        timings.update(rerank_timings)
+        return RetrievalResult(hits, timings)
+
+    def retrieve(self, query: str, top_k: int = 3, filters: Optional[Dict[str, Any]] = None) -> RetrievalResult:
+        pool, dense_k, lexical_k = self._fetch_sizes(top_k)
+        timings: Dict[str, float] = {}
+
+        started = time.perf_counter()
+        vector = self.embedder.embed_documents([query])[0]
+        timings["embed_ms"] = _elapsed_ms(started)
+
+        started = time.perf_counter()
+        dense = self.store.search(vector, dense_k, filters)
+        timings["dense_ms"] = _elapsed_ms(started)
+
+        started = time.perf_counter()
+        lexical = self.lexical.search(query, lexical_k, filters) if self.lexical is not None else []
+        timings["lexical_ms"] = _elapsed_ms(started)
+
+        started = time.perf_counter()
+        fused = self._fuse(dense, lexical, pool)
+        timings["fuse_ms"] = _elapsed_ms(started)
+        return self._finish(query, fused, top_k, timings)
+
+    async def aretrieve(self, query: str, top_k: int = 3, filters: Optional[Dict[str, Any]] = None) -> RetrievalResult:
+        """Request-path variant: micro-batched query embedding, CPU work off the event loop"""
+        pool, dense_k, lexical_k = self._fetch_sizes(top_k)
+        timings: Dict[str, float] = {}
+
+        started = time.perf_counter()
+        vector = await self.embedder.aembed_query(query)
+        timings["embed_ms"] = _elapsed_ms(started)
+
+        started = time.perf_counter()
+        dense_task = asyncio.to_thread(self.store.search, vector, dense_k, filters)
+        if self.lexical is None:
+            dense, lexical = await dense_task, []
+        else:
+            dense, lexical = await asyncio.gather(
+                dense_task, asyncio.to_thread(self.lexical.search, query, lexical_k, filters)
+            )
+        timings["search_ms"] = _elapsed_ms(started)
+
+        started = time.perf_counter()
+        fused = self._fuse(dense, lexical, pool)
+        timings["fuse_ms"] = _elapsed_ms(started)
+        return await asyncio.to_thread(self._finish, query, fused, top_k, timings)
+
+    def search(self, query: str, top_k: int = 3, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        return self.retrieve(query, top_k, filters).hits
+
+    async def asearch(self, query: str, top_k: int = 3, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        return (await self.aretrieve(query, top_k, filters)).hits
@@ -0,0 +1,253 @@
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+import orjson
+
+logger = logging.getLogger(__name__)
+
+FilterValue = Union[str, int, Sequence[Union[str, int]]]
+
+
+class LocalVectorIndex:
+    """Embedded vector index: normalized float32 embeddings in one memory-mapped matrix.
+
+    Top-k is a single matrix-vector (or matrix-matrix for batched queries)
+    product followed by `argpartition`. Payload fields listed in
+    `filter_fields` get an inverted index (value -> row ids), so filtered
+    searches only score the matching rows instead of post-filtering.
+
+    Files under `directory`: vectors.f32 (rows x dim) and meta.json (ids,
+    payloads, deleted rows). Nothing runs outside this process.
+
+    Deleted rows are tombstoned and reused by later upserts; once they pass
+    `compact_ratio` of the rows, `flush` packs the live rows to the front.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        vector_size: int,
+        filter_fields: Iterable[str] = ("source", "page"),
+        initial_capacity: int = 1024,
+        compact_ratio: float = 0.25,
+    ):
+        self.directory = directory
+        self.collection = os.path.basename(os.path.normpath(directory))
+        self.vector_size = vector_size
+        self.filter_fields = tuple(filter_fields)
+        self.initial_capacity = initial_capacity
+        self.compact_ratio = compact_ratio
+
+        self.ids: List[str] = []
+        self.payloads: List[Dict[str, Any]] = []
+        self.deleted = set()  # tombstoned rows, never returned by search, reused by upsert
+        self.row_of: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[Any, set]] = {f: {} for f in self.filter_fields}
+        self._posting_arrays: Dict[tuple, np.ndarray] = {}
+        self.matrix: Optional[np.memmap] = None
+        self._lock = threading.RLock()  # writers may run in a background ingestion thread
+
+    # ---------- storage ----------
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.directory, "vectors.f32")
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "meta.json")
+
+    @property
+    def count(self) -> int:
+        return len(self.ids)
+
+    def ensure_collection(self) -> None:
+        """Open the index on disk, creating it if needed"""
+        with self._lock:
+            if self.matrix is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            if os.path.exists(self._meta_path):
+                with open(self._meta_path, "rb") as f:
+                    meta = orjson.loads(f.read())
+                self.ids, self.payloads = meta["ids"], meta["payloads"]
+                self.deleted = set(meta.get("deleted", []))
+                capacity = meta["capacity"]
+                self.matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.vector_size))
+            else:
+                self.matrix = np.memmap(
+                    self._vectors_path, dtype=np.float32, mode="w+", shape=(self.initial_capacity, self.vector_size)
+                )
+            self.row_of = {pid: row for row, pid in enumerate(self.ids) if row not in self.deleted}
+            for row, payload in enumerate(self.payloads):
+                if row not in self.deleted:
+                    self._index_payload(row, payload)
+
+    def _grow(self, needed: int) -> None:
+        capacity = self.matrix.shape[0]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        self.matrix.flush()
+        del self.matrix
+        with open(self._vectors_path, "r+b") as f:
+            f.truncate(capacity * self.vector_size * 4)
+        self.matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.vector_size))
+
+    def compact(self) -> None:
+        """Move live rows to the front of the matrix and drop the tombstones"""
+        with self._lock:
+            self.ensure_collection()
+            if not self.deleted:
+                return
+            live = [row for row in range(self.count) if row not in self.deleted]
+            if live:
+                self.matrix[:len(live)] = self.matrix[live]
+            logger.info("Compacting %s: %d live rows, %d tombstones dropped", self.collection, len(live), len(self.deleted))
+            self.ids = [self.ids[row] for row in live]
+            self.payloads = [self.payloads[row] for row in live]
+            self.deleted = set()
+            self.row_of = {pid: row for row, pid in enumerate(self.ids)}
+            self._postings = {f: {} for f in self.filter_fields}
+            for row, payload in enumerate(self.payloads):
+                self._index_payload(row, payload)
+
+    def flush(self) -> None:
+        """Persist vectors and metadata (metadata is written atomically), compacting first if needed"""
+        with self._lock:
+            if self.matrix is None:
+                return
+            if self.deleted and len(self.deleted) > self.compact_ratio * self.count:
+                self.compact()
+            self.matrix.flush()
+            tmp_path = f"{self._meta_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(orjson.dumps({
+                    "capacity": int(self.matrix.shape[0]),
+                    "ids": self.ids,
+                    "payloads": self.payloads,
+                    "deleted": sorted(self.deleted),
+                }))
+            os.replace(tmp_path, self._meta_path)
+
+    # ---------- payload filters ----------
+    def _index_payload(self, row: int, payload: Dict[str, Any]) -> None:
+        for field in self.filter_fields:
+            values = payload.get(field)
+            for value in values if isinstance(values, list) else [values]:
+                if value is not None:
+                    self._postings[field].setdefault(value, set()).add(row)
+        self._posting_arrays.clear()
+
+    def _unindex_payload(self, row: int, payload: Dict[str, Any]) -> None:
+        for field in self.filter_fields:
+            values = payload.get(field)
+            for value in values if isinstance(values, list) else [values]:
+                rows = self._postings[field].get(value)
+                if rows is not None:
+                    rows.discard(row)
+        self._posting_arrays.clear()
+
+    def _rows_for(self, field: str, value: FilterValue) -> np.ndarray:
+        values = tuple(value) if isinstance(value, (list, tuple, set)) else (value,)
+        key = (field, values)
+        if key not in self._posting_arrays:
+            if field not in self._postings:
+                raise ValueError(f"Field '{field}' is not indexed; add it to filter_fields")
+            rows = set()
+            for v in values:
+                rows |= self._postings[field].get(v, set())
+            self._posting_arrays[key] = np.fromiter(sorted(rows), dtype=np.int64, count=len(rows))
+        return self._posting_arrays[key]
+
+    def _candidate_rows(self, filters: Optional[Dict[str, FilterValue]]) -> Optional[np.ndarray]:
+        """Row ids matching every filter, or None for "all rows" """
+        if not filters:
+            return None
+        rows = None
+        for field, value in filters.items():
+            matched = self._rows_for(field, value)
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        return rows
+
+    # ---------- writes ----------
+    def upsert(self, ids: List[str], vectors, payloads: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self.ensure_collection()
+            vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.vector_size)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1, norms)
+
+            rows = []
+            for pid, payload in zip(ids, payloads):
+                row = self.row_of.get(pid)
+                if row is None and self.deleted:
+                    row = self.deleted.pop()  # reuse a tombstoned slot
+                    self.ids[row], self.payloads[row] = pid, payload
+                    self.row_of[pid] = row
+                elif row is None:
+                    row = len(self.ids)
+                    self.ids.append(pid)
+                    self.payloads.append(payload)
+                    self.row_of[pid] = row
+                else:
+                    self._unindex_payload(row, self.payloads[row])
+                    self.payloads[row] = payload
+                self._index_payload(row, payload)
+                rows.append(row)
+
+            self._grow(len(self.ids))
+            self.matrix[rows] = vectors
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            self.ensure_collection()
+            for pid in ids:
+                row = self.row_of.pop(pid, None)
+                if row is not None:
+                    self._unindex_payload(row, self.payloads[row])
+                    self.deleted.add(row)
+
+    # ---------- reads ----------
+    def search_batch(
+        self, vectors, top_k: int = 3, filters: Optional[Dict[str, FilterValue]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """Top-k for several query vectors at once (one matrix-matrix product)"""
+        with self._lock:
+            self.ensure_collection()
+            queries = np.asarray(vectors, dtype=np.float32).reshape(-1, self.vector_size)
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            queries = queries / np.where(norms == 0, 1, norms)
+
+            rows = self._candidate_rows(filters)
+            if rows is None:
+                candidates = self.matrix[:self.count]
+            else:
+                candidates = self.matrix[rows]
+            if len(candidates) == 0:
+                return [[] for _ in range(len(queries))]
+
+            scores = queries @ candidates.T  # (queries, candidates)
+            if rows is None and self.deleted:
+                scores[:, sorted(self.deleted)] = -np.inf
+
+            k = min(top_k, scores.shape[1])
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            results = []
+            for qi, candidate_ids in enumerate(top):
+                ordered = candidate_ids[np.argsort(-scores[qi, candidate_ids])]
+                hits = []
+                for ci in ordered:
+                    score = float(scores[qi, ci])
+                    if score == -np.inf:
+                        continue
+                    row = int(ci) if rows is None else int(rows[ci])
+                    hits.append({**self.payloads[row], "id": self.ids[row], "score": score})
+                results.append(hits)
+            return results
+
+    def search(self, vector, top_k: int = 3, filters: Optional[Dict[str, FilterValue]] = None) -> List[Dict[str, Any]]:
+        return self.search_batch([vector], top_k, filters)[0]
@@ -0,0 +1,195 @@
+import re
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import xxhash
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(text: str) -> str:
+    """Case-fold, collapse whitespace and drop trailing punctuation"""
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.rstrip(" ?!.")
+
+
+@dataclass
+class CacheEntry:
+    answer: str
+    created_at: float
+    embedding: Optional[np.ndarray] = None
+
+
+@dataclass
+class CacheLookup:
+    """Result of a lookup; `embedding` is reused by `store` on a miss"""
+    answer: Optional[str] = None
+    tier: Optional[str] = None  # "exact" or "semantic"
+    embedding: Optional[np.ndarray] = None
+
+
+@dataclass
+class CacheStats:
+    exact_hits: int = 0
+    semantic_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+
+class ResponseCache:
+    """Two-tier answer cache in front of the LLM.
+
+    The exact tier is keyed by the normalized prompt, the model key and a hash
+    of the system prompt. The semantic tier compares the query embedding with
+    the embeddings of cached prompts and returns an answer above
+    `similarity_threshold`. Both tiers share TTL and LRU eviction.
+
+    Expired entries are dropped on every lookup, oldest first, so neither
+    tier serves a stale answer. The embeddings of cached prompts are kept as
+    rows of one matrix, updated as entries are stored and removed, so a
+    semantic lookup is a single matrix-vector product.
+    """
+
+    def __init__(
+        self,
+        model_key: str,
+        system_prompt: str,
+        embeddings=None,
+        ttl_seconds: float = 3600,
+        max_entries: int = 1000,
+        similarity_threshold: float = 0.92,
+    ):
+        self.namespace = f"{model_key}:{xxhash.xxh64_hexdigest(system_prompt.encode())}"
+        self.embeddings = embeddings  # an EmbeddingService (or anything with `aembed_query`); None disables the semantic tier
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()  # LRU order
+        self._created: "OrderedDict[str, float]" = OrderedDict()  # creation order, for expiry
+        self._matrix: Optional[np.ndarray] = None  # one row per entry with an embedding, rows [0, len(_row_keys))
+        self._row_keys: List[str] = []
+        self._rows: Dict[str, int] = {}
+
+    @classmethod
+    def from_config(cls, config: dict, model_key: str, system_prompt: str) -> Optional["ResponseCache"]:
+        settings = dict(config.get("response_cache", {}))
+        if not settings.pop("enabled", False):
+            return None
+
+        embeddings = None
+        embedding_model = settings.pop("embedding_model", None)
+        if embedding_model:
+            from backend.rag.embeddings import get_embedding_service
+            embeddings = get_embedding_service(embedding_model, config)
+        return cls(model_key, system_prompt, embeddings=embeddings, **settings)
+
+    def _key(self, prompt: str) -> str:
+        return xxhash.xxh64_hexdigest(f"{self.namespace}\0{normalize_prompt(prompt)}".encode())
+
+    def _add_row(self, key: str, embedding: np.ndarray) -> None:
+        count = len(self._row_keys)
+        if self._matrix is None or count == len(self._matrix):
+            # Grow by doubling, up to the entry limit (plus the one stored before eviction)
+            capacity = max(count + 1, min(max(16, 2 * count), self.max_entries + 1))
+            grown = np.empty((capacity, len(embedding)), dtype=np.float32)
+            if self._matrix is not None:
+                grown[:count] = self._matrix[:count]
+            self._matrix = grown
+        self._matrix[count] = embedding
+        self._rows[key] = count
+        self._row_keys.append(key)
+
+    def _remove(self, key: str) -> None:
+        """Drop an entry; the last matrix row moves into its row"""
+        self._entries.pop(key, None)
+        self._created.pop(key, None)
+        row = self._rows.pop(key, None)
+        if row is None:
+            return
+        last_key = self._row_keys.pop()
+        if last_key != key:
+            self._matrix[row] = self._matrix[len(self._row_keys)]
+            self._row_keys[row] = last_key
+            self._rows[last_key] = row
+
+    def _purge_expired(self, now: float) -> None:
+        while self._created:
+            key, created_at = next(iter(self._created.items()))
+            if now - created_at <= self.ttl_seconds:
+                return
+            self._remove(key)
+            self.stats.expirations += 1
+
+    async def lookup(self, prompt: str) -> CacheLookup:
+        now = time.time()
+        self._purge_expired(now)
+        key = self._key(prompt)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.stats.exact_hits += 1
+            return CacheLookup(answer=entry.answer, tier="exact", embedding=entry.embedding)
+
+        if self.embeddings is None:
+            self.stats.misses += 1
+            return CacheLookup()
+
+        query = await self._embed(prompt)
+        self._purge_expired(time.time())  # entries may have expired while the prompt was embedded
+        if query is not None and self._row_keys:
+            scores = self._matrix[:len(self._row_keys)] @ query
+            best = int(np.argmax(scores))
+            if scores[best] >= self.similarity_threshold:
+                best_key = self._row_keys[best]
+                self._entries.move_to_end(best_key)
+                self.stats.semantic_hits += 1
+                return CacheLookup(answer=self._entries[best_key].answer, tier="semantic", embedding=query)
+
+        self.stats.misses += 1
+        return CacheLookup(embedding=query)
+
+    async def store(self, prompt: str, answer: str, embedding: Optional[np.ndarray] = None) -> None:
+        if not answer:
+            return
+        if embedding is None and self.embeddings is not None:
+            embedding = await self._embed(prompt)
+
+        key = self._key(prompt)
+        now = time.time()
+        self._remove(key)
+        self._entries[key] = CacheEntry(answer=answer, created_at=now, embedding=embedding)
+        self._created[key] = now
+        if embedding is not None:
+            self._add_row(key, embedding)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.stats.evictions += 1
+
+    async def _embed(self, prompt: str) -> Optional[np.ndarray]:
+        try:
+            vector = np.asarray(await self.embeddings.aembed_query(normalize_prompt(prompt)), dtype=np.float32)
+        except Exception as e:
+            logger.error("Embedding failed, skipping semantic cache: %s", str(e))
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.stats.exact_hits + self.stats.semantic_hits + self.stats.misses
+        hits = self.stats.exact_hits + self.stats.semantic_hits
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.stats.exact_hits,
+            "semantic_hits": self.stats.semantic_hits,
+            "misses": self.stats.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "evictions": self.stats.evictions,
+            "expirations": self.stats.expirations,
+        }
@@ -0,0 +1,414 @@
+import argparse
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import orjson
+import redis.asyncio as aioredis
+import zstandard
+from langgraph.checkpoint.redis.base import BaseRedisSaver
+from langgraph.checkpoint.redis.key_registry import CheckpointKeyRegistry
+from langgraph.checkpoint.redis.util import from_storage_safe_str, to_storage_safe_id
+from redisvl.query import FilterQuery
+from redisvl.query.filter import Tag
+
+from backend.llm_metrics import TURN_MS_BUCKETS
+from backend.codec import message_from_dict
+from backend.message_log import MessageLog
+from backend.rag.embeddings import Histogram
+from backend.thread_catalog import CATALOG_KEY, ThreadCatalog
+from backend.thread_lock import ThreadLocks
+
+logger = logging.getLogger(__name__)
+
+IDLE_ACTIONS = ("archive", "expire")
+PASS_KEY = "retention:pass"  # claimed by the worker running the current interval's pass
+WATERMARK_KEY = "retention:compacted_until"  # catalog score up to which threads are compacted
+MAX_RESULTS = 10000  # per-thread search limit, as in AsyncRedisSaver.adelete_thread
+
+
+class CheckpointRetention:
+    """Background compaction of LangGraph checkpoints, and expiry of idle threads.
+
+    Every turn (and every aupdate_state) adds a checkpoint, and the Redis
+    saver never deletes any. A pass keeps the `keep_last` newest checkpoints
+    of each thread that changed since the previous pass and deletes the
+    older ones with their pending writes, write registries and any blobs no
+    kept checkpoint refers to. History is not lost: it lives in the message
+    log, and checkpoints only point into it.
+
+    Threads idle for `idle_days` are either archived to a zstd-compressed
+    JSON file under `archive_dir` (messages, metadata and catalog summary)
+    and then deleted, or just deleted ("expire"). Threads are found through
+    the thread catalog, so a pass never scans the keyspace. A thread is only
+    archived or deleted under its thread lock: one with a turn or upload in
+    flight is skipped until a later pass.
+
+    Every worker runs the background task, but each interval's pass is
+    claimed by one of them, and the compaction watermark is kept in Redis.
+    """
+
+    def __init__(
+        self,
+        checkpointer,
+        message_log: MessageLog,
+        catalog: ThreadCatalog,
+        thread_locks: ThreadLocks,
+        keep_last: int = 3,
+        interval_seconds: float = 600.0,
+        idle_days: Optional[float] = None,
+        idle_action: str = "archive",
+        archive_dir: str = "data/archive",
+        batch_size: int = 100,
+        measure_bytes: bool = True,
+        compression_level: int = 10,
+    ):
+        if keep_last < 1:
+            raise ValueError("keep_last must be at least 1: the latest checkpoint is the thread's state")
+        if idle_action not in IDLE_ACTIONS:
+            raise ValueError(f"idle_action must be one of {IDLE_ACTIONS}, got {idle_action!r}")
+        self.checkpointer = checkpointer
+        self.redis: aioredis.Redis = message_log.redis
+        self.message_log = message_log
+        self.catalog = catalog
+        self.thread_locks = thread_locks
+        self.keep_last = keep_last
+        self.interval_seconds = interval_seconds
+        self.idle_days = idle_days
+        self.idle_action = idle_action
+        self.archive_dir = archive_dir
+        self.batch_size = batch_size
+        self.measure_bytes = measure_bytes
+        self.compression_level = compression_level
+        self._task: Optional[asyncio.Task] = None
+        self.stats = defaultdict(int)
+        self.last_pass: Dict[str, Any] = {}
+        self.pass_ms = Histogram(TURN_MS_BUCKETS)
+
+    @classmethod
+    def from_config(
+        cls, config: dict, checkpointer, message_log: MessageLog, catalog: ThreadCatalog, thread_locks: ThreadLocks
+    ) -> "CheckpointRetention":
+        settings = {k: v for k, v in config.get("retention", {}).items() if k != "enabled"}
+        return cls(checkpointer, message_log, catalog, thread_locks, **settings)
+
+    # ========== COMPACTION ==========
+    async def _checkpoints(self, thread_id: str) -> List[Tuple[str, str, float]]:
+        """(checkpoint_ns, checkpoint_id, checkpoint_ts) of every checkpoint of a thread"""
+        results = await self.checkpointer.checkpoints_index.search(FilterQuery(
+            filter_expression=Tag("thread_id") == to_storage_safe_id(thread_id),
+            return_fields=["checkpoint_ns", "checkpoint_id", "checkpoint_ts"],
+            num_results=MAX_RESULTS,
+        ))
+        return [
+            (doc.checkpoint_ns, doc.checkpoint_id, float(getattr(doc, "checkpoint_ts", 0) or 0))
+            for doc in results.docs
+        ]
+
+    async def _stale_keys(self, thread_id: str) -> Tuple[List[str], int]:
+        """Keys of the checkpoints beyond the newest `keep_last` per namespace; also returns how many checkpoints"""
+        by_ns = defaultdict(list)
+        for checkpoint_ns, checkpoint_id, checkpoint_ts in await self._checkpoints(thread_id):
+            by_ns[checkpoint_ns].append((checkpoint_ts, checkpoint_id))
+
+        stale: Set[Tuple[str, str]] = set()
+        kept: List[Tuple[str, str]] = []
+        for checkpoint_ns, checkpoints in by_ns.items():
+            checkpoints.sort(reverse=True)  # newest first; ids are time-ordered too
+            kept += [(checkpoint_ns, checkpoint_id) for _, checkpoint_id in checkpoints[:self.keep_last]]
+            stale |= {(checkpoint_ns, checkpoint_id) for _, checkpoint_id in checkpoints[self.keep_last:]}
+        if not stale:
+            return [], 0
+
+        keys = []
+        for checkpoint_ns, checkpoint_id in stale:
+            keys.append(BaseRedisSaver._make_redis_checkpoint_key(thread_id, checkpoint_ns, checkpoint_id))
+            # Writes are registered under the raw namespace ("" rather than the storage sentinel)
+            keys.append(CheckpointKeyRegistry.make_write_keys_zset_key(
+                thread_id, from_storage_safe_str(checkpoint_ns), checkpoint_id
+            ))
+
+        writes = await self.checkpointer.checkpoint_writes_index.search(FilterQuery(
+            filter_expression=Tag("thread_id") == to_storage_safe_id(thread_id),
+            return_fields=["checkpoint_ns", "checkpoint_id", "task_id", "idx"],
+            num_results=MAX_RESULTS,
+        ))
+        for doc in writes.docs:
+            if (doc.checkpoint_ns, doc.checkpoint_id) in stale:
+                keys.append(BaseRedisSaver._make_redis_checkpoint_writes_key(
+                    thread_id, doc.checkpoint_ns, doc.checkpoint_id, doc.task_id, int(getattr(doc, "idx", 0) or 0)
+                ))
+
+        keys += await self._unreferenced_blobs(thread_id, kept)
+        return keys, len(stale)
+
+    async def _unreferenced_blobs(self, thread_id: str, kept: List[Tuple[str, str]]) -> List[str]:
+        """Blob keys (written by older saver versions) that no kept checkpoint refers to"""
+        blobs = await self.checkpointer.checkpoint_blobs_index.search(FilterQuery(
+            filter_expression=Tag("thread_id") == to_storage_safe_id(thread_id),
+            return_fields=["checkpoint_ns", "channel", "version"],
+            num_results=MAX_RESULTS,
+        ))
+        if not blobs.docs:
+            return []
+
+        referenced = set()
+        for checkpoint_ns, checkpoint_id in kept:
+            checkpoint_tuple = await self.checkpointer.aget_tuple({"configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": from_storage_safe_str(checkpoint_ns),
+                "checkpoint_id": checkpoint_id,
+            }})
+            if checkpoint_tuple is not None:
+                versions = checkpoint_tuple.checkpoint.get("channel_versions", {})
+                referenced |= {(checkpoint_ns, channel, str(version)) for channel, version in versions.items()}
+
+        return [
+            BaseRedisSaver._make_redis_checkpoint_blob_key(thread_id, doc.checkpoint_ns, doc.channel, doc.version)
+            for doc in blobs.docs
+            if (doc.checkpoint_ns, doc.channel, str(doc.version)) not in referenced
+        ]
+
+    async def _delete(self, keys: List[str]) -> Tuple[int, int]:
+        """Delete keys; returns (keys deleted, bytes they used)"""
+        reclaimed = 0
+        if self.measure_bytes:
+            pipe = self.redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.memory_usage(key)
+            reclaimed = sum(size or 0 for size in await pipe.execute(raise_on_error=False) if isinstance(size, int))
+        deleted = 0
+        for start in range(0, len(keys), 500):
+            deleted += await self.redis.delete(*keys[start:start + 500])
+        return deleted, reclaimed
+
+    async def compact_thread(self, thread_id: str) -> Dict[str, int]:
+        """Drop all but the newest `keep_last` checkpoints of one thread"""
+        keys, checkpoints = await self._stale_keys(thread_id)
+        if not keys:
+            return {"checkpoints": 0, "keys": 0, "bytes": 0}
+        deleted, reclaimed = await self._delete(keys)
+        return {"checkpoints": checkpoints, "keys": deleted, "bytes": reclaimed}
+
+    async def _changed_threads(self, since: float, until: float) -> List[str]:
+        """Catalog threads updated in (since, until]"""
+        threads, offset = [], 0
+        while True:
+            batch = await self.redis.zrangebyscore(
+                CATALOG_KEY, f"({since}" if since != float("-inf") else "-inf", until,
+                start=offset, num=self.batch_size
+            )
+            threads += [_decode(t) for t in batch]
+            if len(batch) < self.batch_size:
+                return threads
+            offset += self.batch_size
+
+    # ========== IDLE THREADS ==========
+    def _archive_path(self, thread_id: str) -> str:
+        return os.path.join(self.archive_dir, f"{thread_id}.json.zst")
+
+    async def archive_thread(self, thread_id: str) -> str:
+        """Write a thread's messages, metadata and catalog summary to a compressed file"""
+        document = {
+            "thread_id": thread_id,
+            "archived_at": datetime.now().timestamp(),
+            "summary": await self.catalog.get(thread_id),
+            "metadata": await self.message_log.get_metadata(thread_id),
+            "messages": await self.message_log.entries(thread_id),
+        }
+        path = self._archive_path(thread_id)
+
+        def write():
+            os.makedirs(self.archive_dir, exist_ok=True)
+            compressed = zstandard.ZstdCompressor(level=self.compression_level).compress(orjson.dumps(document))
+            with open(path + ".tmp", "wb") as out:
+                out.write(compressed)
+            os.replace(path + ".tmp", path)
+            return len(compressed)
+        self.stats["archive_bytes"] += await asyncio.to_thread(write)
+        return path
+
+    async def delete_thread(self, thread_id: str) -> None:
+        await self.checkpointer.adelete_thread(thread_id)
+        await self.message_log.delete(thread_id)
+        await self.catalog.remove(thread_id)
+
+    async def expire_idle(self, now: float) -> int:
+        """Archive or delete the threads not updated for `idle_days`"""
+        if self.idle_days is None:
+            return 0
+        cutoff = now - self.idle_days * 86400
+        count = skipped = 0
+        while True:
+            # Expired threads leave the catalog; skipped ones stay in it, ahead of the rest
+            batch = [_decode(t) for t in await self.redis.zrangebyscore(
+                CATALOG_KEY, "-inf", cutoff, start=skipped, num=self.batch_size
+            )]
+            for thread_id in batch:
+                if not await self._expire(thread_id, cutoff):
+                    skipped += 1
+                    continue
+                self.stats["threads_archived" if self.idle_action == "archive" else "threads_expired"] += 1
+                count += 1
+            if len(batch) < self.batch_size:
+                return count
+
+    async def _expire(self, thread_id: str, cutoff: float) -> bool:
+        """Archive and/or delete one idle thread under its lock; False if it is busy or no longer idle"""
+        lock = await self.thread_locks.try_acquire(thread_id)
+        if lock is None:
+            self.stats["threads_busy"] += 1
+            return False
+        try:
+            # A turn may have finished between the catalog read and taking the lock
+            updated_at = await self.redis.zscore(CATALOG_KEY, thread_id)
+            if updated_at is None or updated_at > cutoff:
+                return False
+            if self.idle_action == "archive":
+                await self.archive_thread(thread_id)
+            await self.delete_thread(thread_id)
+            return True
+        finally:
+            await lock.release()
+
+    # ========== BACKGROUND TASK ==========
+    async def run_once(self) -> Dict[str, Any]:
+        """One pass: expire idle threads, then compact the threads that changed since the last pass"""
+        started = time.perf_counter()
+        now = datetime.now().timestamp()
+        result = {"threads": 0, "checkpoints": 0, "keys": 0, "bytes": 0}
+
+        result["idle"] = await self.expire_idle(now)
+        compacted_until = await self.redis.get(WATERMARK_KEY)
+        since = float(compacted_until) if compacted_until is not None else float("-inf")
+        for thread_id in await self._changed_threads(since, now):
+            try:
+                compacted = await self.compact_thread(thread_id)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error("Error compacting thread %s: %s", thread_id, str(e))
+                continue
+            result["threads"] += 1
+            for field in ("checkpoints", "keys", "bytes"):
+                result[field] += compacted[field]
+        await self.redis.set(WATERMARK_KEY, now)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.pass_ms.observe(elapsed_ms)
+        self.stats["passes"] += 1
+        self.stats["threads_compacted"] += result["threads"]
+        self.stats["checkpoints_deleted"] += result["checkpoints"]
+        self.stats["keys_deleted"] += result["keys"]
+        self.stats["bytes_reclaimed"] += result["bytes"]
+        self.last_pass = {**result, "at": now, "ms": round(elapsed_ms, 1)}
+        logger.info(
+            "Retention pass: %d threads, %d checkpoints (%d keys, %d bytes) deleted, %d idle threads %s in %.0fms",
+            result["threads"], result["checkpoints"], result["keys"], result["bytes"], result["idle"],
+            "archived" if self.idle_action == "archive" else "expired", elapsed_ms
+        )
+        return result
+
+    async def _claim_pass(self) -> bool:
+        """Only one worker runs each interval's pass: whichever sets the pass key first (it expires with the interval)"""
+        return bool(await self.redis.set(PASS_KEY, os.getpid(), nx=True, px=max(1, int(self.interval_seconds * 1000))))
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                if await self._claim_pass():
+                    await self.run_once()
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error("Retention pass error: %s", str(e))
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="checkpoint-retention")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "keep_last": self.keep_last,
+            "idle_days": self.idle_days,
+            "idle_action": self.idle_action,
+            **{field: self.stats[field] for field in (
+                "passes", "threads_compacted", "checkpoints_deleted", "keys_deleted", "bytes_reclaimed",
+                "threads_archived", "threads_expired", "threads_busy", "archive_bytes", "errors",
+            )},
+            "last_pass": self.last_pass,
+            "pass_ms": self.pass_ms.snapshot(),
+        }
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+async def restore(redis_uri: str, path: str) -> str:
+    """Put an archived thread back into the message log and the catalog"""
+    with open(path, "rb") as f:
+        document = orjson.loads(zstandard.ZstdDecompressor().decompress(f.read()))
+    client = aioredis.Redis.from_url(redis_uri)
+    thread_id = document["thread_id"]
+    await MessageLog(client).replace(
+        thread_id, [message_from_dict(entry) for entry in document["messages"]], document["metadata"]
+    )
+
+    # The checkpoint is not archived: the next turn starts a fresh one pointing at the log
+    summary = document["summary"]
+    await ThreadCatalog(client).upsert(
+        thread_id,
+        title=summary.get("title", document["metadata"].get("title", "New Chat")),
+        created_at=float(summary["created_at"]) if summary.get("created_at") else None,
+        updated_at=float(summary.get("updated_at") or document["archived_at"]),
+        message_count=len(document["messages"]),
+    )
+    await client.aclose()
+    return thread_id
+
+
+async def run_once(redis_uri: str, config: dict) -> Dict[str, Any]:
+    from langgraph.checkpoint.redis.aio import AsyncRedisSaver
+
+    async with AsyncRedisSaver.from_conn_string(redis_uri) as checkpointer:
+        await checkpointer.asetup()
+        client = aioredis.Redis.from_url(redis_uri)
+        retention = CheckpointRetention.from_config(
+            config, checkpointer, MessageLog(client), ThreadCatalog(client), ThreadLocks.from_config(config, client)
+        )
+        try:
+            return await retention.run_once()
+        finally:
+            await client.aclose()
+
+
+if __name__ == "__main__":
+    # python -m backend.retention --once | --restore data/archive/<thread_id>.json.zst
+    from backend.config_loader import load_config
+
+    parser = argparse.ArgumentParser(description="Checkpoint retention")
+    parser.add_argument("--once", action="store_true", help="run one compaction / expiry pass")
+    parser.add_argument("--restore", metavar="ARCHIVE", help="restore an archived thread")
+    parser.add_argument("--redis-uri", default="redis://localhost:6379")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.once:
+        print(asyncio.run(run_once(args.redis_uri, load_config())))
+    elif args.restore:
+        print(f"Restored thread {asyncio.run(restore(args.redis_uri, args.restore))}")
+    else:
+        parser.print_help()
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Deque, Dict, Mapping, Optional
+
+from backend.llm_metrics import TURN_MS_BUCKETS
+from backend.rag.embeddings import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """The generation queue (or this key's share of it) is full"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """One generation request: queued until it is granted a slot, then holds it until released"""
+
+    __slots__ = ("key", "enqueued_at", "granted_at", "released", "_granted")
+
+    def __init__(self, key: str):
+        self.key = key
+        self.enqueued_at = time.monotonic()
+        self.granted_at: Optional[float] = None
+        self.released = False
+        self._granted = asyncio.Event()
+
+    @property
+    def granted(self) -> bool:
+        return self.granted_at is not None
+
+
+class GenerationScheduler:
+    """Admission control in front of the LLM.
+
+    At most `slots` generations run at once. Waiting requests are queued per
+    key (the client, see client_key) and served round-robin across keys, so a
+    client that sends many requests, on however many threads, only delays its
+    own turns. A key per thread would not do: the thread lock lets only one
+    turn per thread reach the queue. New requests are rejected with QueueFull
+    once `max_queue` requests wait in total, or `max_queue_per_key` for one key.
+    """
+
+    def __init__(
+        self,
+        slots: int = 4,
+        max_queue: int = 64,
+        max_queue_per_key: int = 4,
+        position_interval_ms: int = 1000,
+        initial_generation_seconds: float = 10.0,
+        key_header: Optional[str] = None,
+    ):
+        self.slots = slots
+        self.max_queue = max_queue
+        self.max_queue_per_key = max_queue_per_key
+        self.position_interval_ms = position_interval_ms
+        self.key_header = key_header
+        self.active = 0
+        self.queued = 0
+        self.rejected = 0
+        self._queues: "OrderedDict[str, Deque[Ticket]]" = OrderedDict()  # key order is the round-robin order
+        self._avg_generation_seconds = initial_generation_seconds  # EWMA, for Retry-After
+        self.wait_ms = Histogram(TURN_MS_BUCKETS)
+        self.generation_ms = Histogram(TURN_MS_BUCKETS)
+
+    @classmethod
+    def from_config(cls, config: dict) -> "GenerationScheduler":
+        return cls(**config.get("scheduler", {}))
+
+    def client_key(self, headers: Mapping[str, str], host: Optional[str]) -> str:
+        """Queue key of a request: the `key_header` value if set and present, else the client address.
+
+        Behind a proxy every request comes from the proxy's address, so set
+        key_header to the header carrying the client (e.g. X-Forwarded-For, or
+        a user id set by the auth layer).
+        """
+        if self.key_header:
+            value = headers.get(self.key_header)
+            if value:
+                return value.split(",")[0].strip()  # X-Forwarded-For: the original client comes first
+        return host or "unknown"
+
+    def retry_after(self) -> int:
+        """Seconds until a new request would probably be admitted"""
+        return max(1, math.ceil((self.queued + 1) / self.slots * self._avg_generation_seconds))
+
+    # ========== QUEUE ==========
+    def enqueue(self, key: str) -> Ticket:
+        """Grant a slot right away or queue the request; raises QueueFull instead of queueing past the limits"""
+        ticket = Ticket(key)
+        if self.active < self.slots and not self.queued:
+            self._grant(ticket)
+            return ticket
+
+        queue = self._queues.get(key)
+        if self.queued >= self.max_queue or (queue is not None and len(queue) >= self.max_queue_per_key):
+            self.rejected += 1
+            raise QueueFull(f"Generation queue full ({self.queued} waiting)", self.retry_after())
+        if queue is None:
+            queue = self._queues[key] = deque()
+        queue.append(ticket)
+        self.queued += 1
+        return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        """Requests served before this one under round-robin order (0: next in line)"""
+        if ticket.granted:
+            return 0
+        queue = self._queues.get(ticket.key)
+        if queue is None or ticket not in queue:
+            return 0
+        index = queue.index(ticket)
+        ahead = index
+        before = True  # keys ahead of ours in this round get one more turn than we do
+        for key, other in self._queues.items():
+            if key == ticket.key:
+                before = False
+                continue
+            ahead += min(len(other), index + 1 if before else index)
+        return ahead
+
+    def _grant(self, ticket: Ticket) -> None:
+        self.active += 1
+        ticket.granted_at = time.monotonic()
+        wait_ms = (ticket.granted_at - ticket.enqueued_at) * 1000
+        self.wait_ms.observe(wait_ms)
+        ticket._granted.set()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to the head of each key's queue in turn"""
+        while self.active < self.slots and self._queues:
+            key, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            self.queued -= 1
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            self._grant(ticket)
+
+    def _withdraw(self, ticket: Ticket) -> None:
+        queue = self._queues.get(ticket.key)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            self.queued -= 1
+            if not queue:
+                del self._queues[ticket.key]
+
+    async def wait(self, ticket: Ticket) -> AsyncIterator[int]:
+        """Yield the ticket's queue position whenever it changes, until a slot is granted.
+
+        If the waiter goes away (client disconnect), the ticket leaves the queue.
+        """
+        last = None
+        try:
+            while not ticket.granted:
+                position = self.position(ticket)
+                if position != last:
+                    last = position
+                    yield position
+                try:
+                    await asyncio.wait_for(ticket._granted.wait(), self.position_interval_ms / 1000)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if not ticket.granted:
+                self._withdraw(ticket)
+
+    def release(self, ticket: Ticket) -> None:
+        """Give the slot back (idempotent; also withdraws a ticket that never got one)"""
+        if ticket.released:
+            return
+        ticket.released = True
+        if not ticket.granted:
+            self._withdraw(ticket)
+            return
+
+        generation_seconds = time.monotonic() - ticket.granted_at
+        self.generation_ms.observe(generation_seconds * 1000)
+        self._avg_generation_seconds = 0.8 * self._avg_generation_seconds + 0.2 * generation_seconds
+        logger.info(
+            "Generation for %s: waited %.0fms, generated in %.0fms",
+            ticket.key, (ticket.granted_at - ticket.enqueued_at) * 1000, generation_seconds * 1000
+        )
+        self.active -= 1
+        self._dispatch()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "slots": self.slots,
+            "active": self.active,
+            "queued": self.queued,
+            "queued_keys": len(self._queues),
+            "rejected": self.rejected,
+            "retry_after_seconds": self.retry_after(),
+            "queue_wait_ms": self.wait_ms.snapshot(),
+            "generation_ms": self.generation_ms.snapshot(),
+        }
@@ -0,0 +1,183 @@
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+from backend.config_loader import load_config
+
+# Marks the end of the upstream token stream inside the buffer queue
+_DONE = object()
+
+T = TypeVar("T")
+
+# Cleanup tasks that must outlive a cancelled response (the loop only holds weak references)
+_detached = set()
+
+
+class ClientDisconnected(Exception):
+    """The SSE client went away; the stream it was reading has been closed"""
+
+
+@dataclass
+class FlushPolicy:
+    """When to turn buffered tokens into one SSE frame.
+
+    A frame is sent when `flush_interval_ms` has passed since the first
+    buffered token or when the buffer reaches `max_frame_bytes`, whichever
+    comes first. The very first token is always sent on its own so
+    time-to-first-token is not delayed by the window.
+    """
+    flush_interval_ms: float = 30.0
+    max_frame_bytes: int = 1024
+    # Tokens buffered between the LLM and the client. When the client reads
+    # slowly the queue fills up and we stop pulling from the LLM (backpressure)
+    max_pending_tokens: int = 256
+
+    @classmethod
+    def from_config(cls, config: Optional[dict] = None) -> "FlushPolicy":
+        config = config if config is not None else load_config()
+        return cls(**config.get("streaming", {}).get("flush", {}))
+
+
+@dataclass
+class DisconnectPolicy:
+    """What to do when the client of a streamed answer disconnects.
+
+    Generation is always aborted. `on_disconnect` decides what is kept:
+    "truncate" saves the part already streamed, marked as truncated;
+    "discard" saves nothing of the turn.
+    """
+    on_disconnect: str = "truncate"
+    poll_interval_ms: float = 250.0
+
+    def __post_init__(self):
+        if self.on_disconnect not in ("truncate", "discard"):
+            raise ValueError(f"Unknown on_disconnect mode: {self.on_disconnect}")
+
+    @classmethod
+    def from_config(cls, config: Optional[dict] = None) -> "DisconnectPolicy":
+        config = config if config is not None else load_config()
+        return cls(**config.get("streaming", {}).get("disconnect", {}))
+
+
+def detach(coro) -> asyncio.Task:
+    """Run `coro` in its own task; `await asyncio.shield(detach(...))` finishes it even if we are cancelled"""
+    task = asyncio.ensure_future(coro)
+    _detached.add(task)
+    task.add_done_callback(_detached.discard)
+    return task
+
+
+def sse_frame(payload: dict) -> str:
+    """Encode one server-sent event"""
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+async def coalesce_tokens(tokens: AsyncIterator[str], policy: FlushPolicy) -> AsyncIterator[str]:
+    """Batch an async stream of tokens into larger chunks according to `policy`"""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=policy.max_pending_tokens)
+
+    async def pump():
+        try:
+            async for token in tokens:
+                if token:
+                    await queue.put(token)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(_DONE)
+
+    producer = asyncio.create_task(pump())
+    window = policy.flush_interval_ms / 1000
+    first_sent = False
+    buffer, size, deadline = [], 0, None
+
+    try:
+        while True:
+            if buffer:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    item = None
+                else:
+                    try:
+                        item = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        item = None
+            else:
+                item = await queue.get()
+
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+
+            if item is not None:
+                if not first_sent:
+                    first_sent = True
+                    yield item
+                    continue
+                if not buffer:
+                    deadline = time.monotonic() + window
+                buffer.append(item)
+                size += len(item.encode())
+
+            if buffer and (item is None or size >= policy.max_frame_bytes):
+                yield "".join(buffer)
+                buffer, size = [], 0
+
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        # Stop pulling from the LLM and close its stream before returning,
+        # so an abandoned answer frees the upstream request right away
+        producer.cancel()
+        await asyncio.wait({producer})
+        aclose = getattr(tokens, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+async def until_disconnected(
+    stream: AsyncIterator[T], is_disconnected: Callable[[], Awaitable[bool]], poll_interval_ms: float = 250.0
+) -> AsyncIterator[T]:
+    """Relay `stream` while the client is connected.
+
+    The client is polled while we wait for the next item, not only when a
+    frame is written, so a disconnect during a long prompt evaluation or
+    queue wait is noticed too. On disconnect `stream` is cancelled and
+    closed, and ClientDisconnected is raised.
+    """
+    async def watch():
+        while not await is_disconnected():
+            await asyncio.sleep(poll_interval_ms / 1000)
+
+    watcher = asyncio.create_task(watch())
+    step = None
+    try:
+        while True:
+            step = asyncio.ensure_future(stream.__anext__())
+            await asyncio.wait({step, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not step.done():
+                raise ClientDisconnected()
+            try:
+                item = step.result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        watcher.cancel()
+        if step is not None and not step.done():
+            step.cancel()
+        # Starlette may be cancelling us (disconnect noticed on its side): close in a task of its own
+        await asyncio.shield(detach(_close_after(step, stream)))
+
+
+async def _close_after(step: Optional[asyncio.Future], stream: AsyncIterator) -> None:
+    if step is not None:
+        await asyncio.wait({step})
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        await aclose()
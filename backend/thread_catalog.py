@@ -0,0 +1,200 @@
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis.asyncio as aioredis
+from langchain_core.messages import SystemMessage
+
+from backend.message_log import MessageLog
+
+logger = logging.getLogger(__name__)
+
+# Sorted set of thread ids scored by their updated_at timestamp
+CATALOG_KEY = "thread_catalog:by_updated"
+# Per-thread summary hash (title, created_at, updated_at, message_count, flags)
+SUMMARY_KEY = "thread_catalog:thread:{thread_id}"
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class ThreadCatalog:
+    """Maintained index of conversation threads, updated on every write.
+
+    Serving `/threads` from here costs O(page size) instead of a SCAN over
+    every checkpoint key plus one `get_state` per thread.
+    """
+
+    def __init__(self, redis_client: aioredis.Redis):
+        self.redis = redis_client
+
+    @staticmethod
+    def _summary_key(thread_id: str) -> str:
+        return SUMMARY_KEY.format(thread_id=thread_id)
+
+    async def upsert(
+        self,
+        thread_id: str,
+        *,
+        title: Optional[str] = None,
+        created_at: Optional[float] = None,
+        updated_at: Optional[float] = None,
+        message_count: Optional[int] = None,
+        message_delta: int = 0,
+    ) -> None:
+        """Create or update the summary of a thread in a single round-trip"""
+        updated_at = updated_at or datetime.now().timestamp()
+        mapping: Dict[str, Any] = {"id": thread_id, "updated_at": updated_at}
+        if title is not None:
+            mapping["title"] = title
+        if created_at is not None:
+            mapping["created_at"] = created_at
+        if message_count is not None:
+            mapping["message_count"] = message_count
+
+        key = self._summary_key(thread_id)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hset(key, mapping=mapping)
+        if message_delta:
+            pipe.hincrby(key, "message_count", message_delta)
+        pipe.zadd(CATALOG_KEY, {thread_id: updated_at})
+        await pipe.execute()
+
+    async def get(self, thread_id: str) -> Dict[str, str]:
+        """Summary hash of one thread (empty if unknown)"""
+        summary = await self.redis.hgetall(self._summary_key(thread_id))
+        return {_decode(k): _decode(v) for k, v in summary.items()}
+
+    async def set_field(self, thread_id: str, field: str, value: Any) -> None:
+        """Set a per-thread flag without touching updated_at"""
+        await self.redis.hset(self._summary_key(thread_id), field, value)
+
+    async def remove(self, thread_id: str) -> None:
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.delete(self._summary_key(thread_id))
+        pipe.zrem(CATALOG_KEY, thread_id)
+        await pipe.execute()
+
+    async def page(
+        self, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Return one page of threads, newest first, and the cursor for the next page.
+
+        The cursor is "{updated_at}:{thread_id}" of the last thread returned.
+        Threads with the same updated_at are ordered by id, descending, as
+        ZREVRANGEBYSCORE returns them, so none are skipped at a page boundary.
+        Raises ValueError for a cursor that cannot be parsed.
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        max_score, after_score, after_id = "+inf", None, None
+        if cursor:
+            score, _, thread_id = cursor.partition(":")
+            after_score = float(score)
+            if thread_id:
+                max_score, after_id = score, thread_id.encode()
+            else:
+                max_score = f"({score}"  # score-only cursor from older clients
+
+        entries, offset = [], 0
+        while len(entries) < limit:
+            batch = await self.redis.zrevrangebyscore(
+                CATALOG_KEY, max_score, "-inf", start=offset, num=limit, withscores=True
+            )
+            offset += len(batch)
+            for thread_id, score in batch:
+                raw_id = thread_id if isinstance(thread_id, bytes) else thread_id.encode()
+                # At the cursor's own score, only ids after the cursor's (already-served ids sort higher)
+                if after_id is not None and score == after_score and raw_id >= after_id:
+                    continue
+                entries.append((thread_id, score))
+            if len(batch) < limit:
+                break
+        entries = entries[:limit]
+        if not entries:
+            return [], None
+
+        pipe = self.redis.pipeline(transaction=False)
+        for thread_id, _ in entries:
+            pipe.hgetall(self._summary_key(_decode(thread_id)))
+        summaries = await pipe.execute()
+
+        threads = []
+        for (thread_id, score), summary in zip(entries, summaries):
+            summary = {_decode(k): _decode(v) for k, v in summary.items()}
+            threads.append({
+                'id': _decode(thread_id),
+                'title': summary.get('title', "New Chat"),
+                'timestamp': float(score),
+                'message_count': int(summary.get('message_count', 0)),
+            })
+
+        last_id, last_score = entries[-1]
+        next_cursor = f"{last_score!r}:{_decode(last_id)}" if len(entries) == limit else None
+        return threads, next_cursor
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+async def backfill(redis_uri: str) -> int:
+    """Build the catalog from the checkpoints already stored in Redis"""
+    from langgraph.checkpoint.redis.aio import AsyncRedisSaver
+
+    client = aioredis.Redis.from_url(redis_uri)
+    catalog = ThreadCatalog(client)
+    message_log = MessageLog(client)
+    count = 0
+
+    async with AsyncRedisSaver.from_conn_string(redis_uri) as checkpointer:
+        await checkpointer.asetup()
+        seen_threads = set()
+        # One-shot scan; after this the catalog is kept up to date on write
+        async for key in client.scan_iter("checkpoint:*:__empty__:*"):
+            thread_id = _decode(key).split(':')[1]
+            if thread_id in seen_threads:
+                continue
+            seen_threads.add(thread_id)
+
+            checkpoint_tuple = await checkpointer.aget_tuple(
+                {'configurable': {'thread_id': thread_id, 'checkpoint_ns': ''}}
+            )
+            if checkpoint_tuple is None:
+                continue
+            message_count = await message_log.length(thread_id)
+            if message_count:
+                metadata = await message_log.get_metadata(thread_id)
+            else:
+                # Not migrated yet: history and metadata are still in the checkpoint
+                values = checkpoint_tuple.checkpoint.get('channel_values', {})
+                metadata = values.get('metadata') or {}
+                message_count = len([m for m in values.get('messages') or [] if not isinstance(m, SystemMessage)])
+
+            await catalog.upsert(
+                thread_id,
+                title=str(metadata.get('title', "New Chat")),
+                created_at=metadata.get('created_at'),
+                updated_at=float(metadata.get('updated_at', datetime.now().timestamp())),
+                message_count=message_count,
+            )
+            count += 1
+
+    await client.aclose()
+    logger.info("Backfilled %d threads into the catalog", count)
+    return count
+
+
+if __name__ == "__main__":
+    # python -m backend.thread_catalog --backfill
+    parser = argparse.ArgumentParser(description="Thread catalog maintenance")
+    parser.add_argument("--backfill", action="store_true", help="rebuild the catalog from existing checkpoints")
+    parser.add_argument("--redis-uri", default="redis://localhost:6379")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.backfill:
+        print(f"Backfilled {asyncio.run(backfill(args.redis_uri))} threads")
+    else:
+        parser.print_help()
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import math
+import time
+import uuid
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import redis.asyncio as aioredis
+from redis.exceptions import WatchError
+
+from backend.llm_metrics import TURN_MS_BUCKETS
+from backend.rag.embeddings import Histogram
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = "thread_lock:{thread_id}"
+
+
+class ThreadBusy(Exception):
+    """The thread's lock was not freed within the wait limit"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RedisLock:
+    """A held lock (a thread's, or a lease such as the ingest consumer's); its TTL is renewed until release()"""
+
+    def __init__(self, redis_client: aioredis.Redis, key: str, token: str, ttl_ms: int):
+        self.redis = redis_client
+        self.key = key
+        self.token = token
+        self.ttl_ms = ttl_ms
+        self.released = False
+        self.lost = False  # the key expired or was taken over: the renewal found another token
+        self._renewer = asyncio.create_task(self._renew(), name=f"renew-{key}")
+
+    async def _if_held(self, command) -> bool:
+        """Queue `command` on a transaction that only runs while the key still holds our token"""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(self.key)
+                    value = await pipe.get(self.key)
+                    if (value.decode() if isinstance(value, bytes) else value) != self.token:
+                        return False
+                    pipe.multi()
+                    command(pipe)
+                    await pipe.execute()
+                    return True
+                except WatchError:
+                    continue
+
+    async def _renew(self) -> None:
+        while True:
+            await asyncio.sleep(self.ttl_ms / 3000)
+            try:
+                if not await self._if_held(lambda pipe: pipe.pexpire(self.key, self.ttl_ms)):
+                    logger.warning("Lock %s expired while held", self.key)
+                    self.lost = True
+                    return
+            except Exception as e:
+                logger.error("Error renewing lock %s: %s", self.key, str(e))
+
+    async def release(self) -> None:
+        """Free the lock; safe to call more than once"""
+        if self.released:
+            return
+        self.released = True
+        self._renewer.cancel()
+        try:
+            await self._if_held(lambda pipe: pipe.delete(self.key))
+        except Exception as e:
+            # The TTL frees it anyway
+            logger.error("Error releasing lock %s: %s", self.key, str(e))
+
+
+async def try_lock(redis_client: aioredis.Redis, key: str, ttl_ms: int) -> Optional[RedisLock]:
+    """Take `key` if it is free, without waiting"""
+    token = uuid.uuid4().hex
+    if await redis_client.set(key, token, nx=True, px=ttl_ms):
+        return RedisLock(redis_client, key, token, ttl_ms)
+    return None
+
+
+class ThreadLocks:
+    """Distributed per-thread locks, so turns on one thread never interleave across workers.
+
+    A turn reads the thread's log pointer, appends to the message log and
+    writes a checkpoint pointing at the new end of the log; two workers doing
+    that at once would leave the checkpoint pointing past only one of the
+    turns. A lock is a Redis key set with NX and a TTL that is renewed while
+    held, so the lock of a worker that dies is freed after `ttl_seconds`.
+    Waiters poll with backoff and give up with ThreadBusy after `wait_seconds`.
+    """
+
+    def __init__(
+        self, redis_client: aioredis.Redis, ttl_seconds: float = 30.0, wait_seconds: float = 120.0, poll_ms: int = 50
+    ):
+        self.redis = redis_client
+        self.ttl_ms = int(ttl_seconds * 1000)
+        self.wait_seconds = wait_seconds
+        self.poll_ms = poll_ms
+        self.stats = defaultdict(int)
+        self.wait_ms = Histogram(TURN_MS_BUCKETS)
+
+    @classmethod
+    def from_config(cls, config: dict, redis_client: aioredis.Redis) -> "ThreadLocks":
+        return cls(redis_client, **config.get("locks", {}))
+
+    async def acquire(self, thread_id: str) -> RedisLock:
+        """Wait for the thread's lock; raises ThreadBusy after wait_seconds"""
+        key = LOCK_KEY.format(thread_id=thread_id)
+        token = uuid.uuid4().hex
+        started = time.monotonic()
+        delay = self.poll_ms / 1000
+        polls = 0
+        while not await self.redis.set(key, token, nx=True, px=self.ttl_ms):
+            polls += 1
+            if time.monotonic() - started >= self.wait_seconds:
+                self.stats["busy"] += 1
+                raise ThreadBusy(
+                    f"Another turn on thread {thread_id} is still running", retry_after=math.ceil(self.ttl_ms / 1000)
+                )
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.25)
+        self.stats["acquired"] += 1
+        self.stats["contended"] += polls > 0
+        self.wait_ms.observe((time.monotonic() - started) * 1000)
+        return RedisLock(self.redis, key, token, self.ttl_ms)
+
+    async def try_acquire(self, thread_id: str) -> Optional[RedisLock]:
+        """The thread's lock if it is free right now, else None"""
+        lock = await try_lock(self.redis, LOCK_KEY.format(thread_id=thread_id), self.ttl_ms)
+        if lock is not None:
+            self.stats["acquired"] += 1
+        return lock
+
+    @asynccontextmanager
+    async def hold(self, thread_id: str) -> AsyncIterator[RedisLock]:
+        lock = await self.acquire(thread_id)
+        try:
+            yield lock
+        finally:
+            await lock.release()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            **{field: self.stats[field] for field in ("acquired", "contended", "busy")},
+            "wait_ms": self.wait_ms.snapshot(),
+        }
@@ -1,27 +1,239 @@
-from typing import TypedDict, Annotated, List, Dict, Any
+from typing import TypedDict, Annotated, List, Dict, Any, Optional, Tuple
 from langgraph.graph import StateGraph, MessagesState, START, END
-from langgraph.graph.message import add_messages
-from langchain_core.messages import BaseMessage, AIMessage, SystemMessage, HumanMessage
+from langgraph.graph.message import add_messages, REMOVE_ALL_MESSAGES
+from langchain_core.messages import BaseMessage, AIMessage, SystemMessage, HumanMessage, RemoveMessage
+from langchain_core.runnables import RunnableLambda, RunnableConfig
 from backend.model_loader import ModelLoader
-from backend.prompt import SYSTEM_PROMPT
+from backend.message_log import MessageLog
+from backend.rag.rag import IngestionPipeline
+from backend.response_cache import ResponseCache
+from backend.scheduler import QueueFull
+from backend.llm_metrics import LLMMetrics
+from backend.prompt import SYSTEM_PROMPT, SUMMARY_PROMPT
 from datetime import datetime
+import asyncio
+import contextvars
+import math
 import logging
+import os
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SUMMARY_QUEUE_KEY = "summaries"  # background summaries share one generation queue key, as one client
+
 class ChatState(TypedDict):
+    # The current turn only; history lives in the thread's MessageLog and metadata in its hash
     messages: Annotated[List[BaseMessage], add_messages]
-    metadata: Dict[str, Any]
+    context: List[Dict[str, Any]]  # excerpts retrieved for the current turn
+    log_length: int  # messages in the thread's log when the turn was written
+
+def generate_thread_title(messages: List) -> str:
+    """Generate title from first user message"""
+    for msg in messages:
+        if isinstance(msg, HumanMessage) and msg.content.strip():
+            return msg.content[:30] + ("..." if len(msg.content) > 30 else "")
+    return "New Chat"
+
+class ContextManager:
+    """Keeps the prompt sent to the LLM within a per-thread token budget.
+
+    The last `keep_last_turns` turns are sent verbatim. Older turns are folded
+    into a rolling summary stored in the thread metadata ("summary" plus
+    "summary_upto", the number of conversation messages already folded in).
+    The summary is refreshed in the background after a turn completes.
+
+    Message indexes are positions in the thread's message log. Callers pass
+    the log from `offset` on (usually "summary_upto"), since nothing before
+    the summary point is ever sent again.
+
+    With `thread_affinity`, the prompt is kept byte-stable from turn to turn
+    so the model runtime can reuse its cached prefix: the window start is
+    sticky ("context_start" in metadata) and only jumps forward, to a turn
+    boundary, when the budget is exceeded; the summary is only refreshed
+    when the window jumps.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 3000,
+        keep_last_turns: int = 6,
+        summary_max_tokens: int = 400,
+        chars_per_token: float = 4.0,
+        thread_affinity: bool = False,
+    ):
+        self.max_tokens = max_tokens
+        self.keep_last_turns = keep_last_turns
+        self.summary_max_tokens = summary_max_tokens
+        self.chars_per_token = chars_per_token
+        self.thread_affinity = thread_affinity
+        self._refreshing = set()  # thread ids with a summary refresh in flight
+        self._tasks = set()
+        self.scheduler = None  # a GenerationScheduler: summaries then take a generation slot like turns do
+
+    @classmethod
+    def from_config(cls, config: dict) -> "ContextManager":
+        return cls(**config.get("context", {}))
+
+    def count_tokens(self, message: BaseMessage) -> int:
+        """Approximate token count, cached on the message itself"""
+        cached = getattr(message, "token_count", None)
+        if cached is not None:
+            return cached
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        message.token_count = max(1, math.ceil(len(content) / self.chars_per_token))
+        return message.token_count
+
+    def _recent_start(self, conversation: List[BaseMessage], offset: int = 0) -> int:
+        """Log index of the first message of the last `keep_last_turns` turns"""
+        turns = 0
+        for index in range(len(conversation) - 1, -1, -1):
+            if isinstance(conversation[index], HumanMessage):
+                turns += 1
+                if turns == self.keep_last_turns:
+                    return offset + index
+        return offset
+
+    def build_context(
+        self, system_prompt: str, messages: List[BaseMessage], metadata: Optional[Dict[str, Any]], offset: int = 0
+    ) -> List[BaseMessage]:
+        """System prompt, rolling summary and as many recent messages as fit the budget"""
+        metadata = metadata or {}
+        conversation = [m for m in messages if not isinstance(m, SystemMessage)]
+        prefix = self._prefix(system_prompt, metadata)
+        return prefix + conversation[self.window_start(conversation, metadata, prefix, offset) - offset:]
+
+    def _prefix(self, system_prompt: str, metadata: Dict[str, Any]) -> List[BaseMessage]:
+        prefix = [SystemMessage(content=system_prompt)]
+        if metadata.get("summary"):
+            prefix.append(SystemMessage(content=f"Summary of the earlier conversation:\n{metadata['summary']}"))
+        return prefix
+
+    def window_start(
+        self, conversation: List[BaseMessage], metadata: Dict[str, Any], prefix: List[BaseMessage], offset: int = 0
+    ) -> int:
+        """Log index of the first conversation message sent verbatim"""
+        budget = self.max_tokens - sum(self.count_tokens(m) for m in prefix)
+        last = max(0, len(conversation) - 1)  # the latest user message is always sent
+        start = min(max(0, metadata.get("summary_upto", 0) - offset), last)
+        if self.thread_affinity:
+            start = min(max(start, metadata.get("context_start", 0) - offset), last)
+        used = sum(self.count_tokens(m) for m in conversation[start:])
+        if used <= budget:
+            return offset + start
+
+        if not self.thread_affinity:
+            # The summary lags behind: drop the oldest messages until we fit
+            while start < last and used > budget:
+                used -= self.count_tokens(conversation[start])
+                start += 1
+            return offset + start
+
+        # Jump once, far enough that the next few turns fit without moving again:
+        # keep at most the last `keep_last_turns` turns within half the budget
+        start, used = last, self.count_tokens(conversation[last])
+        while start > 0 and used + self.count_tokens(conversation[start - 1]) <= budget // 2:
+            start -= 1
+            used += self.count_tokens(conversation[start])
+        start = max(start, self._recent_start(conversation))
+        while start < last and not isinstance(conversation[start], HumanMessage):
+            start += 1
+        return offset + start
+
+    def next_context_start(
+        self, system_prompt: str, messages: List[BaseMessage], metadata: Dict[str, Any], offset: int = 0
+    ) -> int:
+        """Sticky window start to persist after a turn (thread-affinity mode)"""
+        conversation = [m for m in messages if not isinstance(m, SystemMessage)]
+        return self.window_start(conversation, metadata, self._prefix(system_prompt, metadata), offset)
+
+    def needs_summary(self, conversation: List[BaseMessage], metadata: Dict[str, Any], offset: int = 0) -> bool:
+        """True when turns older than the verbatim window are not yet summarized"""
+        return self._summary_target(conversation, metadata, offset) > metadata.get("summary_upto", 0)
+
+    def _summary_target(self, conversation: List[BaseMessage], metadata: Dict[str, Any], offset: int = 0) -> int:
+        """Messages before this log index belong in the summary"""
+        if self.thread_affinity:
+            # Everything the sticky window has left behind, and nothing more
+            return metadata.get("context_start", 0)
+        return self._recent_start(conversation, offset)
+
+    def schedule_refresh(self, message_log: MessageLog, llm, thread_id: str) -> None:
+        """Refresh the thread summary off the request path"""
+        if thread_id in self._refreshing:
+            return
+        self._refreshing.add(thread_id)
+        # A fresh context: copied from chat_node, the summary call would inherit the run's
+        # callbacks and its tokens would be streamed to the client as part of the answer
+        task = asyncio.create_task(self.refresh_summary(message_log, llm, thread_id), context=contextvars.Context())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(lambda _: self._refreshing.discard(thread_id))
+
+    async def refresh_summary(self, message_log: MessageLog, llm, thread_id: str) -> None:
+        """Fold the turns that left the verbatim window into the summary"""
+        try:
+            metadata = await message_log.get_metadata(thread_id)
+            upto = metadata.get("summary_upto", 0)
+            conversation = await message_log.read(thread_id, upto)
+            new_upto = self._summary_target(conversation, metadata, upto)
+            if new_upto <= upto:
+                return
+
+            transcript = "\n".join(
+                f"{'User' if isinstance(m, HumanMessage) else 'Assistant'}: {m.content}"
+                for m in conversation[:new_upto - upto]
+            )
+            response = await self._agenerate(llm, thread_id, SUMMARY_PROMPT.format(
+                summary=metadata.get("summary") or "(none)", messages=transcript
+            ))
+            if response is None:
+                return
+            summary = response.content.strip()[: int(self.summary_max_tokens * self.chars_per_token)]
+
+            # Only the summary fields are written, so metadata set by a concurrent turn is kept
+            await message_log.update_metadata(thread_id, {"summary": summary, "summary_upto": new_upto})
+            logger.info("Summarized %d messages for thread %s", new_upto - upto, thread_id)
+
+        except Exception as e:
+            logger.error("Error refreshing summary: %s", str(e))
+
+    async def _agenerate(self, llm, thread_id: str, prompt: str) -> Optional[BaseMessage]:
+        """Run the summary prompt in a generation slot; None if the queue is full (retried after a later turn)"""
+        config = {"configurable": {"thread_id": thread_id}, "tags": ["nostream"]}
+        if self.scheduler is None:
+            return await llm.ainvoke(prompt, config)
+        try:
+            ticket = self.scheduler.enqueue(SUMMARY_QUEUE_KEY)
+        except QueueFull:
+            logger.info("Generation queue full, summary of thread %s postponed", thread_id)
+            return None
+        try:
+            async for _ in self.scheduler.wait(ticket):
+                pass
+            return await llm.ainvoke(prompt, config)
+        finally:
+            self.scheduler.release(ticket)
 
 class GraphBuilder:
     def __init__(self, model_provider: str = "ollama-llama3", streaming: bool = True):
         self.model_loader = ModelLoader(model_key=model_provider, streaming=streaming)
+        # A ChatOllama, or an LLMPool that keeps each thread on one endpoint when it can
         self.llm = self.model_loader.load_llm()
+        self.llm_metrics = LLMMetrics()
         self.streaming = streaming
         self.system_prompt = SYSTEM_PROMPT or """You are a helpful AI assistant. 
             Be concise, friendly, and maintain conversation context."""
+        self.context = ContextManager.from_config(self.model_loader.config.config)
+        self.response_cache = ResponseCache.from_config(
+            self.model_loader.config.config, model_provider, self.system_prompt
+        )
+        # Ingestion + hybrid retrieval over the documents attached to each thread
+        self.rag = None
+        if self.model_loader.config.config.get("retrieval", {}).get("enabled", True):
+            self.rag = IngestionPipeline(self.model_loader.config.config)
+        self.message_log: Optional[MessageLog] = None  # set by build_graph
         self.graph = None
         logger.info("GraphBuilder initialized with %s provider", model_provider)
 
@@ -31,46 +243,146 @@ class GraphBuilder:
             message.timestamp = datetime.now().timestamp()
         return message
 
-    def agent_function(self, state: ChatState) -> Dict[str, List[BaseMessage]]:
-        """Process messages and generate response"""
+    def _observe(self, response: BaseMessage, full_context: List[BaseMessage], config: Optional[RunnableConfig]) -> None:
+        thread_id = ((config or {}).get("configurable") or {}).get("thread_id")
+        estimate = sum(self.context.count_tokens(m) for m in full_context)
+        self.llm_metrics.observe(getattr(response, "response_metadata", None), estimate, thread_id)
+
+    async def _load(self, thread_id: str) -> Tuple[List[BaseMessage], Dict[str, Any], int]:
+        """(history, metadata, offset): the log from "summary_upto" on, which is all a prompt can use"""
+        metadata = await self.message_log.get_metadata(thread_id)
+        offset = metadata.get("summary_upto", 0)
+        return await self.message_log.read(thread_id, offset), metadata, offset
+
+    def _prepare_context(
+        self, conversation: List[BaseMessage], metadata: Dict[str, Any], offset: int, context: Optional[List[Dict[str, Any]]]
+    ) -> List[BaseMessage]:
+        """Build the prompt: system prompt, thread summary and recent conversation"""
+        input_messages = [self._add_message_metadata(msg) for msg in conversation]
+        messages = self.context.build_context(self.system_prompt, input_messages, metadata, offset)
+        if context:
+            # Excerpts go right before the question so the rest of the prompt stays unchanged
+            excerpts = "\n\n".join(
+                f"[{hit['source']}, page {hit['page']}]\n{hit['text']}" for hit in context
+            )
+            messages.insert(len(messages) - 1, SystemMessage(
+                content=f"Relevant excerpts from the documents attached to this conversation:\n\n{excerpts}"
+            ))
+        return messages
+
+    @staticmethod
+    def _retrieval_query(state: ChatState) -> Optional[str]:
+        """This turn's question, or None when there is nothing to search for"""
+        question = next((m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)), "")
+        return question if question.strip() else None
+
+    @staticmethod
+    def _context_update(hits: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {"context": [
+            {"text": hit["text"], "source": os.path.basename(hit["source"]), "page": hit.get("page"), "score": hit["score"]}
+            for hit in hits
+        ]}
+
+    async def aretrieve_function(self, state: ChatState, config: RunnableConfig) -> Dict[str, Any]:
+        """Fetch excerpts from the documents attached to this thread (micro-batched query embedding)"""
+        question = self._retrieval_query(state) if self.rag is not None else None
+        if question is None:
+            return {"context": []}
         try:
-            messages = state["messages"]
-            
-            # Filter and prepare messages
-            input_messages = [
-                self._add_message_metadata(msg) 
-                for msg in messages 
-                if not isinstance(msg, SystemMessage)
-            ]
-            
-            # Prepare full context
-            full_context = [SystemMessage(content=self.system_prompt)] + input_messages
-            
-            if self.streaming:
-                logger.debug("Returning streaming placeholder")
-                return {"messages": [AIMessage(content="", timestamp=datetime.now().timestamp())]}
-            
-            # Generate response
-            response = self.llm.invoke(full_context)
-            response = self._add_message_metadata(response)
-            
-            logger.info("Generated response for %d message conversation", len(input_messages))
-            return {"messages": [response]}
-            
+            thread_id = config["configurable"]["thread_id"]
+            metadata = await self.message_log.get_metadata(thread_id)
+            if not metadata.get("documents"):
+                return {"context": []}
+            # thread_id is an indexed payload field, so only this thread's chunks are scored
+            result = await self.rag.retriever.aretrieve(question, self.rag.top_k, {"thread_id": thread_id})
+            logger.info("Retrieved %d excerpts: %s", len(result.hits), result.timings)
+            return self._context_update(result.hits)
+
         except Exception as e:
-            logger.error("Error in agent_function: %s", str(e))
+            logger.error("Error in aretrieve_function: %s", str(e))
+            return {"context": []}
+
+    def _turn_update(
+        self, conversation: List[BaseMessage], response: BaseMessage, metadata: Dict[str, Any], offset: int
+    ) -> Dict[str, Any]:
+        """Metadata fields changed by one turn (conversation: the log from `offset` on, plus this turn)"""
+        self._add_message_metadata(response)
+        now = datetime.now().timestamp()
+        changes = {"updated_at": now}
+        if "created_at" not in metadata:
+            changes["created_at"] = now
+
+        # Title the thread after its first user message
+        if offset + len(conversation) <= 1:
+            changes["title"] = generate_thread_title(conversation)
+        if self.context.thread_affinity:
+            changes["context_start"] = self.context.next_context_start(
+                self.system_prompt, conversation, {**metadata, **changes}, offset
+            )
+        return changes
+
+    async def _arecord(
+        self, thread_id: str, history: List[BaseMessage], turn: List[BaseMessage], response: BaseMessage,
+        metadata: Dict[str, Any], offset: int
+    ) -> Tuple[Dict[str, Any], int]:
+        """Append the turn to the log; returns the updated metadata and the new log length"""
+        conversation = history + turn
+        changes = self._turn_update(conversation, response, metadata, offset)
+        log_length = await self.message_log.append(thread_id, turn + [response], changes)
+        metadata = {**metadata, **changes}
+        if self.context.needs_summary(conversation + [response], metadata, offset):
+            self.context.schedule_refresh(self.message_log, self.llm, thread_id)
+        return metadata, log_length
+
+    @staticmethod
+    def _pointer_update(log_length: int) -> Dict[str, Any]:
+        """Checkpoint values after a turn: no messages, just the position in the log"""
+        return {"messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES)], "context": [], "log_length": log_length}
+
+    async def aagent_function(self, state: ChatState, config: RunnableConfig) -> Dict[str, Any]:
+        """Generate the response; tokens reach the caller via the "messages" stream mode"""
+        try:
+            thread_id = config["configurable"]["thread_id"]
+            history, metadata, offset = await self._load(thread_id)
+            turn = [self._add_message_metadata(m) for m in state["messages"] if not isinstance(m, SystemMessage)]
+            full_context = self._prepare_context(history + turn, metadata, offset, state.get("context"))
+            response = await self.llm.ainvoke(full_context, config)
+            self._observe(response, full_context, config)
+            logger.info("Generated response for %d message conversation", len(full_context) - 1)
+
+            _, log_length = await self._arecord(thread_id, history, turn, response, metadata, offset)
+            return self._pointer_update(log_length)
+
+        except Exception as e:
+            logger.error("Error in aagent_function: %s", str(e))
             raise
 
-    def build_graph(self, checkpointer=None, store=None):
+    async def arecord_turn(self, graph, config: Dict[str, Any], user_msg: BaseMessage, response: BaseMessage) -> Dict[str, Any]:
+        """Append a turn produced outside chat_node (e.g. a cached answer) as if chat_node ran"""
+        thread_id = config["configurable"]["thread_id"]
+        history, metadata, offset = await self._load(thread_id)
+        metadata, log_length = await self._arecord(
+            thread_id, history, [self._add_message_metadata(user_msg)], response, metadata, offset
+        )
+        # Also drops user_msg if an aborted graph run already left it in the checkpoint
+        await graph.aupdate_state(config=config, values=self._pointer_update(log_length), as_node="chat_node")
+        return {"messages": [response], "metadata": metadata}
+
+    def build_graph(self, checkpointer=None, store=None, message_log: Optional[MessageLog] = None):
         """Build and compile the state graph"""
         try:
+            self.message_log = message_log or self.message_log
+            if self.message_log is None:
+                raise ValueError("build_graph needs a MessageLog: thread history is stored there")
             workflow = StateGraph(ChatState)
             
-            # Define nodes
-            workflow.add_node("chat_node", self.agent_function)
+            # Define nodes (async only: history and metadata are read from Redis)
+            workflow.add_node("retrieve_node", RunnableLambda(self.aretrieve_function, name="retrieve_node"))
+            workflow.add_node("chat_node", RunnableLambda(self.aagent_function, name="chat_node"))
             
             # Define edges
-            workflow.add_edge(START, "chat_node")
+            workflow.add_edge(START, "retrieve_node")
+            workflow.add_edge("retrieve_node", "chat_node")
             workflow.add_edge("chat_node", END)
             
             # Compile graph
@@ -118,6 +430,6 @@ class GraphBuilder:
             logger.error("Error retrieving threads: %s", str(e))
             return []
 
-    def __call__(self, checkpointer=None, store=None):
+    def __call__(self, checkpointer=None, store=None, message_log: Optional[MessageLog] = None):
         """Callable interface for graph building"""
-        return self.build_graph(checkpointer=checkpointer, store=store)
\ No newline at end of file
+        return self.build_graph(checkpointer=checkpointer, store=store, message_log=message_log)
\ No newline at end of file
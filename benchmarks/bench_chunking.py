@@ -0,0 +1,129 @@
+"""Chunking throughput and peak memory: notebook1's chunkers vs backend.rag.chunking.
+
+    python benchmarks/bench_chunking.py --pages 1000
+    python benchmarks/bench_chunking.py --pages 1000 --model BAAI/bge-base-en-v1.5
+
+The notebooks join every element into one `full_text`, clean it, and build
+the full chunk list with `current += s + " "`. chunk_elements consumes the
+elements lazily; peak memory is measured with tracemalloc while the chunks
+are consumed one by one (as the ingestion pipeline does). Without --model,
+whitespace words stand in for tokens.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.rag.chunking import TokenCounter, chunk_elements  # noqa: E402
+
+SENTENCE_MAX = 300
+SLIDING_SIZE = 200
+SLIDING_OVERLAP = 50
+MIN_CHUNK = 25
+
+
+# ========== notebook1 implementation ==========
+def clean_text(text):
+    if not text: return ""
+    text = re.sub(r'[^\w\s.,;:!?\'-]', ' ', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def chunk_sentences(text):
+    text = clean_text(text)
+    if len(text) < MIN_CHUNK or not any(c.isalpha() for c in text):
+        return []
+
+    sentences = re.split(r'(?<=[.!?])\s+', text)
+    chunks, current = [], ""
+
+    for s in sentences:
+        if len(current) + len(s) <= SENTENCE_MAX:
+            current += s + " "
+        else:
+            if current.strip(): chunks.append(current.strip())
+            current = s + " "
+
+    if current.strip(): chunks.append(current.strip())
+    return chunks
+
+
+def chunk_sliding(text):
+    text = clean_text(text)
+    if len(text) < MIN_CHUNK or not any(c.isalpha() for c in text):
+        return []
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + SLIDING_SIZE
+        chunk = text[start:end].strip()
+        if chunk: chunks.append(chunk)
+        start += SLIDING_SIZE - SLIDING_OVERLAP
+    return chunks
+
+
+# ========== harness ==========
+WORDS = ("retrieval", "embedding", "vector", "index", "query", "latency", "document", "section",
+         "token", "budget", "memory", "stream", "page", "model", "chunk", "score", "filter", "cache")
+
+
+def synthetic_elements(pages, elements_per_page=12, seed=0):
+    """Generator of partition-like elements (about 3 KB of text per page)"""
+    rng = random.Random(seed)
+    for page in range(1, pages + 1):
+        for index in range(elements_per_page):
+            sentences = [
+                " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 18))).capitalize() + "."
+                for _ in range(rng.randint(1, 4))
+            ]
+            yield {
+                "text": " ".join(sentences),
+                "page": page,
+                "section": f"Section {page // 10}",
+                "category": "Title" if index == 0 else "NarrativeText",
+            }
+
+
+def measure(fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    count = fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, elapsed * 1000, peak / 1024 / 1024
+
+
+def main(args):
+    counter = TokenCounter()
+    if args.model:
+        from transformers import AutoTokenizer
+        counter = TokenCounter(AutoTokenizer.from_pretrained(args.model, use_fast=True))
+
+    runs = {
+        "notebook sentences": lambda: len(chunk_sentences(" ".join(e["text"] for e in synthetic_elements(args.pages)))),
+        "notebook sliding": lambda: len(chunk_sliding(" ".join(e["text"] for e in synthetic_elements(args.pages)))),
+        "stream sentences": lambda: sum(1 for _ in chunk_elements(
+            synthetic_elements(args.pages), counter, "sentence", args.max_tokens)),
+        "stream sliding": lambda: sum(1 for _ in chunk_elements(
+            synthetic_elements(args.pages), counter, "sliding", args.max_tokens, args.overlap_tokens)),
+    }
+    print(f"pages={args.pages} tokens={'words' if not args.model else args.model}")
+    for name, fn in runs.items():
+        count, ms, peak_mb = measure(fn)
+        print(f"{name:20s} chunks={count:7d} time={ms:9.1f}ms peak={peak_mb:8.2f}MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunking benchmark")
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--overlap-tokens", type=int, default=16)
+    parser.add_argument("--model", default=None, help="tokenizer to count tokens with (default: words)")
+    main(parser.parse_args())
@@ -0,0 +1,115 @@
+"""Message serialization: stock vs backend.codec, on realistic 100-turn threads.
+
+    python benchmarks/bench_codec.py --turns 100 --repeat 20
+
+Three paths are compared, per message:
+
+- checkpoint serde: JsonPlusRedisSerializer (LangChain constructor format
+  through the stdlib json fallback) vs CompactSerializer
+- message log entries: orjson of the compact form (the first log format)
+  vs msgpack (pack_message / unpack_message)
+- API responses: FastAPI's default path (jsonable_encoder + JSONResponse)
+  vs returning an ORJSONResponse directly
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import orjson
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse, ORJSONResponse  # noqa: E402
+from langchain_core.messages import AIMessage, HumanMessage  # noqa: E402
+from langgraph.checkpoint.redis.jsonplus_redis import JsonPlusRedisSerializer  # noqa: E402
+
+from backend.codec import CompactSerializer, message_to_dict, pack_message, unpack_entry, unpack_message  # noqa: E402
+from main import serialize_message  # noqa: E402
+
+WORDS = "the of and to in is that for it as with was on be by this are from or have an not".split()
+OLLAMA_METADATA = {
+    "model": "llama3.2:latest", "created_at": "2025-01-01T00:00:00Z", "done": True, "done_reason": "stop",
+    "total_duration": 2_500_000_000, "load_duration": 10_000_000, "prompt_eval_count": 900,
+    "prompt_eval_duration": 300_000_000, "eval_count": 300, "eval_duration": 2_100_000_000,
+    "model_name": "llama3.2:latest",
+}
+
+
+def text(rng, chars):
+    words = []
+    while sum(len(w) + 1 for w in words) < chars:
+        words.append(rng.choice(WORDS))
+    return " ".join(words)
+
+
+def conversation(turns, rng):
+    messages, now = [], 1.7e9
+    for turn in range(turns):
+        messages.append(HumanMessage(content=text(rng, 200), id=f"h{turn}", timestamp=now + turn))
+        messages.append(AIMessage(
+            content=text(rng, rng.randint(400, 2000)), id=f"a{turn}", timestamp=now + turn + 1,
+            response_metadata=OLLAMA_METADATA
+        ))
+    return messages
+
+
+def timed(fn, repeat):
+    """Best of `repeat` runs: allocation-heavy decoders are otherwise dominated by GC noise"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def report(name, encode, decode, size, count, repeat):
+    encoded, encode_s = timed(encode, repeat)
+    _, decode_s = timed(lambda: decode(encoded), repeat)
+    print(f"  {name:38s} {size(encoded) / count:9.0f} {encode_s / count * 1e6:10.2f} {decode_s / count * 1e6:10.2f}")
+
+
+def run(args):
+    messages = conversation(args.turns, random.Random(0))
+    count = len(messages)
+    print(f"{count} messages ({args.turns} turns); per message:")
+    print(f"  {'':38s} {'bytes':>9s} {'encode us':>10s} {'decode us':>10s}")
+
+    print("checkpoint serde")
+    for name, serde in (("JsonPlusRedisSerializer", JsonPlusRedisSerializer()), ("CompactSerializer", CompactSerializer())):
+        report(
+            name, lambda: serde.dumps_typed({"messages": messages}), serde.loads_typed,
+            lambda typed: len(typed[1].encode()), count, args.repeat
+        )
+
+    print("message log entries")
+    report(
+        "orjson", lambda: [orjson.dumps(message_to_dict(m), default=str) for m in messages],
+        lambda entries: [unpack_message(e) for e in entries], lambda entries: sum(map(len, entries)), count, args.repeat
+    )
+    report(
+        "msgpack", lambda: [pack_message(m) for m in messages],
+        lambda entries: [unpack_message(e) for e in entries], lambda entries: sum(map(len, entries)), count, args.repeat
+    )
+    report(
+        "msgpack (to dict, no message objects)", lambda: [pack_message(m) for m in messages],
+        lambda entries: [unpack_entry(e) for e in entries], lambda entries: sum(map(len, entries)), count, args.repeat
+    )
+
+    print("API response (serialize_message + render; decode is client-side json)")
+    body = lambda: {"messages": [serialize_message(m) for m in messages]}  # noqa: E731
+    report(
+        "jsonable_encoder + JSONResponse", lambda: JSONResponse(jsonable_encoder(body())).body,
+        orjson.loads, len, count, args.repeat
+    )
+    report("ORJSONResponse", lambda: ORJSONResponse(body()).body, orjson.loads, len, count, args.repeat)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Message codec benchmark")
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    run(parser.parse_args())
@@ -0,0 +1,97 @@
+"""Bytes written per turn: full-state checkpoints vs backend.message_log.
+
+    python benchmarks/bench_message_log.py --turns 10 100 1000
+
+Before the message log, every turn serialized the whole conversation into
+its checkpoint (the Redis saver stores channel values inline), and renaming a
+thread wrote the whole state once more. Now a turn RPUSHes its two messages
+and HSETs the metadata fields it changed, and the checkpoint only holds a
+pointer into the log. Sizes are those produced by the saver's serializer and
+by backend.message_log's encoding; serialization time is measured as well.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import orjson
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage, HumanMessage  # noqa: E402
+from langgraph.checkpoint.redis.jsonplus_redis import JsonPlusRedisSerializer  # noqa: E402
+
+from backend.codec import pack_message  # noqa: E402
+
+WORDS = "the of and to in is that for it as with was on be by this are from or have an not".split()
+OLLAMA_METADATA = {
+    "model": "llama3.2:latest", "created_at": "2025-01-01T00:00:00Z", "done": True, "done_reason": "stop",
+    "total_duration": 2_500_000_000, "load_duration": 10_000_000, "prompt_eval_count": 900,
+    "prompt_eval_duration": 300_000_000, "eval_count": 300, "eval_duration": 2_100_000_000,
+    "model_name": "llama3.2:latest",
+}
+
+
+def text(rng, chars):
+    words = []
+    while sum(len(w) + 1 for w in words) < chars:
+        words.append(rng.choice(WORDS))
+    return " ".join(words)
+
+
+def conversation(turns, rng):
+    messages, now = [], 1.7e9
+    for turn in range(turns):
+        messages.append(HumanMessage(content=text(rng, 200), id=f"h{turn}", timestamp=now + turn))
+        messages.append(AIMessage(
+            content=text(rng, 1200), id=f"a{turn}", timestamp=now + turn + 1, response_metadata=OLLAMA_METADATA
+        ))
+    return messages
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - started) / repeat * 1e6
+
+
+def run(args):
+    serde = JsonPlusRedisSerializer()
+    rng = random.Random(0)
+    metadata = {
+        "created_at": 1.7e9, "updated_at": 1.7e9, "title": "A thread title", "context_start": 0,
+        "summary": text(rng, 1600), "summary_upto": 0,
+    }
+
+    print(f"{'turns':>6} | {'before: turn B':>15} {'rename B':>10} {'us':>7} | "
+          f"{'after: turn B':>14} {'(checkpoint)':>12} {'rename B':>9} {'us':>5} | {'ratio':>6}")
+    for turns in args.turns:
+        messages = conversation(turns, rng)
+
+        # Before: the turn's checkpoint holds every message plus the metadata; so does a rename
+        def full_state():
+            return serde.dumps_typed({"channel_values": {"messages": messages, "metadata": metadata, "context": []}})
+        (_, full), full_us = timed(full_state, args.repeat)
+
+        # After: two list entries, the changed metadata fields, and a pointer-only checkpoint
+        def appended():
+            entries = [pack_message(m) for m in messages[-2:]]
+            fields = [orjson.dumps(v) for v in (1.7e9, len(messages) - 2)]  # updated_at, context_start
+            checkpoint = serde.dumps_typed({"channel_values": {"messages": [], "context": [], "log_length": len(messages)}})
+            return sum(map(len, entries)) + sum(map(len, fields)), len(checkpoint[1])
+        (log_bytes, checkpoint_bytes), log_us = timed(appended, args.repeat)
+        rename_bytes = sum(len(orjson.dumps(v)) for v in ("A new thread title", 1.7e9))  # title, updated_at
+
+        turn_bytes = log_bytes + checkpoint_bytes
+        print(f"{turns:6d} | {len(full):15,d} {len(full):10,d} {full_us:7.0f} | "
+              f"{turn_bytes:14,d} {checkpoint_bytes:12,d} {rename_bytes:9,d} {log_us:5.0f} | "
+              f"{len(full) / turn_bytes:5.0f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-turn write bytes benchmark")
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=20)
+    run(parser.parse_args())
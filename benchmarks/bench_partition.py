@@ -0,0 +1,69 @@
+"""Parse CPU time: notebook-style default `partition` vs adaptive per-page strategies.
+
+    python benchmarks/bench_partition.py data/files --repeat 1
+
+Runs both in this process, one file at a time, and reports CPU seconds per
+file plus the pages each strategy handled. Model loading is excluded by
+warming both paths on the first file before timing.
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.rag.partition import partition_batches  # noqa: E402
+from backend.rag.rag import discover_files  # noqa: E402
+
+
+def notebook_partition(filepath):
+    from unstructured.partition.auto import partition
+    return partition(filename=filepath)
+
+
+def adaptive_pages(filepath):
+    return [page for parsed in partition_batches(filepath) for page in parsed["pages"]]
+
+
+def cpu_seconds(fn, repeat):
+    started = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - started) / repeat
+
+
+def main(args):
+    files = [f for f in discover_files(args.paths) if f.lower().endswith(".pdf")]
+    if not files:
+        sys.exit("no PDF files found")
+    notebook_partition(files[0])
+    adaptive_pages(files[0])
+
+    totals = Counter()
+    strategies = Counter()
+    for filepath in files:
+        default = cpu_seconds(lambda: notebook_partition(filepath), args.repeat)
+        adaptive = cpu_seconds(lambda: adaptive_pages(filepath), args.repeat)
+        pages = adaptive_pages(filepath)
+        strategies.update(page["strategy"] for page in pages)
+        totals["default"] += default
+        totals["adaptive"] += adaptive
+        print(
+            f"{os.path.basename(filepath)[:40]:40s} pages={len(pages):4d} "
+            f"default={default:8.2f}s adaptive={adaptive:8.2f}s "
+            f"({', '.join(f'{k}={v}' for k, v in Counter(p['strategy'] for p in pages).items())})"
+        )
+
+    print(
+        f"\ntotal default={totals['default']:.2f}s adaptive={totals['adaptive']:.2f}s "
+        f"reduction={1 - totals['adaptive'] / max(totals['default'], 1e-9):.0%} pages: {dict(strategies)}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Document parsing benchmark")
+    parser.add_argument("paths", nargs="+", help="files or directories with PDFs")
+    parser.add_argument("--repeat", type=int, default=1)
+    main(parser.parse_args())
@@ -0,0 +1,72 @@
+"""Compare per-token SSE frames (with the old fixed sleep) against coalesced frames.
+
+Uses a stub LLM that yields `--tokens` tokens with `--token-delay-ms` between
+them, so no Ollama or Redis is needed:
+
+    python benchmarks/bench_token_stream.py --tokens 500 --token-delay-ms 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.streaming import FlushPolicy, coalesce_tokens, sse_frame  # noqa: E402
+
+
+async def stub_llm(tokens: int, delay: float):
+    for i in range(tokens):
+        if delay:
+            await asyncio.sleep(delay)
+        yield f"tok{i} "
+
+
+async def per_token_stream(tokens: int, delay: float):
+    # The previous event_generator: one json frame and a 10ms sleep per token
+    async for token in stub_llm(tokens, delay):
+        yield f"data: {json.dumps({'token': token})}\n\n"
+        await asyncio.sleep(0.01)
+
+
+async def coalesced_stream(tokens: int, delay: float, policy: FlushPolicy):
+    async for text in coalesce_tokens(stub_llm(tokens, delay), policy):
+        yield sse_frame({'token': text})
+
+
+async def measure(name: str, stream, client_delay: float):
+    started = time.perf_counter()
+    first, frames, size = None, 0, 0
+    async for frame in stream:
+        if first is None:
+            first = time.perf_counter() - started
+        frames += 1
+        size += len(frame)
+        if client_delay:
+            await asyncio.sleep(client_delay)  # emulate a slow reader
+    total = time.perf_counter() - started
+    print(
+        f"{name:12s} frames={frames:5d} bytes={size:7d} ttft={first * 1000:7.2f}ms "
+        f"total={total * 1000:9.1f}ms frames/s={frames / total:8.1f}"
+    )
+
+
+async def main(args):
+    delay = args.token_delay_ms / 1000
+    client_delay = args.client_delay_ms / 1000
+    policy = FlushPolicy(flush_interval_ms=args.flush_interval_ms, max_frame_bytes=args.max_frame_bytes)
+
+    await measure("per-token", per_token_stream(args.tokens, delay), client_delay)
+    await measure("coalesced", coalesced_stream(args.tokens, delay, policy), client_delay)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SSE token streaming benchmark")
+    parser.add_argument("--tokens", type=int, default=500)
+    parser.add_argument("--token-delay-ms", type=float, default=2.0)
+    parser.add_argument("--client-delay-ms", type=float, default=0.0)
+    parser.add_argument("--flush-interval-ms", type=float, default=30.0)
+    parser.add_argument("--max-frame-bytes", type=int, default=1024)
+    asyncio.run(main(parser.parse_args()))
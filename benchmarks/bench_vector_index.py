@@ -0,0 +1,90 @@
+"""Top-k latency: notebook1's pure-Python cosine scan vs LocalVectorIndex.
+
+    python benchmarks/bench_vector_index.py --sizes 10000 100000 1000000 --dim 768
+
+The pure-Python scan is only timed up to --python-max rows (it takes minutes
+per query beyond that); larger sizes report the vectorized index only.
+1M x 768 float32 needs about 3 GB of disk for the memory-mapped matrix.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.rag.vector_index import LocalVectorIndex  # noqa: E402
+
+
+# ========== notebook1 implementation ==========
+def cosine_similarity(a, b):
+    dot_product = sum([x * y for x, y in zip(a, b)])
+    norm_a = sum([x ** 2 for x in a]) ** 0.5
+    norm_b = sum([x ** 2 for x in b]) ** 0.5
+    return dot_product / (norm_a * norm_b)
+
+
+def notebook_search(points, query, top_k):
+    scored = [(cosine_similarity(query, vector), i) for i, vector in enumerate(points)]
+    return sorted(scored, reverse=True)[:top_k]
+
+
+def build_index(directory, vectors, sources, batch=50_000):
+    index = LocalVectorIndex(directory, vectors.shape[1], filter_fields=("source",), initial_capacity=len(vectors))
+    index.ensure_collection()
+    for start in range(0, len(vectors), batch):
+        end = start + batch
+        index.upsert(
+            [str(i) for i in range(start, min(end, len(vectors)))],
+            vectors[start:end],
+            [{"source": sources[i]} for i in range(start, min(end, len(vectors)))],
+        )
+    index.flush()
+    return index
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main(args):
+    rng = np.random.default_rng(0)
+    for size in args.sizes:
+        vectors = rng.standard_normal((size, args.dim), dtype=np.float32)
+        queries = rng.standard_normal((args.batch, args.dim), dtype=np.float32)
+        sources = [f"doc{i % 100}.pdf" for i in range(size)]
+
+        with tempfile.TemporaryDirectory() as directory:
+            index = build_index(directory, vectors, sources)
+            single = timed(lambda: index.search(queries[0], args.top_k), args.repeat)
+            batched = timed(lambda: index.search_batch(queries, args.top_k), args.repeat) / args.batch
+            filtered = timed(lambda: index.search(queries[0], args.top_k, {"source": "doc7.pdf"}), args.repeat)
+            del index
+
+        line = (
+            f"n={size:>8d} index: single={single:8.2f}ms batched={batched:8.3f}ms/query "
+            f"filtered(1%)={filtered:7.2f}ms"
+        )
+        if size <= args.python_max:
+            points = vectors.tolist()
+            query = queries[0].tolist()
+            python_ms = timed(lambda: notebook_search(points, query, args.top_k), 1)
+            line += f" | notebook={python_ms:10.1f}ms speedup={python_ms / single:7.0f}x"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vector index benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--python-max", type=int, default=100_000)
+    main(parser.parse_args())
@@ -0,0 +1,69 @@
+"""Check that closing a /query_stream client aborts the upstream Ollama stream.
+
+Start the stub with a long answer, point the API at it, then run the check:
+
+    python benchmarks/ollama_stub.py --port 11434 --tokens 2000 --delay-ms 5
+    python -m uvicorn main:app --port 8000
+    python benchmarks/check_disconnect.py --frames 5
+
+The script reads a few token frames, drops the connection, and then checks
+three things. The stub must count the stream as aborted after sending only
+part of its tokens. The scheduler must show no active generation. The
+thread must hold a truncated answer, or nothing when on_disconnect is
+"discard".
+"""
+import argparse
+import asyncio
+import sys
+import uuid
+
+import httpx
+
+
+async def run(args):
+    thread_id = str(uuid.uuid4())
+    async with httpx.AsyncClient(timeout=30) as client:
+        await client.post(f"{args.base_url}/init_thread", json={"thread_id": thread_id})
+        before = (await client.get(f"{args.stub_url}/stub/stats")).json()
+
+        frames = 0
+        async with client.stream(
+            "POST", f"{args.base_url}/query_stream",
+            json={"question": f"Tell me a long story {thread_id}", "thread_id": thread_id},
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.startswith("data: ") and '"token"' in line:
+                    frames += 1
+                    if frames >= args.frames:
+                        break
+        # Leaving the block closes the connection mid-answer
+
+        await asyncio.sleep(args.settle_seconds)
+        after = (await client.get(f"{args.stub_url}/stub/stats")).json()
+        scheduler = (await client.get(f"{args.base_url}/metrics/scheduler")).json()
+        messages = (await client.get(f"{args.base_url}/threads/{thread_id}/full")).json()["messages"]
+
+    aborted = after["streams_aborted"] - before["streams_aborted"]
+    tokens = after["tokens_sent"] - before["tokens_sent"]
+    checks = {
+        "upstream stream aborted": aborted == 1 and after["streams_completed"] == before["streams_completed"],
+        "generation slot released": scheduler["active"] == 0,
+        "turn persisted per on_disconnect": (
+            bool(messages) and messages[-1].get("truncated", False) if args.expect == "truncate" else not messages
+        ),
+    }
+    print(f"read {frames} frames, upstream sent {tokens} tokens before the abort")
+    for name, ok in checks.items():
+        print(f"{'PASS' if ok else 'FAIL'} {name}")
+    return all(checks.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Client disconnect check")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--stub-url", default="http://localhost:11434")
+    parser.add_argument("--frames", type=int, default=5)
+    parser.add_argument("--settle-seconds", type=float, default=1.0)
+    parser.add_argument("--expect", choices=("truncate", "discard"), default="truncate")
+    sys.exit(0 if asyncio.run(run(parser.parse_args())) else 1)
@@ -0,0 +1,122 @@
+"""Exercise backend.llm_pool.LLMPool against local Ollama stubs.
+
+    python benchmarks/check_llm_pool.py --requests 200 --concurrency 16
+
+Starts three benchmarks/ollama_stub.py processes: two healthy ones and one
+that answers every chat request with HTTP 500. The pool also lists a fourth
+port with nothing listening. Halfway through, one healthy stub is killed.
+Only requests that were streaming from the killed stub should fail. The script
+prints how requests spread across endpoints, the failovers and the ejections.
+It then checks that sequential turns of a thread land on the same endpoint.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_ollama import ChatOllama  # noqa: E402
+
+from backend.llm_pool import Endpoint, LLMPool  # noqa: E402
+
+STUB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ollama_stub.py")
+MODEL = "llama3.2:latest"
+
+
+def start_stub(port, fail_rate=0.0, tokens=20):
+    return subprocess.Popen([
+        sys.executable, STUB, "--port", str(port), "--tokens", str(tokens),
+        "--delay-ms", "2", "--prompt-eval-ms", "10", "--fail-rate", str(fail_rate),
+    ])
+
+
+def wait_ready(ports, timeout=20):
+    deadline = time.monotonic() + timeout
+    for port in ports:
+        while True:
+            try:
+                httpx.get(f"http://127.0.0.1:{port}/api/version", timeout=0.5)
+                break
+            except httpx.HTTPError:
+                if time.monotonic() > deadline:
+                    sys.exit(f"stub on port {port} did not start")
+                time.sleep(0.2)
+
+
+async def run(args):
+    ports = [args.base_port + i for i in range(4)]
+    stubs = {
+        ports[0]: start_stub(ports[0]),
+        ports[1]: start_stub(ports[1]),
+        ports[2]: start_stub(ports[2], fail_rate=1.0),
+    }  # ports[3]: nothing listening
+    try:
+        wait_ready(ports[:3])
+        pool = LLMPool(
+            [
+                Endpoint(f"http://127.0.0.1:{port}", ChatOllama(model=MODEL, base_url=f"http://127.0.0.1:{port}"),
+                         args.max_concurrency)
+                for port in ports
+            ],
+            model_name=MODEL, cooldown_seconds=2, health_interval_seconds=1,
+        )
+        await pool.start()
+
+        errors, done = Counter(), 0
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def one(index):
+            nonlocal done
+            thread_id = f"thread-{index % args.threads}"
+            async with semaphore:
+                try:
+                    await pool.ainvoke("hello", {"configurable": {"thread_id": thread_id}})
+                except Exception as e:
+                    errors[type(e).__name__] += 1
+                done += 1
+                if done == args.requests // 2:
+                    print(f"killing stub on port {ports[1]}")
+                    stubs[ports[1]].kill()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - started
+
+        # Sequential turns: each thread should stick to the endpoint its id hashes to
+        stable = 0
+        for index in range(args.threads):
+            config = {"configurable": {"thread_id": f"thread-{index}"}}
+            used = []
+            for _ in range(3):
+                before = [e.requests for e in pool.endpoints]
+                await pool.ainvoke("hello", config)
+                used.append(next(i for i, e in enumerate(pool.endpoints) if e.requests > before[i]))
+            stable += len(set(used)) == 1
+        await pool.stop()
+
+        metrics = pool.metrics()
+        print(f"requests={args.requests} errors={dict(errors) or 0} failovers={metrics['failovers']} "
+              f"time={elapsed:.1f}s")
+        for endpoint in metrics["endpoints"]:
+            print(f"  {endpoint['url']:26s} requests={endpoint['requests']:4d} failures={endpoint['failures']:3d} "
+                  f"ejections={endpoint['ejections']:2d} healthy={endpoint['healthy']}")
+        print(f"threads whose sequential turns stayed on one endpoint: {stable}/{args.threads}")
+    finally:
+        for process in stubs.values():
+            process.kill()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLM pool failover check")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=20)
+    parser.add_argument("--max-concurrency", type=int, default=4)
+    parser.add_argument("--base-port", type=int, default=11500)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,80 @@
+"""Check that concurrent turns on one thread, spread over two workers, lose no messages.
+
+Start two workers on the same Redis (two uvicorn processes, so each can be
+addressed directly) and an Ollama stub, then run the check:
+
+    python benchmarks/ollama_stub.py --port 11434 --tokens 50 --delay-ms 5
+    python -m uvicorn main:app --port 8000
+    python -m uvicorn main:app --port 8001
+    python benchmarks/check_multiworker.py --urls http://localhost:8000 http://localhost:8001 --turns 8
+
+All turns are sent at once, alternating between the workers. Every request
+must succeed, and the thread lock must have made turns wait on each other
+(each turn is generated from the history of all turns before it). Both
+workers must then serve the same log with 2 x turns messages. Every question
+must appear exactly once, with its answer right after it. The catalog's
+message count must match.
+"""
+import argparse
+import asyncio
+import sys
+import uuid
+
+import httpx
+
+
+async def turn(client: httpx.AsyncClient, url: str, thread_id: str, question: str) -> int:
+    async with client.stream(
+        "POST", f"{url}/query_stream", json={"question": question, "thread_id": thread_id}
+    ) as response:
+        async for _ in response.aiter_lines():
+            pass
+        return response.status_code
+
+
+async def run(args):
+    thread_id = str(uuid.uuid4())
+    # The thread id in every question keeps the response cache out of the way
+    questions = [f"Question {i} on {thread_id}" for i in range(args.turns)]
+    async with httpx.AsyncClient(timeout=args.timeout) as client:
+        await client.post(f"{args.urls[0]}/init_thread", json={"thread_id": thread_id})
+        before = [(await client.get(f"{url}/metrics/scheduler")).json()["thread_locks"] for url in args.urls]
+        statuses = await asyncio.gather(*(
+            turn(client, args.urls[i % len(args.urls)], thread_id, question) for i, question in enumerate(questions)
+        ))
+
+        logs = [
+            (await client.get(f"{url}/threads/{thread_id}/messages", params={"limit": 200})).json()
+            for url in args.urls
+        ]
+        threads = (await client.get(f"{args.urls[-1]}/threads", params={"limit": 200})).json()["threads"]
+        after = [(await client.get(f"{url}/metrics/scheduler")).json()["thread_locks"] for url in args.urls]
+
+    messages = logs[0]["messages"]
+    asked = [m["content"] for m in messages if m["role"] == "user"]
+    paired = all(
+        messages[i]["role"] == "user" and messages[i + 1]["role"] == "assistant" for i in range(0, len(messages) - 1, 2)
+    )
+    waits = [a["contended"] - b["contended"] for a, b in zip(after, before)]
+    catalog = next((t for t in threads if t["id"] == thread_id), {})
+    checks = {
+        "every turn succeeded": all(status == 200 for status in statuses),
+        "turns serialized by the thread lock": sum(waits) > 0,
+        "no messages lost": logs[0]["total"] == 2 * args.turns and len(messages) == 2 * args.turns,
+        "workers serve the same log": all(log["messages"] == messages for log in logs),
+        "every question once": sorted(asked) == sorted(questions),
+        "answers follow their questions": paired and len(messages) % 2 == 0,
+        "catalog message count": int(catalog.get("message_count", -1)) == 2 * args.turns,
+    }
+    print(f"statuses {statuses}, {len(messages)} messages, lock waits per worker {waits}")
+    for name, ok in checks.items():
+        print(f"{'PASS' if ok else 'FAIL'} {name}")
+    return all(checks.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cross-worker concurrent turns check")
+    parser.add_argument("--urls", nargs="+", default=["http://localhost:8000", "http://localhost:8001"])
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    sys.exit(0 if asyncio.run(run(parser.parse_args())) else 1)
@@ -0,0 +1,90 @@
+"""Concurrent load test for POST /query_stream.
+
+Start the API (against a real Ollama or benchmarks/ollama_stub.py), then:
+
+    python benchmarks/load_query_stream.py --concurrency 32 --requests 256
+
+Reports time-to-first-token and full-stream latency percentiles; the first
+token is the first `token` frame, not a `queue_position` one, and a stream
+that ends with an `error` frame counts as an error. Run it once on the
+previous commit and once on this one to compare p99 before/after.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+import httpx
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def one_turn(client: httpx.AsyncClient, base_url: str, question: str):
+    thread_id = str(uuid.uuid4())
+    await client.post(f"{base_url}/init_thread", json={"thread_id": thread_id})
+
+    started = time.perf_counter()
+    first_token = None
+    async with client.stream(
+        "POST", f"{base_url}/query_stream",
+        json={"question": question, "thread_id": thread_id},
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            frame = json.loads(line[6:])
+            if "error" in frame:
+                raise RuntimeError(frame["error"])
+            if "token" in frame and first_token is None:
+                first_token = time.perf_counter() - started
+    return first_token, time.perf_counter() - started
+
+
+async def run(base_url: str, concurrency: int, total: int, question: str):
+    semaphore = asyncio.Semaphore(concurrency)
+    ttft, latency, errors = [], [], 0
+
+    async with httpx.AsyncClient(timeout=None) as client:
+        async def worker():
+            nonlocal errors
+            async with semaphore:
+                try:
+                    first, full = await one_turn(client, base_url, question)
+                except Exception:
+                    errors += 1
+                    return
+                if first is not None:
+                    ttft.append(first)
+                latency.append(full)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+
+    print(f"requests={total} concurrency={concurrency} errors={errors} wall={elapsed:.2f}s")
+    for name, values in (("ttft", ttft), ("latency", latency)):
+        print(
+            f"{name:8s} p50={percentile(values, 50) * 1000:8.1f}ms "
+            f"p95={percentile(values, 95) * 1000:8.1f}ms "
+            f"p99={percentile(values, 99) * 1000:8.1f}ms "
+            f"mean={statistics.fmean(values) * 1000 if values else float('nan'):8.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test /query_stream")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument("--question", default="What is Retrieval-Augmented Generation (RAG)?")
+    args = parser.parse_args()
+    asyncio.run(run(args.base_url, args.concurrency, args.requests, args.question))
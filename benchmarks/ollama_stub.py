@@ -0,0 +1,117 @@
+"""Minimal stand-in for the Ollama HTTP API, for load tests and benchmarks.
+
+Emulates `/api/chat` (streaming NDJSON and non-streaming), `/api/tags` and
+`/api/version` with a fixed number of tokens at a fixed inter-token delay.
+`--fail-rate` makes that share of chat requests answer HTTP 500.
+`GET /stub/stats` counts the streams that completed and the streams that
+the client abandoned, plus the tokens sent.
+
+    python benchmarks/ollama_stub.py --port 11434 --tokens 200 --delay-ms 5
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timezone
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+app = FastAPI()
+settings = {"tokens": 200, "delay_ms": 5.0, "prompt_eval_ms": 50.0, "fail_rate": 0.0}
+stats = {"streams_started": 0, "streams_completed": 0, "streams_aborted": 0, "tokens_sent": 0}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _final_frame(model: str, prompt_tokens: int, started: float, eval_started: float) -> dict:
+    finished = time.perf_counter()
+    return {
+        "model": model,
+        "created_at": _now(),
+        "message": {"role": "assistant", "content": ""},
+        "done": True,
+        "done_reason": "stop",
+        "total_duration": int((finished - started) * 1e9),
+        "load_duration": 0,
+        "prompt_eval_count": prompt_tokens,
+        "prompt_eval_duration": int((eval_started - started) * 1e9),
+        "eval_count": settings["tokens"],
+        "eval_duration": int((finished - eval_started) * 1e9),
+    }
+
+
+@app.get("/api/tags")
+async def tags():
+    return {"models": [{"name": "llama3.2:latest", "model": "llama3.2:latest"}]}
+
+
+@app.get("/stub/stats")
+async def stub_stats():
+    return stats
+
+
+@app.get("/api/version")
+async def version():
+    return {"version": "stub"}
+
+
+@app.post("/api/chat")
+async def chat(request: Request):
+    body = await request.json()
+    model = body.get("model", "stub")
+    if random.random() < settings["fail_rate"]:
+        return JSONResponse({"error": "stub: injected failure"}, status_code=500)
+    prompt_tokens = sum(len(m.get("content", "")) // 4 for m in body.get("messages", []))
+    started = time.perf_counter()
+
+    async def generate():
+        stats["streams_started"] += 1
+        completed = False
+        try:
+            await asyncio.sleep(settings["prompt_eval_ms"] / 1000)
+            eval_started = time.perf_counter()
+            for i in range(settings["tokens"]):
+                await asyncio.sleep(settings["delay_ms"] / 1000)
+                frame = {
+                    "model": model,
+                    "created_at": _now(),
+                    "message": {"role": "assistant", "content": f"tok{i} "},
+                    "done": False,
+                }
+                yield json.dumps(frame) + "\n"
+                stats["tokens_sent"] += 1
+            yield json.dumps(_final_frame(model, prompt_tokens, started, eval_started)) + "\n"
+            completed = True
+        finally:
+            stats["streams_completed" if completed else "streams_aborted"] += 1
+
+    if body.get("stream", True):
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+    await asyncio.sleep(settings["prompt_eval_ms"] / 1000)
+    eval_started = time.perf_counter()
+    await asyncio.sleep(settings["tokens"] * settings["delay_ms"] / 1000)
+    final = _final_frame(model, prompt_tokens, started, eval_started)
+    final["message"]["content"] = " ".join(f"tok{i}" for i in range(settings["tokens"]))
+    return JSONResponse(final)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ollama API stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--delay-ms", type=float, default=5.0)
+    parser.add_argument("--prompt-eval-ms", type=float, default=50.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    settings.update(
+        tokens=args.tokens, delay_ms=args.delay_ms, prompt_eval_ms=args.prompt_eval_ms, fail_rate=args.fail_rate
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -15,44 +15,102 @@ def init_session_state():
     
     if 'thread_list' not in st.session_state:
         st.session_state.thread_list = []
+        st.session_state.thread_cursor = None  # next page of the thread list, None when all are loaded
     
     if 'show_interview_form' not in st.session_state:
         st.session_state.show_interview_form = False
+    
+    if 'uploaded_files' not in st.session_state:
+        st.session_state.uploaded_files = set()
 
 # API configuration
 API_BASE_URL = "http://localhost:8000"
+MESSAGE_PAGE_SIZE = 50
 
-def get_all_threads():
-    """Fetch all conversation threads from backend"""
+def get_threads_page(cursor=None):
+    """Fetch one page of conversation threads, newest first: (threads, next_cursor)"""
     try:
-        response = requests.get(f"{API_BASE_URL}/threads")
+        response = requests.get(f"{API_BASE_URL}/threads", params={"cursor": cursor} if cursor else {})
         response.raise_for_status()
-        return response.json().get("threads", [])
+        body = response.json()
+        return body.get("threads", []), body.get("next_cursor")
     except Exception as e:
         st.error(f"Failed to load threads: {str(e)}")
-        return []
+        return [], cursor
+
+def refresh_threads():
+    """Reload the first page of the thread list (newest first), keeping older pages already loaded with "Load more" """
+    first_page, cursor = get_threads_page()
+    ids = {thread['id'] for thread in first_page}
+    older = st.session_state.thread_list[len(first_page):]
+    if older and st.session_state.thread_cursor != cursor:
+        st.session_state.thread_list = first_page + [thread for thread in older if thread['id'] not in ids]
+    else:
+        st.session_state.thread_list, st.session_state.thread_cursor = first_page, cursor
 
-def get_thread_messages(thread_id):
-    """Get full conversation history for a thread"""
+def load_more_threads():
+    threads, st.session_state.thread_cursor = get_threads_page(st.session_state.thread_cursor)
+    loaded = {thread['id'] for thread in st.session_state.thread_list}
+    st.session_state.thread_list += [thread for thread in threads if thread['id'] not in loaded]
+
+def format_message(msg):
+    return {
+        'id': msg.get('id'),
+        'role': msg['role'],
+        'content': msg['content'],
+        'timestamp': msg.get('timestamp', datetime.now().timestamp()),
+        'truncated': msg.get('truncated', False)
+    }
+
+def fetch_messages(thread_id, after=None, before=None, etag=None):
+    """One page of a thread's messages: (messages, has_more, etag), or None if unchanged since `etag`"""
+    params = {"limit": MESSAGE_PAGE_SIZE}
+    if after:
+        params["after"] = after
+    if before:
+        params["before"] = before
+    response = requests.get(
+        f"{API_BASE_URL}/threads/{thread_id}/messages",
+        params=params,
+        headers={"If-None-Match": etag} if etag else {}
+    )
+    if response.status_code == 304:
+        return None
+    response.raise_for_status()
+    body = response.json()
+    return [format_message(msg) for msg in body.get("messages", [])], body.get("has_more", False), response.headers.get("ETag")
+
+def load_thread(thread_id, title="New Chat"):
+    """A thread with its latest page of messages; older ones are fetched on demand"""
+    thread = {'id': thread_id, 'title': title, 'messages': [], 'has_earlier': False}
     try:
-        response = requests.get(f"{API_BASE_URL}/conversation/{thread_id}")
-        response.raise_for_status()
-        messages = response.json().get("messages", [])
-        
-        # Convert message format if needed
-        formatted_messages = []
-        for msg in messages:
-            formatted_msg = {
-                'role': msg['role'],
-                'content': msg['content'],
-                'timestamp': msg.get('timestamp', datetime.now().timestamp())
-            }
-            formatted_messages.append(formatted_msg)
-            
-        return formatted_messages
+        thread['messages'], thread['has_earlier'], thread['etag'] = fetch_messages(thread_id)
+    except Exception as e:
+        st.error(f"Failed to load messages: {str(e)}")
+    return thread
+
+def sync_new_messages(thread):
+    """Fetch only the messages added since the last one we have (after each turn)"""
+    synced = [m for m in thread['messages'] if m.get('id')]  # drops local copies of messages just sent
+    after = synced[-1]['id'] if synced else None
+    etag = thread.get('etag')
+    try:
+        while True:
+            page = fetch_messages(thread['id'], after=after, etag=etag)
+            if page is None:
+                break  # nothing new
+            messages, has_more, thread['etag'] = page
+            synced += messages
+            if after is None:
+                thread['has_earlier'] = has_more  # first page of a new thread: the latest messages
+                break
+            if not has_more or not messages:
+                break
+            after, etag = messages[-1]['id'], None
     except Exception as e:
         st.error(f"Failed to load messages: {str(e)}")
-        return []
+        return
+    thread['messages'] = synced
 
 def send_chat_message(thread_id, message):
     """Send message and stream response incrementally"""
@@ -62,15 +120,31 @@ def send_chat_message(thread_id, message):
             json={"question": message, "thread_id": thread_id},
             stream=True
         )
+        if response.status_code == 429:
+            st.warning(f"The assistant is busy, please retry in {response.headers.get('Retry-After', 'a few')} seconds.")
+            return None
+        if response.status_code == 409:
+            st.warning(
+                f"This thread is busy with another answer, please retry in {response.headers.get('Retry-After', 'a few')} seconds."
+            )
+            return None
         response.raise_for_status()
-        
+
         def generate():
+            status = st.empty()
             for line in response.iter_lines():
                 if line:
                     decoded_line = line.decode('utf-8')
                     if decoded_line.startswith('data: '):
                         try:
                             data = json.loads(decoded_line[6:])
+                            if 'queue_position' in data:
+                                status.caption(f"Waiting in queue ({data['queue_position']} ahead)...")
+                                continue
+                            status.empty()
+                            if 'error' in data:
+                                st.error(data['error'])
+                                return
                             yield data.get('token', '')
                         except json.JSONDecodeError:
                             continue
@@ -112,16 +186,32 @@ def update_thread_title(thread_id, title):
         st.error(f"Failed to update title: {str(e)}")
         return False
 
+def upload_document(thread_id, uploaded_file):
+    """Attach a document to the thread; the backend indexes it in the background"""
+    try:
+        response = requests.post(
+            f"{API_BASE_URL}/threads/{thread_id}/documents",
+            files={"file": (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)}
+        )
+        if response.status_code == 409:
+            st.warning(f"This thread is busy, please retry in {response.headers.get('Retry-After', 'a few')} seconds.")
+            return False
+        response.raise_for_status()
+        return True
+    except Exception as e:
+        st.error(f"Failed to upload document: {str(e)}")
+        return False
+
 # Initialize session
 init_session_state()
 
 # Load initial data if needed
 if not st.session_state.thread_list:
-    st.session_state.thread_list = get_all_threads()
+    refresh_threads()
 
 if not st.session_state.current_thread['messages']:
-    st.session_state.current_thread['messages'] = get_thread_messages(
-        st.session_state.current_thread['id']
+    st.session_state.current_thread = load_thread(
+        st.session_state.current_thread['id'], st.session_state.current_thread.get('title', "New Chat")
     )
 
 # Dark Theme CSS
@@ -168,7 +258,7 @@ with st.sidebar:
         new_thread = create_new_thread()
         if new_thread:
             st.session_state.current_thread = new_thread
-            st.session_state.thread_list = get_all_threads()
+            refresh_threads()
             st.rerun()
     
     st.divider()
@@ -183,12 +273,11 @@ with st.sidebar:
             use_container_width=True,
             help=f"Last updated: {datetime.fromtimestamp(thread['timestamp']).strftime('%Y-%m-%d %H:%M') if thread.get('timestamp') else 'N/A'}"
         ):
-            st.session_state.current_thread = {
-                'id': thread['id'],
-                'title': title,
-                'messages': get_thread_messages(thread['id'])
-            }
+            st.session_state.current_thread = load_thread(thread['id'], title)
             st.rerun()
+    if st.session_state.thread_cursor and st.button("Load more", use_container_width=True):
+        load_more_threads()
+        st.rerun()
     
     st.divider()
     
@@ -200,19 +289,35 @@ with st.sidebar:
     )
     
     if uploaded_file:
-        st.session_state.current_thread['messages'].append({
-            'role': 'user',
-            'content': f"Uploaded file: {uploaded_file.name}",
-            'timestamp': datetime.now().timestamp()
-        })
+        # Streamlit reruns the script on every interaction; upload each file once per thread
+        upload_key = (st.session_state.current_thread['id'], uploaded_file.name, uploaded_file.size)
+        if upload_key not in st.session_state.uploaded_files:
+            if upload_document(st.session_state.current_thread['id'], uploaded_file):
+                st.session_state.uploaded_files.add(upload_key)
+                st.success(f"Indexing {uploaded_file.name}...")
 
 # Main chat interface
 st.title(st.session_state.current_thread.get('title', 'New Chat'))
 
+# Scrollback: older messages are fetched a page at a time
+if st.session_state.current_thread.get('has_earlier'):
+    if st.button("Load earlier messages"):
+        thread = st.session_state.current_thread
+        try:
+            page = fetch_messages(thread['id'], before=thread['messages'][0]['id'])
+            if page is not None:
+                messages, thread['has_earlier'], _ = page
+                thread['messages'] = messages + thread['messages']
+        except Exception as e:
+            st.error(f"Failed to load messages: {str(e)}")
+        st.rerun()
+
 # Display messages
 for msg in st.session_state.current_thread['messages']:
     with st.chat_message(msg['role'], avatar="🧑" if msg['role'] == 'user' else "🤖"):
         st.markdown(msg['content'])
+        if msg.get('truncated'):
+            st.caption("Answer interrupted: the connection was closed while it was generated.")
         if msg.get('timestamp'):
             st.caption(datetime.fromtimestamp(msg['timestamp']).strftime('%Y-%m-%d %H:%M'))
 
@@ -243,10 +348,6 @@ if prompt := st.chat_input("Type your message..."):
         update_thread_title(st.session_state.current_thread['id'], prompt[:30])
     
     # Refresh data
-    st.session_state.current_thread['messages'] = get_thread_messages(st.session_state.current_thread['id'])
-    st.session_state.thread_list = sorted(
-        get_all_threads(),
-        key=lambda x: x.get('timestamp', 0),  # Fallback to 0 if no timestamp
-        reverse=True  # Newest first
-    )
+    sync_new_messages(st.session_state.current_thread)
+    refresh_threads()  # one page: the thread just updated is now first
     st.rerun()
\ No newline at end of file
@@ -0,0 +1,41 @@
+# Multi-worker deployment: gunicorn -c gunicorn.conf.py main:app
+#
+# Every worker is a separate uvicorn process that builds its own graph, LLM
+# clients and Redis connection pool in the app's lifespan handler. Thread
+# state (message log, checkpoints, catalog) lives in Redis, and turns on one
+# thread take a per-thread Redis lock, so requests for a thread can land on
+# any worker, also across machines pointing at the same Redis.
+#
+# Per worker, not shared: the generation scheduler (divide scheduler.slots by
+# the number of workers), the response cache (both tiers), and the LLM pool's
+# endpoint health and concurrency caps.
+#
+# Ingestion: jobs go through the Redis queue (ingest.backend "redis", or
+# "auto" with Redis up) and run in whichever worker holds the ingest consumer
+# lease, so the document manifest and BM25 file under rag.index_dir have a
+# single writer; the other workers reload it when the consumer announces a job.
+# Workers must therefore share index_dir and upload_dir (one machine, or a
+# shared volume). Use rag.vector_store "qdrant": the other workers never
+# reload the "local" vector index, so they would not see new documents.
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Load the app in each worker, after the fork: nothing is built at import time,
+# and sockets, event loops and models are never shared between processes
+preload_app = False
+
+# Responses stream for as long as a generation runs (plus its queue wait); the
+# worker heartbeat is independent of request duration, so this only catches hung workers
+timeout = 120
+# On shutdown, give in-flight turns time to finish writing before the worker is killed
+graceful_timeout = 60
+keepalive = 5
+
+# Restart workers now and then, staggered, to bound memory growth of the in-process caches
+max_requests = int(os.getenv("MAX_REQUESTS", "2000"))
+max_requests_jitter = 200
+
+accesslog = "-"
@@ -1,23 +1,122 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request, Response, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, List
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-import redis
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, AIMessageChunk, RemoveMessage
+import redis.asyncio as aioredis
 import json
+import os
+import re
+import shutil
 import traceback
 from datetime import datetime
 from dotenv import load_dotenv
 from backend.workflow_pipeline import GraphBuilder
-from langgraph.checkpoint.redis import RedisSaver
-from langgraph.store.redis import RedisStore
-from fastapi.responses import StreamingResponse
+from backend.thread_catalog import ThreadCatalog, DEFAULT_PAGE_SIZE
+from backend.codec import CompactSerializer
+from backend.message_log import MessageLog, DEFAULT_PAGE_SIZE as MESSAGE_PAGE_SIZE
+from backend.retention import CheckpointRetention
+from backend.streaming import (
+    ClientDisconnected, DisconnectPolicy, FlushPolicy, coalesce_tokens, detach, sse_frame, until_disconnected
+)
+from backend.rag.rag import SUPPORTED_EXTENSIONS
+from backend.ingest_queue import IngestQueue
+from backend.llm_pool import LLMPool
+from backend.scheduler import GenerationScheduler, QueueFull
+from backend.thread_lock import ThreadBusy, ThreadLocks
+from langgraph.checkpoint.redis.aio import AsyncRedisSaver
+from langgraph.store.redis.aio import AsyncRedisStore
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 import asyncio
+import logging
 import uuid
 
 load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Redis Setup
+REDIS_URI = os.getenv("REDIS_URI", "redis://localhost:6379")  # shared by every worker and node
+REDIS_MAX_CONNECTIONS = 50
+
+async def setup_redis():
+    """Build this worker's graph, stores and connection pool; all thread state lives in Redis"""
+    pool = aioredis.ConnectionPool.from_url(REDIS_URI, max_connections=REDIS_MAX_CONNECTIONS)
+    redis_client = aioredis.Redis(connection_pool=pool)
+
+    checkpointer = AsyncRedisSaver(redis_client=redis_client)
+    # Chat messages in checkpoints are written compactly (still JSON, as RedisJSON requires)
+    checkpointer.serde = CompactSerializer()
+    await checkpointer.asetup()
+    store = AsyncRedisStore(redis_client=redis_client)
+    await store.setup()
+
+    # Thread history and metadata; checkpoints only point into the log
+    message_log = MessageLog(redis_client)
+    builder = GraphBuilder(streaming=True)
+    compiled_graph = builder(checkpointer=checkpointer, store=store, message_log=message_log)
+    config = builder.model_loader.config.config
+    thread_locks = ThreadLocks.from_config(config, redis_client)
+    scheduler = GenerationScheduler.from_config(config)
+    builder.context.scheduler = scheduler  # summary refreshes wait for a generation slot too
+    return {
+        'graph': compiled_graph,
+        'builder': builder,
+        'redis': redis_client,
+        'message_log': message_log,
+        'catalog': ThreadCatalog(redis_client),
+        'flush_policy': FlushPolicy.from_config(config),
+        'disconnect_policy': DisconnectPolicy.from_config(config),
+        'scheduler': scheduler,
+        'thread_locks': thread_locks,
+        'retention': (
+            CheckpointRetention.from_config(
+                config, checkpointer, message_log, ThreadCatalog(redis_client), thread_locks
+            )
+            if config.get('retention', {}).get('enabled', True) else None
+        ),
+        'ingest': await IngestQueue.from_config(config, builder.rag, redis_client) if builder.rag else None
+    }
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Built per worker process (gunicorn forks before the app starts), never at import time:
+    # the checkpointer, store, message log and catalog share this worker's one async connection pool
+    chatbot = app.state.chatbot = await setup_redis()
+    cache = chatbot['builder'].response_cache
+    if cache is not None and cache.embeddings is not None:
+        # Load the embedding model before the first request needs it
+        await asyncio.to_thread(cache.embeddings.warm)
+    rag = chatbot['builder'].rag
+    if rag is not None and rag.retriever.reranker is not None:
+        # Same for the cross-encoder, whose budget_ms only covers scoring
+        await asyncio.to_thread(rag.retriever.reranker.warm)
+    if chatbot['ingest'] is not None:
+        chatbot['ingest'].start()
+    llm = chatbot['builder'].llm
+    if isinstance(llm, LLMPool):
+        # Health-check the Ollama endpoints in the background
+        await llm.start()
+    if chatbot['retention'] is not None:
+        # Compact old checkpoints and expire idle threads in the background
+        chatbot['retention'].start()
+    try:
+        yield
+    finally:
+        if chatbot['retention'] is not None:
+            await chatbot['retention'].stop()
+        if isinstance(llm, LLMPool):
+            await llm.stop()
+        if chatbot['ingest'] is not None:
+            await chatbot['ingest'].stop()
+            await asyncio.to_thread(chatbot['builder'].rag.close)
+        await chatbot['redis'].aclose()
+        await chatbot['redis'].connection_pool.disconnect()
+        chatbot.clear()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -36,61 +135,58 @@ class ThreadRequest(BaseModel):
     thread_id: str
     title: Optional[str] = None
 
+class ThreadCacheRequest(BaseModel):
+    thread_id: str
+    enabled: bool
+
+class IngestRequest(BaseModel):
+    paths: List[str]
+    thread_id: Optional[str] = None
+
 class MessageResponse(BaseModel):
     role: str
     content: str
     timestamp: Optional[float]
 
-# Redis Setup
-REDIS_URI = "redis://localhost:6379"
-
-def setup_redis():
-    with RedisSaver.from_conn_string(REDIS_URI) as checkpointer:
-        checkpointer.setup()
-        with RedisStore.from_conn_string(REDIS_URI) as store:
-            store.setup()
-            builder = GraphBuilder(streaming=True)
-            compiled_graph = builder(checkpointer=checkpointer, store=store)
-            return {
-                    'graph': compiled_graph,
-                    'builder': builder
-                }
-
-chatbot = setup_redis()
-
 # Helper Functions
-def generate_thread_title(messages: List) -> str:
-    """Generate title from first user message"""
-    for msg in messages:
-        if isinstance(msg, HumanMessage) and msg.content.strip():
-            return msg.content[:30] + ("..." if len(msg.content) > 30 else "")
-    return "New Chat"
+def get_chatbot(request: Request) -> dict:
+    """This worker's graph, stores and policies, as built by the lifespan handler"""
+    return request.app.state.chatbot
 
 def serialize_message(msg) -> dict:
     """Convert message to API response format"""
-    return {
+    serialized = {
+        "id": msg.id,
         "role": "user" if isinstance(msg, HumanMessage) else "assistant",
         "content": msg.content,
         "timestamp": getattr(msg, "timestamp", None)
     }
+    if (getattr(msg, "response_metadata", None) or {}).get("truncated"):
+        serialized["truncated"] = True  # the client disconnected while this answer streamed
+    return serialized
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True when the client's cached copy (If-None-Match) is still current"""
+    return etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
 
 # API Endpoints
 @app.post("/init_thread")
-async def init_thread(request: ThreadRequest):
+async def init_thread(request: ThreadRequest, chatbot: dict = Depends(get_chatbot)):
     try:
-        initial_state = {
-            "messages": [SystemMessage(content=chatbot['builder'].system_prompt)],
-            "metadata": {
-                "created_at": datetime.now().timestamp(),
-                "updated_at": datetime.now().timestamp(),
-                "title": "New Chat"  # Default title
-            }
+        metadata = {
+            "created_at": datetime.now().timestamp(),
+            "updated_at": datetime.now().timestamp(),
+            "title": "New Chat"  # Default title
         }
         
-        # Save to Redis
-        chatbot['graph'].update_state(
-            config={'configurable': {'thread_id': request.thread_id}},
-            values=initial_state
+        # Save to Redis; the message log starts out empty
+        await chatbot['message_log'].update_metadata(request.thread_id, metadata)
+        await chatbot['catalog'].upsert(
+            request.thread_id,
+            title=metadata['title'],
+            created_at=metadata['created_at'],
+            updated_at=metadata['updated_at'],
+            message_count=0
         )
         return {"status": "success", "thread_id": request.thread_id}
     except Exception as e:
@@ -98,166 +194,446 @@ async def init_thread(request: ThreadRequest):
     
 
 @app.get("/threads")
-async def get_threads():
-    """List all conversation threads"""
+async def get_threads(
+    cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE, chatbot: dict = Depends(get_chatbot)
+):
+    """List conversation threads, newest first, one page at a time"""
     try:
-        threads = []
-        r = redis.Redis.from_url(REDIS_URI)
-        
-        # Get all thread IDs
-        seen_threads = set()
-        for key in r.scan_iter("checkpoint:*:__empty__:*"):
-            thread_id = key.decode().split(':')[1]
-            if thread_id in seen_threads:
-                continue
-            seen_threads.add(thread_id)
-            
-            state = chatbot['graph'].get_state(
-                config={'configurable': {'thread_id': thread_id}}
-            )
-            
-            threads.append({
-                'id': str(thread_id),
-                'title': str(state.values.get('metadata', {}).get('title', "New Chat")),
-                'timestamp': float(state.values.get('metadata', {}).get('updated_at', datetime.now().timestamp())), 
-                'message_count': len([m for m in state.values.get('messages', []) 
-                                   if not isinstance(m, SystemMessage)])
-            })
-        
-        return {"threads": sorted(threads, key=lambda x: x['timestamp'], reverse=True)}
+        threads, next_cursor = await chatbot['catalog'].page(cursor=cursor, limit=limit)
+        return ORJSONResponse({"threads": threads, "next_cursor": next_cursor})
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/threads/{thread_id}/full")
-async def get_full_thread(thread_id: str):
+async def get_full_thread(thread_id: str, request: Request, chatbot: dict = Depends(get_chatbot)):
     """Get complete conversation history"""
     try:
-        state = chatbot['graph'].get_state(
-            config={'configurable': {'thread_id': thread_id}}
-        )
+        etag = await chatbot['message_log'].etag(thread_id)
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
         messages = [
             serialize_message(msg) 
-            for msg in state.values.get('messages', [])
+            for msg in await chatbot['message_log'].read(thread_id)
             if not isinstance(msg, SystemMessage)
         ]
-        return {"messages": messages}
+        return ORJSONResponse({"messages": messages}, headers={"ETag": etag})
     except Exception as e:
         raise HTTPException(status_code=404, detail="Thread not found")
 
-# In main.py
-
-def setup_redis():
-    with RedisSaver.from_conn_string(REDIS_URI) as checkpointer:
-        checkpointer.setup()
-        with RedisStore.from_conn_string(REDIS_URI) as store:
-            store.setup()
-            builder = GraphBuilder(streaming=True)
-            # Store both the builder and compiled graph
-            compiled_graph = builder(checkpointer=checkpointer, store=store)
-            return {
-                'graph': compiled_graph,
-                'builder': builder  # Keep reference to the builder
-            }
-
-# Then modify your streaming endpoint:
+@app.get("/threads/{thread_id}/messages")
+async def get_thread_messages(
+    thread_id: str,
+    request: Request,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = MESSAGE_PAGE_SIZE,
+    chatbot: dict = Depends(get_chatbot)
+):
+    """A page of messages: those after message `after`, before message `before` (scrollback), or the latest"""
+    if after is not None and before is not None:
+        raise HTTPException(status_code=400, detail="Use either after or before, not both")
+    try:
+        # Unchanged thread: one round trip and a 304, nothing read or serialized
+        etag = await chatbot['message_log'].etag(thread_id)
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        messages, has_more, total = await chatbot['message_log'].page(
+            thread_id, after=after, before=before, limit=limit
+        )
+        return ORJSONResponse({
+            "messages": [serialize_message(msg) for msg in messages if not isinstance(msg, SystemMessage)],
+            "has_more": has_more,
+            "total": total
+        }, headers={"ETag": etag})
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Message not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/query_stream")
-async def query_chatbot_stream(query: QueryRequest):
+async def query_chatbot_stream(query: QueryRequest, request: Request, chatbot: dict = Depends(get_chatbot)):
     """Handle chat message and stream response"""
     try:
-        state = chatbot['graph'].get_state(
-            config={'configurable': {'thread_id': query.thread_id}}
-        )
-        messages = state.values.get('messages', [])
-        metadata = state.values.get('metadata', {})
+        config = {'configurable': {'thread_id': query.thread_id}}
         
         # Add user message with timestamp
         user_msg = HumanMessage(
+            id=str(uuid.uuid4()),  # lets an aborted turn be found and removed again
             content=query.question,
             timestamp=datetime.now().timestamp()
         )
-        
+        parts = []  # the answer as streamed to the client
+        graph_started, graph_closed = asyncio.Event(), asyncio.Event()  # closed: the run has fully unwound
+        body_started, aborted = asyncio.Event(), asyncio.Event()
+
+        # One turn per thread at a time, across all workers; held until the turn is fully written
+        try:
+            turn_lock = await chatbot['thread_locks'].acquire(query.thread_id)
+        except ThreadBusy as e:
+            raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+        try:
+            # Only first turns are answered from the response cache: later answers depend on history
+            cache = chatbot['builder'].response_cache
+            use_cache = False
+            if cache is not None:
+                summary = await chatbot['catalog'].get(query.thread_id)
+                use_cache = (
+                    summary.get('response_cache', '1') != '0'
+                    and int(summary.get('message_count', 0)) == 0
+                    and int(summary.get('documents', 0)) == 0  # answers grounded in attached documents
+                )
+
+            lookup = await cache.lookup(query.question) if use_cache else None
+            cache_hit = lookup is not None and lookup.answer is not None
+
+            # Generations wait for a slot; refuse up front when the queue is full
+            scheduler = chatbot['scheduler']
+            ticket = None
+            if not cache_hit:
+                try:
+                    ticket = scheduler.enqueue(
+                        scheduler.client_key(request.headers, request.client.host if request.client else None)
+                    )
+                except QueueFull as e:
+                    raise HTTPException(
+                        status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)}
+                    )
+        except BaseException:
+            await turn_lock.release()
+            raise
+
+        async def cached_tokens(answer: str):
+            # Replay a cached answer word by word so it streams like a generated one
+            for piece in re.findall(r"\s*\S+\s*", answer):
+                yield piece
+
+        async def graph_tokens():
+            # chat_node appends user_msg and the reply to the message log and,
+            # with durability="exit", a single pointer-only checkpoint is written
+            # (also when the run is cancelled: then it holds only user_msg)
+            graph_started.set()
+            try:
+                async for chunk, chunk_meta in chatbot['graph'].astream(
+                    {'messages': [user_msg]},
+                    config=config,
+                    stream_mode="messages",
+                    durability="exit"
+                ):
+                    if chunk_meta.get('langgraph_node') == "chat_node" and isinstance(chunk, AIMessageChunk):
+                        yield chunk.content
+            finally:
+                graph_closed.set()
+
+        disconnect_policy = chatbot['disconnect_policy']
+
+        streams = []
+
+        def watched(stream):
+            # Stops (and closes) `stream` as soon as the client goes away
+            stream = until_disconnected(stream, request.is_disconnected, disconnect_policy.poll_interval_ms)
+            streams.append(stream)
+            return stream
+
+        async def abandon(keep_partial: bool):
+            """Close the aborted streams, then keep what the client already received, marked as truncated"""
+            for stream in streams:
+                await stream.aclose()
+            if not graph_started.is_set():
+                return  # disconnected while queued: nothing was written
+            # The cancelled run writes its checkpoint while unwinding; ours must come after it
+            await graph_closed.wait()
+            try:
+                # chat_node may have appended the whole turn before the disconnect reached the graph
+                await chatbot['message_log'].position(query.thread_id, user_msg.id)
+                written = True
+            except KeyError:
+                written = False
+            if written or not keep_partial or not parts:
+                state = await chatbot['graph'].aget_state(config=config)
+                if any(m.id == user_msg.id for m in state.values.get('messages', [])):
+                    await chatbot['graph'].aupdate_state(
+                        config=config, values={'messages': [RemoveMessage(id=user_msg.id)]}, as_node="chat_node"
+                    )
+                if written:
+                    # Counted once here, since the stream never reached its own catalog update
+                    metadata = await chatbot['message_log'].get_metadata(query.thread_id)
+                    await chatbot['catalog'].upsert(
+                        query.thread_id,
+                        title=metadata.get('title'),
+                        updated_at=metadata.get('updated_at'),
+                        message_delta=2
+                    )
+                return
+            assistant_msg = AIMessage(
+                content="".join(parts),
+                timestamp=datetime.now().timestamp(),
+                response_metadata={'truncated': True}
+            )
+            update = await chatbot['builder'].arecord_turn(chatbot['graph'], config, user_msg, assistant_msg)
+            await chatbot['catalog'].upsert(
+                query.thread_id,
+                title=update['metadata'].get('title'),
+                updated_at=update['metadata'].get('updated_at'),
+                message_delta=2
+            )
+
+        async def abandon_turn(keep_partial: bool):
+            """The thread stays locked until the aborted turn's checkpoint is written"""
+            try:
+                await abandon(keep_partial)
+            finally:
+                await turn_lock.release()
+
+        async def release_turn():
+            """Frees the slot, and the thread lock if the body never started (client gone before the first byte)"""
+            if ticket is not None:
+                scheduler.release(ticket)
+            if not body_started.is_set():
+                await turn_lock.release()
+
         async def event_generator():
-            full_response = ""
-            message_placeholder = None  # For frontend rendering
+            body_started.set()
+            try:
+                if ticket is not None:
+                    try:
+                        # Tell the client where it stands while it waits for a slot
+                        async for position in watched(scheduler.wait(ticket)):
+                            yield sse_frame({'queue_position': position})
+
+                        tokens = graph_tokens()
+                        # Stream the response, coalescing tokens into fewer SSE frames
+                        async for text in watched(coalesce_tokens(tokens, chatbot['flush_policy'])):
+                            parts.append(text)
+                            yield sse_frame({'token': text})
+                    except (ClientDisconnected, GeneratorExit, asyncio.CancelledError) as e:
+                        # Generation was aborted; free the slot before touching the checkpoint
+                        scheduler.release(ticket)
+                        logger.info("Client of thread %s disconnected, generation aborted", query.thread_id)
+                        # Starlette may be cancelling this task: finish in a task of its own
+                        aborted.set()
+                        await asyncio.shield(detach(abandon_turn(disconnect_policy.on_disconnect == "truncate")))
+                        if not isinstance(e, ClientDisconnected):
+                            raise
+                        return
+                    except Exception as e:
+                        # The LLM or the graph failed: durability="exit" left user_msg in the checkpoint,
+                        # where the next turn would pick it up; drop it and tell the client
+                        scheduler.release(ticket)
+                        logger.error("Generation for thread %s failed: %s", query.thread_id, str(e))
+                        aborted.set()
+                        await asyncio.shield(detach(abandon_turn(False)))
+                        yield sse_frame({'error': "The assistant failed to answer, please retry"})
+                        return
+                    finally:
+                        scheduler.release(ticket)
+                else:
+                    async for text in coalesce_tokens(cached_tokens(lookup.answer), chatbot['flush_policy']):
+                        yield sse_frame({'token': text})
             
-            # Stream response token by token
-            async for chunk in chatbot['builder'].model_loader.llm.astream(
-                [SystemMessage(content=chatbot['builder'].system_prompt)] +
-                [msg for msg in messages if not isinstance(msg, SystemMessage)] +
-                [user_msg]
-            ):
-                if hasattr(chunk, 'content'):
-                    content = chunk.content
-                    full_response += content
-                    yield f"data: {json.dumps({'token': content})}\n\n"  # Send as JSON
-                    await asyncio.sleep(0.01)  # Small delay to avoid flooding
+                if cache_hit:
+                    assistant_msg = AIMessage(
+                        content=lookup.answer,
+                        timestamp=datetime.now().timestamp(),
+                        response_metadata={'cache': lookup.tier}
+                    )
+                    update = await chatbot['builder'].arecord_turn(chatbot['graph'], config, user_msg, assistant_msg)
+                    metadata = update['metadata']
+                else:
+                    metadata = await chatbot['message_log'].get_metadata(query.thread_id)
+                    if lookup is not None and parts:
+                        await cache.store(query.question, "".join(parts), lookup.embedding)
             
-            # After streaming completes, save the full response
-            if full_response:
-                assistant_msg = AIMessage(
-                    content=full_response,
-                    timestamp=datetime.now().timestamp()
+                await chatbot['catalog'].upsert(
+                    query.thread_id,
+                    title=metadata.get('title'),
+                    updated_at=metadata.get('updated_at'),
+                    message_delta=2
                 )
-                
-                # Update thread title if first message
-                if len([m for m in messages if not isinstance(m, SystemMessage)]) == 0:
-                    metadata['title'] = generate_thread_title([user_msg])
-                
-                metadata['updated_at'] = datetime.now().timestamp()
-                
-                chatbot['graph'].update_state(
-                    config={'configurable': {'thread_id': query.thread_id}},
-                    values={
-                        'messages': messages + [user_msg, assistant_msg],
-                        'metadata': metadata
-                    }
-                )
-        
+            finally:
+                # The turn is written (an aborted one unlocks in abandon_turn): the next turn may start
+                if not aborted.is_set():
+                    await asyncio.shield(detach(turn_lock.release()))
+
         return StreamingResponse(
             event_generator(),
-            media_type="text/event-stream"
+            media_type="text/event-stream",
+            background=BackgroundTask(release_turn)
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
     
     
 @app.put("/thread_title")
-async def update_thread_title(request: ThreadRequest):
+async def update_thread_title(request: ThreadRequest, chatbot: dict = Depends(get_chatbot)):
     """Update thread title"""
     try:
-        state = chatbot['graph'].get_state(
-            config={'configurable': {'thread_id': request.thread_id}}
-        )
-        metadata = state.values.get('metadata', {})
-        metadata.update({
-            'title': request.title or metadata.get('title', "New Chat"),
-            'updated_at': datetime.now().timestamp() 
-        })
-        
-        chatbot['graph'].update_state(
-            config={'configurable': {'thread_id': request.thread_id}},
-            values={'metadata': metadata}
+        title = request.title
+        if not title:
+            title = (await chatbot['message_log'].get_metadata(request.thread_id)).get('title', "New Chat")
+        # Two hash fields, no checkpoint write
+        changes = {'title': title, 'updated_at': datetime.now().timestamp()}
+        await chatbot['message_log'].update_metadata(request.thread_id, changes)
+        await chatbot['catalog'].upsert(
+            request.thread_id,
+            title=changes['title'],
+            updated_at=changes['updated_at']
         )
         return {"status": "success"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/conversation/{thread_id}")
-async def get_conversation(thread_id: str):
+async def get_conversation(thread_id: str, request: Request, chatbot: dict = Depends(get_chatbot)):
     """Get conversation history (legacy endpoint)"""
     try:
-        state = chatbot['graph'].get_state(
-            config={'configurable': {'thread_id': thread_id}}
-        )
+        etag = await chatbot['message_log'].etag(thread_id)
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
         messages = [
             serialize_message(msg)
-            for msg in state.values.get('messages', [])
+            for msg in await chatbot['message_log'].read(thread_id)
             if not isinstance(msg, SystemMessage)
         ]
-        return {"messages": messages}
+        return ORJSONResponse({"messages": messages}, headers={"ETag": etag})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+@app.put("/thread_cache")
+async def update_thread_cache(request: ThreadCacheRequest, chatbot: dict = Depends(get_chatbot)):
+    """Opt a thread in or out of the response cache"""
+    try:
+        await chatbot['catalog'].set_field(request.thread_id, 'response_cache', int(request.enabled))
+        return {"status": "success"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/threads/{thread_id}/documents", status_code=202)
+async def upload_document(thread_id: str, file: UploadFile = File(...), chatbot: dict = Depends(get_chatbot)):
+    """Attach a document to a thread; it is indexed by a background ingestion job"""
+    rag = chatbot['builder'].rag
+    if rag is None:
+        raise HTTPException(status_code=503, detail="Document ingestion is disabled")
+    filename = os.path.basename(file.filename or "")
+    if not filename.lower().endswith(SUPPORTED_EXTENSIONS):
+        raise HTTPException(status_code=415, detail=f"Unsupported file type: {filename}")
+    # Each thread's uploads go in its own directory right under upload_dir, never anywhere else
+    upload_root = os.path.realpath(rag.settings.get("upload_dir", "data/uploads"))
+    upload_dir = os.path.realpath(os.path.join(upload_root, thread_id))
+    if os.path.dirname(upload_dir) != upload_root:
+        raise HTTPException(status_code=400, detail=f"Invalid thread id: {thread_id}")
+    if not await chatbot['catalog'].get(thread_id):
+        raise HTTPException(status_code=404, detail=f"Thread not found: {thread_id}")
+    try:
+        path = os.path.join(upload_dir, filename)
+
+        def save():
+            os.makedirs(upload_dir, exist_ok=True)
+            with open(path, "wb") as out:
+                shutil.copyfileobj(file.file, out)
+        await asyncio.to_thread(save)
+
+        # Record the attachment so the retrieval node searches this thread's documents;
+        # under the thread lock, so concurrent uploads (on any worker) don't drop each other's
+        async with chatbot['thread_locks'].hold(thread_id):
+            metadata = await chatbot['message_log'].get_metadata(thread_id)
+            documents = [d for d in metadata.get('documents', []) if d != filename] + [filename]
+            await chatbot['message_log'].update_metadata(thread_id, {'documents': documents})
+            await chatbot['catalog'].set_field(thread_id, 'documents', len(documents))
+
+        # Chunks carry thread_id so retrieval can filter on it at the index level
+        job = await chatbot['ingest'].submit([path], {"thread_id": thread_id})
+        return {"status": "accepted", "thread_id": thread_id, "document": filename, "job_id": job.job_id}
+    except ThreadBusy as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/ingest", status_code=202)
+async def submit_ingest(request: IngestRequest, chatbot: dict = Depends(get_chatbot)):
+    """Queue server-side files or directories for ingestion"""
+    if chatbot['ingest'] is None:
+        raise HTTPException(status_code=503, detail="Document ingestion is disabled")
+    allowed_roots = [
+        os.path.realpath(root)
+        for root in chatbot['builder'].model_loader.config.config.get("ingest", {}).get("allowed_roots", ["data"])
+    ]
+    for path in request.paths:
+        real = os.path.realpath(path)
+        if not any(real == root or real.startswith(root + os.sep) for root in allowed_roots):
+            raise HTTPException(status_code=403, detail=f"Path is outside ingest.allowed_roots: {path}")
+    try:
+        payload = {"thread_id": request.thread_id} if request.thread_id else None
+        job = await chatbot['ingest'].submit(request.paths, payload)
+        return {"status": "accepted", "job_id": job.job_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/ingest/{job_id}")
+async def get_ingest_job(job_id: str, chatbot: dict = Depends(get_chatbot)):
+    """Status, attempts and progress of an ingestion job"""
+    job = await chatbot['ingest'].get(job_id) if chatbot['ingest'] is not None else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return asdict(job)
+
+@app.get("/ingest/{job_id}/events")
+async def stream_ingest_job(job_id: str, chatbot: dict = Depends(get_chatbot)):
+    """Stream job progress (pages parsed, chunks embedded, vectors written) until it finishes"""
+    job = await chatbot['ingest'].get(job_id) if chatbot['ingest'] is not None else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_generator():
+        async for job in chatbot['ingest'].events(job_id):
+            yield sse_frame({
+                'job_id': job.job_id,
+                'status': job.status,
+                'attempts': job.attempts,
+                'progress': job.progress,
+                'error': job.error
+            })
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+@app.get("/cache/stats")
+async def get_cache_stats(chatbot: dict = Depends(get_chatbot)):
+    """Response cache hit/miss metrics"""
+    cache = chatbot['builder'].response_cache
+    return cache.metrics() if cache is not None else {"enabled": False}
+
+@app.get("/metrics/embeddings")
+async def get_embedding_metrics(chatbot: dict = Depends(get_chatbot)):
+    """Embedding batch-size and latency histograms"""
+    cache = chatbot['builder'].response_cache
+    if cache is None or cache.embeddings is None:
+        return {"enabled": False}
+    return cache.embeddings.metrics()
+
+@app.get("/metrics/scheduler")
+async def get_scheduler_metrics(chatbot: dict = Depends(get_chatbot)):
+    """Generation slots, queue depth, and queue wait vs. generation time (this worker), plus thread lock waits"""
+    return {**chatbot['scheduler'].metrics(), "thread_locks": chatbot['thread_locks'].metrics()}
+
+@app.get("/metrics/retention")
+async def get_retention_metrics(chatbot: dict = Depends(get_chatbot)):
+    """Checkpoint compaction and idle-thread expiry metrics"""
+    retention = chatbot['retention']
+    return retention.metrics() if retention is not None else {"enabled": False}
+
+@app.get("/metrics/llm")
+async def get_llm_metrics(chatbot: dict = Depends(get_chatbot)):
+    """Per-turn prompt-eval vs. generation time and prompt tokens actually evaluated, plus endpoint pool state"""
+    builder = chatbot['builder']
+    metrics = builder.llm_metrics.snapshot()
+    if isinstance(builder.llm, LLMPool):
+        metrics["pool"] = builder.llm.metrics()
+    return metrics
     
 # python -m uvicorn main:app --reload
\ No newline at end of file